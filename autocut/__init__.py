@@ -1,7 +1,19 @@
 __version__ = "1.1.0"
 
 from .type import LANG, WhisperModel, WhisperMode
-from .utils import load_audio
-from .package_transcribe import Transcribe
 
 __all__ = ["Transcribe", "load_audio", "WhisperMode", "WhisperModel", "LANG"]
+
+
+def __getattr__(name):
+    # Import on first use, Transcribe pulls in torch, which the CLI only needs
+    # to transcribe
+    if name == "Transcribe":
+        from .package_transcribe import Transcribe
+
+        return Transcribe
+    if name == "load_audio":
+        from .utils import load_audio
+
+        return load_audio
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,82 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+from typing import Any, List, Union
+
+import numpy as np
+
+
+class TranscribeCache:
+    """An on-disk cache of the raw transcribe results that gen_srt consumes.
+
+    Entries are keyed by the decoded audio and the options that affect the
+    results, so a renamed or copied file still hits the cache. The least
+    recently used entries are evicted once the cache exceeds max_size bytes.
+    """
+
+    def __init__(self, cache_dir: str, max_size: int = 2**30):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, audio: np.ndarray, **options) -> str:
+        h = hashlib.sha256(json.dumps(options, sort_keys=True).encode())
+        block = 2**20
+        for i in range(0, len(audio), block):
+            h.update(np.ascontiguousarray(audio[i : i + block], dtype=np.float32))
+        return h.hexdigest()
+
+    def get(self, key: str) -> Union[List[Any], None]:
+        fn = self._filename(key)
+        try:
+            with open(fn, "rb") as f:
+                results = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning(f"Removing broken cache entry {fn}: {e}")
+            os.remove(fn)
+            return None
+        # Mark as recently used
+        os.utime(fn)
+        return results
+
+    def put(self, key: str, results: List[Any]):
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(results, f)
+            os.replace(tmp, self._filename(key))
+        except BaseException:
+            os.remove(tmp)
+            raise
+        self._evict()
+
+    def _filename(self, key):
+        return os.path.join(self.cache_dir, key + ".pkl")
+
+    def _evict(self):
+        entries = []
+        for fn in os.listdir(self.cache_dir):
+            if not fn.endswith(".pkl"):
+                continue
+            path = os.path.join(self.cache_dir, fn)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+
+        total = sum(e[1] for e in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            logging.info(f"Evicting {path} from the transcribe cache")
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -1,11 +1,14 @@
+import datetime
 import logging
 import os
 import re
 
 import srt
-from moviepy import editor
 
-from . import utils
+from . import render, trace, utils
+from .segments import SegmentSet
+
+_MS = datetime.timedelta(milliseconds=1)
 
 
 # Merge videos
@@ -48,25 +51,33 @@ class Merger:
         if not md.done_editing():
             return
 
-        videos = []
-        for m, t in md.tasks():
-            if not m:
-                continue
-            m = re.findall(r"\[(.*)\]", t)
-            if not m:
-                continue
-            fn = os.path.join(os.path.dirname(md_fn), m[0])
-            logging.info(f"Loading {fn}")
-            videos.append(editor.VideoFileClip(fn))
-
-        dur = sum([v.duration for v in videos])
-        logging.info(f"Merging into a video with {dur / 60:.1f} min length")
-
-        merged = editor.concatenate_videoclips(videos)
-        fn = os.path.splitext(md_fn)[0] + "_merged.mp4"
-        merged.write_videofile(
-            fn, audio_codec="aac", bitrate=self.args.bitrate
-        )  # logger=None,
+        # moviepy takes most of a second to import, only when there is work
+        from moviepy import editor
+
+        with trace.span("merge", file=md_fn) as sp:
+            videos = []
+            for m, t in md.tasks():
+                if not m:
+                    continue
+                m = re.findall(r"\[(.*)\]", t)
+                if not m:
+                    continue
+                fn = os.path.join(os.path.dirname(md_fn), m[0])
+                logging.info(f"Loading {fn}")
+                with trace.span("load_media", file=fn, bytes=os.path.getsize(fn)):
+                    videos.append(editor.VideoFileClip(fn))
+
+            dur = sum([v.duration for v in videos])
+            sp["videos"] = len(videos)
+            logging.info(f"Merging into a video with {dur / 60:.1f} min length")
+
+            merged = editor.concatenate_videoclips(videos)
+            fn = os.path.splitext(md_fn)[0] + "_merged.mp4"
+            with trace.span("encode", file=fn, videos=len(videos), seconds=dur) as sp:
+                merged.write_videofile(
+                    fn, audio_codec="aac", bitrate=self.args.bitrate
+                )  # logger=None,
+                sp["bytes"] = os.path.getsize(fn)
         logging.info(f"Saved merged video to {fn}")
 
 
@@ -109,26 +120,52 @@ class Cutter:
         else:
             logging.info(f'Cut {fns["media"]} based on {fns["srt"]}')
 
-        segments = []
-        # Avoid disordered subtitles
-        subs.sort(key=lambda x: x.start)
-        for x in subs:
-            if len(segments) == 0:
-                segments.append(
-                    {"start": x.start.total_seconds(), "end": x.end.total_seconds()}
+        with trace.span("cut", file=fns["media"], subtitles=len(subs)) as sp:
+            # Avoid disordered subtitles
+            subs.sort(key=lambda x: x.start)
+            # In ms, merge subtitles less than 0.5 sec apart
+            segments = SegmentSet([(x.start // _MS, x.end // _MS) for x in subs]).merge(
+                500
+            )
+            segments = [{"start": s / 1000, "end": e / 1000} for s, e in segments]
+            sp["segments"] = len(segments)
+
+            copied = (
+                is_video_file
+                and self.args.stream_copy
+                and render.StreamCopier(fns["media"], self.args.bitrate).run(
+                    segments, output_fn
                 )
-            else:
-                if x.start.total_seconds() - segments[-1]["end"] < 0.5:
-                    segments[-1]["end"] = x.end.total_seconds()
-                else:
-                    segments.append(
-                        {"start": x.start.total_seconds(), "end": x.end.total_seconds()}
-                    )
-
-        if is_video_file:
-            media = editor.VideoFileClip(fns["media"])
+            )
+            if not copied:
+                self._render(fns["media"], segments, output_fn, is_video_file)
+        logging.info(f"Saved media to {output_fn}")
+
+    def _render(self, media_fn, segments, output_fn, is_video_file):
+        # Re-encode the segments with the chosen backend, a long video in
+        # chunks in parallel. Audio is cut with NumPy
+        if not is_video_file:
+            render.AudioRenderer(media_fn, self.args.bitrate, self.args.crossfade).run(
+                segments, output_fn
+            )
+            return
+        if render.ChunkRenderer(
+            media_fn, self.args.bitrate, self.args.render_backend, self.args.render_jobs
+        ).run(segments, output_fn):
+            return
+        if self.args.render_backend == "ffmpeg":
+            render.FilterRenderer(media_fn, self.args.bitrate).run(
+                segments, output_fn, is_video_file
+            )
         else:
-            media = editor.AudioFileClip(fns["media"])
+            self._render_moviepy(media_fn, segments, output_fn)
+
+    def _render_moviepy(self, media_fn, segments, output_fn):
+        # Re-encode all frames through moviepy
+        from moviepy import editor
+
+        with trace.span("load_media", file=media_fn, bytes=os.path.getsize(media_fn)):
+            media = editor.VideoFileClip(media_fn)
 
         # Add a fade between two clips. Not quite necessary. keep code here for reference
         # fade = 0
@@ -137,31 +174,22 @@ class Cutter:
         #         s['start'], s['end']).crossfadein(fade) for s in segments]
         # final_clip = editor.concatenate_videoclips(clips, padding = -fade)
 
-        clips = [media.subclip(s["start"], s["end"]) for s in segments]
-        if is_video_file:
-            final_clip: editor.VideoClip = editor.concatenate_videoclips(clips)
-            logging.info(
-                f"Reduced duration from {media.duration:.1f} to {final_clip.duration:.1f}"
-            )
+        with trace.span("extract_clips", clips=len(segments)):
+            clips = [media.subclip(s["start"], s["end"]) for s in segments]
+        final_clip: editor.VideoClip = editor.concatenate_videoclips(clips)
+        logging.info(
+            f"Reduced duration from {media.duration:.1f} to {final_clip.duration:.1f}"
+        )
 
-            aud = final_clip.audio.set_fps(44100)
-            final_clip = final_clip.without_audio().set_audio(aud)
-            final_clip = final_clip.fx(editor.afx.audio_normalize)
+        aud = final_clip.audio.set_fps(44100)
+        final_clip = final_clip.without_audio().set_audio(aud)
+        final_clip = final_clip.fx(editor.afx.audio_normalize)
 
-            # an alternative to birate is use crf, e.g. ffmpeg_params=['-crf', '18']
+        # an alternative to birate is use crf, e.g. ffmpeg_params=['-crf', '18']
+        with trace.span("encode", file=output_fn, seconds=final_clip.duration) as sp:
             final_clip.write_videofile(
                 output_fn, audio_codec="aac", bitrate=self.args.bitrate
             )
-        else:
-            final_clip: editor.AudioClip = editor.concatenate_audioclips(clips)
-            logging.info(
-                f"Reduced duration from {media.duration:.1f} to {final_clip.duration:.1f}"
-            )
-
-            final_clip = final_clip.fx(editor.afx.audio_normalize)
-            final_clip.write_audiofile(
-                output_fn, codec="libmp3lame", fps=44100, bitrate=self.args.bitrate
-            )
+            sp["bytes"] = os.path.getsize(output_fn)
 
         media.close()
-        logging.info(f"Saved media to {output_fn}")
@@ -28,7 +28,20 @@ class Daemon:
             srt_fn = utils.change_ext(f, "srt")
             md_fn = utils.change_ext(f, "md")
             is_video_file = utils.is_video(f)
-            if srt_fn not in files or md_fn not in files:
+            if self.args.incremental and (
+                srt_fn not in files
+                or md_fn not in files
+                or f + ".incremental.json" in files
+            ):
+                # Transcribe a recording while it grows, only cut it once it's done
+                args.inputs = [f]
+                try:
+                    if not transcribe.Transcribe(args).run_incremental(f):
+                        continue
+                except RuntimeError as e:
+                    logging.warning(f"Failed to transcribe {f} incrementally: {e}")
+                    continue
+            elif srt_fn not in files or md_fn not in files:
                 args.inputs = [f]
                 try:
                     transcribe.Transcribe(args).run()
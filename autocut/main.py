@@ -2,7 +2,7 @@ import argparse
 import logging
 import os
 
-from . import utils
+from . import trace, utils
 from .type import WhisperMode, WhisperModel
 
 
@@ -17,7 +17,13 @@ def main():
     )
     logging.getLogger().setLevel(logging.INFO)
 
-    parser.add_argument("inputs", type=str, nargs="+", help="Inputs filenames/folders")
+    parser.add_argument(
+        "inputs",
+        type=str,
+        nargs="+",
+        help="Inputs filenames/folders, or - for stdin, a named pipe or a stream URL "
+        "to transcribe live",
+    )
     parser.add_argument(
         "-t",
         "--transcribe",
@@ -143,9 +149,109 @@ def main():
         default="10m",
         help="The bitrate to export the cutted video, such as 10m, 1m, or 500k",
     )
+    parser.add_argument(
+        "--stream-copy",
+        help="Cut videos by copying the kept frames, only the frames around cut points "
+        "that are not keyframes are re-encoded. Much faster, falls back to re-encoding "
+        "everything if the codec can't be matched",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+    )
+    parser.add_argument(
+        "--render-backend",
+        help="Re-encode the cut media with moviepy, or with a single ffmpeg filter "
+        "graph, which is much faster as no frame goes through Python",
+        choices=["moviepy", "ffmpeg"],
+        default="moviepy",
+    )
+    parser.add_argument(
+        "--render-jobs",
+        type=int,
+        default=None,
+        help="Number of processes re-encoding chunks of a cut video in parallel, "
+        "which are then joined without re-encoding. By default min(4, number of "
+        "cores), 1 to render in one piece",
+    )
+    parser.add_argument(
+        "--crossfade",
+        type=float,
+        default=0,
+        help="Crossfade the segments of a cut audio file over this many seconds, "
+        "such as 0.01, to smooth out the clicks at the cut points. Audio files are "
+        "cut sample accurately with NumPy",
+    )
     parser.add_argument(
         "--vad", help="If or not use VAD", choices=["1", "0", "auto"], default="auto"
     )
+    parser.add_argument(
+        "--vad-backend",
+        help="silero is more accurate, energy is much faster and good for clean audio",
+        choices=["silero", "energy"],
+        default="silero",
+    )
+    parser.add_argument(
+        "--vad-model",
+        type=str,
+        default=None,
+        help="Path to a silero VAD model in .onnx or .jit, "
+        "default to the one shipped with the silero-vad package",
+    )
+    parser.add_argument(
+        "--pipeline",
+        help="Decode and run VAD on a background thread while transcribing, "
+        "transcription starts with the first speech found",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Transcribe this many files in parallel, each in a process holding a copy "
+        "of the model and an even share of the CPU cores",
+    )
+    parser.add_argument(
+        "--incremental",
+        help="With --daemon, transcribe recordings while they grow and append the "
+        "new subtitles to the .srt and .md",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+    )
+    parser.add_argument(
+        "--prefetch",
+        type=int,
+        default=1,
+        help="With multiple inputs, decode and run VAD on this many next inputs "
+        "in the background while transcribing",
+    )
+    parser.add_argument(
+        "--keep-pcm",
+        help="Keep the decoded audio next to each input as input + '.pcm', about 115 MB "
+        "per hour, so transcribing it again skips decoding. In default it's removed "
+        "once the input is transcribed",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+    )
+    parser.add_argument(
+        "--trace",
+        type=str,
+        default=None,
+        help="Write the time spent in each stage to this file in the Chrome trace format, "
+        "open it in https://ui.perfetto.dev",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=None,
+        help="Cache transcribe results in this folder, so transcribing the same audio again, "
+        "e.g. a renamed or copied file, is almost free. In default no cache is used",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=1024,
+        help="The max size of the cache in MB, the least recently used results are evicted first",
+    )
     parser.add_argument(
         "--force",
         help="Force write even if files exist",
@@ -161,13 +267,62 @@ def main():
         choices=["cpu", "cuda"],
         help="Force to CPU or GPU for transcribing. In default automatically use GPU if available.",
     )
+    parser.add_argument(
+        "--cpu-workers",
+        type=int,
+        default=None,
+        help="Number of segments to transcribe in parallel. In whisper mode with --device=cpu, each worker "
+        "is a process holding a copy of the model, by default min(4, number of cores). "
+        "In faster mode, they are CTranslate2 workers sharing the model, by default 1",
+    )
+    parser.add_argument(
+        "--cpu-threads",
+        type=int,
+        default=None,
+        help="Number of threads of each CPU worker. In default split the cores evenly among workers",
+    )
+    parser.add_argument(
+        "--compute-type",
+        type=str,
+        default="default",
+        choices=[
+            "default",
+            "int8",
+            "int8_float32",
+            "int8_float16",
+            "float16",
+            "float32",
+        ],
+        help="The CTranslate2 compute type in faster mode, int8 is usually the fastest on CPU",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=0,
+        help="Decode this many 30 sec windows in a batch in faster mode, 0 to disable",
+    )
 
     args = parser.parse_args()
 
+    if args.trace:
+        trace.enable()
+    try:
+        _run(args)
+    finally:
+        # Also save what was traced when the daemon is stopped
+        if args.trace:
+            trace.save(args.trace)
+            logging.info(f"Saved the trace to {args.trace}")
+
+
+def _run(args):
     if args.transcribe:
-        from .transcribe import Transcribe
+        from .transcribe import Transcribe, run_jobs
 
-        Transcribe(args).run()
+        if args.jobs > 1:
+            run_jobs(args)
+        else:
+            Transcribe(args).run()
     elif args.to_md:
         from .utils import trans_srt_to_md
 
@@ -3,13 +3,20 @@ import time
 from typing import List, Any, Union, Literal
 
 import numpy as np
-import torch
 
-from . import utils, whisper_model
+from . import utils, vad, whisper_model
+from .cache import TranscribeCache
+from .segments import SegmentSet
 from .type import WhisperMode, SPEECH_ARRAY_INDEX, WhisperModel, LANG
 
 
 class Transcribe:
+    # Post-processing of the VAD results, in seconds
+    vad_min_speech = 1.0
+    vad_pad = 0.2
+    vad_merge_gap = 0.5
+    vad_block_seconds = 600
+
     def __init__(
         self,
         whisper_mode: Union[
@@ -17,68 +24,89 @@ class Transcribe:
         ] = WhisperMode.WHISPER.value,
         whisper_model_size: WhisperModel.get_values() = "small",
         vad: bool = True,
+        vad_backend: Literal["silero", "energy"] = "silero",
+        vad_model_path: Union[str, None] = None,
         device: Union[Literal["cpu", "cuda"], None] = None,
+        cache_dir: Union[str, None] = None,
+        cache_size: int = 1024,
     ):
         self.whisper_mode = whisper_mode
         self.whisper_model_size = whisper_model_size
         self.vad = vad
+        self.vad_backend = vad_backend
+        self.vad_model_path = vad_model_path
         self.device = device
         self.sampling_rate = 16000
         self.whisper_model = None
         self.vad_model = None
-        self.detect_speech = None
+        self.cache = (
+            TranscribeCache(cache_dir, cache_size * 2**20) if cache_dir else None
+        )
 
         tic = time.time()
-        if self.whisper_model is None:
-            if self.whisper_mode == WhisperMode.WHISPER.value:
-                self.whisper_model = whisper_model.WhisperModel(self.sampling_rate)
-                self.whisper_model.load(self.whisper_model_size, self.device)
-            elif self.whisper_mode == WhisperMode.FASTER.value:
-                self.whisper_model = whisper_model.FasterWhisperModel(
-                    self.sampling_rate
-                )
-                self.whisper_model.load(self.whisper_model_size, self.device)
+        self.whisper_model = whisper_model.get_model(
+            self.whisper_mode, self.whisper_model_size, self.device, self.sampling_rate
+        )
         logging.info(f"Done Init model in {time.time() - tic:.1f} sec")
 
     def run(self, audio: np.ndarray, lang: LANG, prompt: str = ""):
+        if self.cache:
+            key = self.cache.key(audio, **self._cache_options(lang, prompt))
+            transcribe_results = self.cache.get(key)
+            if transcribe_results is not None:
+                logging.info("Loaded transcribe results from cache")
+                return transcribe_results
+
         speech_array_indices = self._detect_voice_activity(audio)
         transcribe_results = self._transcribe(audio, speech_array_indices, lang, prompt)
+        if self.cache:
+            self.cache.put(key, transcribe_results)
         return transcribe_results
 
     def format_results_to_srt(self, transcribe_results: List[Any]):
         return self.whisper_model.gen_srt(transcribe_results)
 
+    def _cache_options(self, lang, prompt):
+        return {
+            "whisper_mode": self.whisper_mode,
+            "whisper_model": self.whisper_model_size,
+            "device": self.device,
+            "lang": lang,
+            "prompt": prompt,
+            "vad": self.vad,
+            "vad_backend": self.vad_backend,
+            "vad_model": self.vad_model_path,
+            "vad_params": [
+                self.vad_min_speech,
+                self.vad_pad,
+                self.vad_merge_gap,
+                self.vad_block_seconds,
+            ],
+            "window_seconds": self.whisper_model.window_seconds,
+            "pack_gap_seconds": self.whisper_model.pack_gap_seconds,
+        }
+
     def _detect_voice_activity(self, audio) -> List[SPEECH_ARRAY_INDEX]:
         """Detect segments that have voice activities"""
         if self.vad is False:
             return [{"start": 0, "end": len(audio)}]
 
-        tic = time.time()
-        if self.vad_model is None or self.detect_speech is None:
-            # torch load limit https://github.com/pytorch/vision/issues/4156
-            torch.hub._validate_not_a_forked_repo = lambda a, b, c: True
-            self.vad_model, funcs = torch.hub.load(
-                repo_or_dir="snakers4/silero-vad", model="silero_vad", trust_repo=True
+        if self.vad_model is None:
+            self.vad_model = vad.get_vad(
+                self.vad_backend, self.vad_model_path, self.sampling_rate
             )
-
-            self.detect_speech = funcs[0]
-
-        speeches = self.detect_speech(
-            audio, self.vad_model, sampling_rate=self.sampling_rate
-        )
-
-        # Remove too short segments
-        speeches = utils.remove_short_segments(speeches, 1.0 * self.sampling_rate)
-
-        # Expand to avoid to tight cut. You can tune the pad length
-        speeches = utils.expand_segments(
-            speeches, 0.2 * self.sampling_rate, 0.0 * self.sampling_rate, audio.shape[0]
+        speeches = vad.detect_speech(self.vad_model, audio, self.vad_block_seconds)
+
+        speeches = (
+            SegmentSet.from_dicts(speeches)
+            # Remove too short segments
+            .filter(self.vad_min_speech * self.sampling_rate)
+            # Expand to avoid to tight cut. You can tune the pad length
+            .expand(self.vad_pad * self.sampling_rate, 0, len(audio))
+            # Merge very closed segments
+            .merge(self.vad_merge_gap * self.sampling_rate).to_dicts()
         )
 
-        # Merge very closed segments
-        speeches = utils.merge_adjacent_segments(speeches, 0.5 * self.sampling_rate)
-
-        logging.info(f"Done voice activity detection in {time.time() - tic:.1f} sec")
         return speeches if len(speeches) > 1 else [{"start": 0, "end": len(audio)}]
 
     def _transcribe(
@@ -90,5 +118,9 @@ class Transcribe:
     ) -> List[Any]:
         tic = time.time()
         res = self.whisper_model.transcribe(audio, speech_array_indices, lang, prompt)
-        logging.info(f"Done transcription in {time.time() - tic:.1f} sec")
+        elapsed = time.time() - tic
+        logging.info(
+            f"Done transcription in {elapsed:.1f} sec, "
+            f"real-time factor {elapsed / max(len(audio) / self.sampling_rate, 1e-3):.3f}"
+        )
         return res
@@ -0,0 +1,305 @@
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Callable, Iterable, Iterator, List
+
+import numpy as np
+
+from . import trace, utils
+from .type import SPEECH_ARRAY_INDEX
+from .vad import AbstractVAD
+
+
+def iter_postprocess(
+    speeches: Iterable[SPEECH_ARRAY_INDEX], min_length, pad, merge_gap
+) -> Iterator[SPEECH_ARRAY_INDEX]:
+    # The streaming version of remove_short_segments, expand_segments with no
+    # tail padding and merge_adjacent_segments, applied one after another
+    prev_end = 0
+    last = None
+    for s in speeches:
+        if s["end"] - s["start"] <= min_length:
+            continue
+        s = {"start": max(s["start"] - pad, prev_end), "end": s["end"]}
+        prev_end = s["end"]
+        if last and s["start"] < last["end"] + merge_gap:
+            last["end"] = s["end"]
+        else:
+            if last:
+                yield last
+            last = s
+    if last:
+        yield last
+
+
+def iter_pack(
+    segments: Iterable[SPEECH_ARRAY_INDEX], max_length, max_gap=None
+) -> Iterator[SPEECH_ARRAY_INDEX]:
+    # The streaming version of utils.pack_segments
+    window = None
+    for s in segments:
+        if (
+            window
+            and s["end"] - window["start"] <= max_length
+            and (max_gap is None or s["start"] - window["end"] <= max_gap)
+        ):
+            window["end"] = s["end"]
+        else:
+            if window:
+                yield window
+            window = {"start": s["start"], "end": s["end"]}
+    if window:
+        yield window
+
+
+class SpeechProducer(threading.Thread):
+    """Decodes a media file, runs VAD and packs the speeches into windows on a
+    background thread.
+
+    A window is put into a bounded queue as soon as the audio it covers is
+    written to the PCM sidecar, so transcribing can start long before the whole
+    file is decoded. The sidecar is decoded into a temp file, which close()
+    renames to file + ".pcm" if everything went well.
+    """
+
+    def __init__(
+        self,
+        input: str,
+        vad: AbstractVAD,
+        min_speech: float,
+        pad: float,
+        merge_gap: float,
+        window_seconds: float,
+        pack_gap_seconds: float,
+        block_seconds: float = 30,
+        queue_size: int = 16,
+    ):
+        super().__init__(daemon=True)
+        self.input = input
+        self.vad = vad
+        self.sample_rate = vad.sample_rate
+        self.params = [int(x * self.sample_rate) for x in (min_speech, pad, merge_gap)]
+        self.window_length = window_seconds * self.sample_rate
+        self.pack_gap = pack_gap_seconds * self.sample_rate
+        self.block_size = int(block_seconds * self.sample_rate)
+        self.queue = queue.Queue(queue_size)
+        self.stopped = threading.Event()
+        self.audio_fn = None
+        self.tmp_fn = None
+        self.num_samples = 0
+        self.done = False
+        self.decode_time = 0
+        self.vad_time = 0
+
+    def run(self):
+        try:
+            with trace.span("decode_vad", file=self.input) as sp:
+                for window in self._windows():
+                    self._put(window)
+                sp["audio_seconds"] = self.num_samples / self.sample_rate
+                sp["decode_seconds"] = self.decode_time
+                sp["vad_seconds"] = self.vad_time
+            self.done = not self.stopped.is_set()
+            self._put(None)
+        except BaseException as e:
+            self._put(e)
+
+    def _put(self, item):
+        # Give up once the consumer stopped, otherwise a full queue blocks forever
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def _windows(self) -> Iterator[SPEECH_ARRAY_INDEX]:
+        audio = utils.open_pcm(self.input, self.sample_rate)
+        if audio is not None:
+            self.audio_fn = audio.filename
+            blocks = utils.iter_blocks(audio, self.block_size)
+        else:
+            self.tmp_fn = self.audio_fn = (
+                f"{self.input}.pcm.{os.getpid()}.{threading.get_ident()}.tmp"
+            )
+            blocks = (
+                np.divide(b, 32768.0, dtype=np.float32)
+                for b in utils.iter_decode_pcm(
+                    self.input,
+                    self.tmp_fn,
+                    self.sample_rate,
+                    utils.pcm_sidecar_header(self.input, self.sample_rate),
+                    self.block_size,
+                )
+            )
+
+        speeches = iter_postprocess(self.vad.stream(self._timed(blocks)), *self.params)
+        windows = iter_pack(
+            self._at_least_two(speeches), self.window_length, self.pack_gap
+        )
+        while not self.stopped.is_set():
+            tic = time.time()
+            decode_time = self.decode_time
+            window = next(windows, None)
+            self.vad_time += time.time() - tic - (self.decode_time - decode_time)
+            if window is None:
+                return
+            yield window
+
+    def _timed(self, blocks):
+        blocks = iter(blocks)
+        while True:
+            tic = time.time()
+            block = next(blocks, None)
+            self.decode_time += time.time() - tic
+            if block is None:
+                return
+            self.num_samples += len(block)
+            yield block
+
+    def _at_least_two(self, speeches):
+        # Same as Transcribe._detect_voice_activity, transcribe the whole audio
+        # if there is at most one speech
+        first = next(speeches, None)
+        second = next(speeches, None)
+        if second is None:
+            yield {"start": 0, "end": self.num_samples}
+            return
+        yield first
+        yield second
+        yield from speeches
+
+    def audio(self) -> utils.PCMAudio:
+        # The audio decoded so far
+        return utils.PCMAudio(
+            self.audio_fn, self.sample_rate, utils.PCM_SIDECAR_HEADER_SIZE
+        )
+
+    def batches(self) -> Iterator[List[SPEECH_ARRAY_INDEX]]:
+        # Wait for the next window, and take all others that are ready as well, so
+        # a model can transcribe them in parallel
+        finished = False
+        while not finished:
+            batch = [self.queue.get()]
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            for i, item in enumerate(batch):
+                if isinstance(item, BaseException):
+                    raise item
+                if item is None:
+                    finished = True
+                    batch = batch[:i]
+                    break
+            if batch:
+                yield batch
+
+    def close(self):
+        self.stopped.set()
+        self.join()
+        if self.tmp_fn and os.path.exists(self.tmp_fn):
+            if self.done:
+                os.replace(self.tmp_fn, self.input + ".pcm")
+            else:
+                os.remove(self.tmp_fn)
+        logging.info(
+            f"Done decoding in {self.decode_time:.1f} sec and voice activity "
+            f"detection in {self.vad_time:.1f} sec in the background"
+        )
+
+
+def iter_threaded(blocks: Iterable[np.ndarray]) -> Iterator[np.ndarray]:
+    # Read the blocks on a background thread into an unbounded queue, so that a
+    # live source is never held up while the consumer is busy. The blocks are
+    # copied, as the source may reuse its buffer
+    q = queue.Queue()
+    stopped = threading.Event()
+
+    def read():
+        try:
+            for block in blocks:
+                if stopped.is_set():
+                    return
+                q.put(block.copy())
+            q.put(None)
+        except BaseException as e:
+            q.put(e)
+
+    threading.Thread(target=read, daemon=True).start()
+    try:
+        while True:
+            item = q.get()
+            if item is None:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stopped.set()
+
+
+class LiveSegmenter:
+    """Finds the speeches of a live stream and hands them out as they end.
+
+    Only the audio from the last handed out speech or the last silence on is
+    buffered. A speech is passed to the callback as soon as VAD finds its end,
+    and a speech going on for more than max_length is passed on in parts, so
+    neither the latency nor the memory grows with the stream.
+    """
+
+    def __init__(
+        self,
+        vad: AbstractVAD,
+        min_length: int,
+        pad: int,
+        max_length: int,
+        callback: Callable[[np.ndarray, int, List[SPEECH_ARRAY_INDEX]], None],
+    ):
+        # callback(audio, base, speeches) gets the buffered audio starting at
+        # sample base of the stream, and the speeches in it relative to the buffer
+        self.vad = vad
+        self.min_length = min_length
+        self.pad = pad
+        self.max_length = max_length
+        self.callback = callback
+        self.buf = np.zeros(0, dtype=np.float32)
+        self.base = 0
+        # Nothing before done is handed out anymore
+        self.done = 0
+        self.num_samples = 0
+        self.speaking = False
+
+    def run(self, blocks: Iterable[np.ndarray]):
+        for s in self.vad.stream(self._buffered(blocks), partial=True):
+            if not s.get("partial"):
+                self._flush(s)
+            else:
+                self.speaking = True
+                if s["end"] - max(s["start"], self.done) > self.max_length:
+                    self._flush(s)
+
+    def _buffered(self, blocks):
+        for block in blocks:
+            if not self.speaking:
+                # The last block ended in silence, keep only the head padding
+                self.done = max(self.done, self.num_samples - self.pad)
+            self.speaking = False
+            self.buf = np.concatenate([self.buf[self.done - self.base :], block])
+            self.base = self.done
+            self.num_samples += len(block)
+            yield block
+
+    def _flush(self, s):
+        # Drop a short speech, pad the head and clip away the part handed out
+        if s["end"] - s["start"] > self.min_length and s["end"] > self.done:
+            start = max(s["start"] - self.pad, self.done)
+            self.callback(
+                self.buf,
+                self.base,
+                [{"start": start - self.base, "end": s["end"] - self.base}],
+            )
+        self.done = max(self.done, s["end"])
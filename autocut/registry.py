@@ -0,0 +1,41 @@
+import logging
+import threading
+from typing import Any, Callable, Hashable
+
+
+class ModelRegistry:
+    """Keeps loaded models, whisper and VAD ones, warm between files and
+    Transcribe instances.
+
+    A model is loaded once per key and reused as long as it is requested with
+    the same options. Requesting it with different options closes the old one
+    and loads it again.
+    """
+
+    def __init__(self):
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, options: dict, load: Callable[[], Any]):
+        with self._lock:
+            if key in self._models:
+                loaded_options, model = self._models[key]
+                if loaded_options == options:
+                    return model
+                logging.info(f"Reloading {key} with new options {options}")
+                del self._models[key]
+                if hasattr(model, "close"):
+                    model.close()
+            model = load()
+            self._models[key] = (options, model)
+            return model
+
+    def clear(self):
+        with self._lock:
+            for _, model in self._models.values():
+                if hasattr(model, "close"):
+                    model.close()
+            self._models.clear()
+
+
+registry = ModelRegistry()
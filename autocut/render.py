@@ -0,0 +1,733 @@
+import bisect
+import contextlib
+import dataclasses
+import functools
+import logging
+import multiprocessing
+import os
+import re
+import subprocess
+import tempfile
+import time
+from typing import Iterator, List, Tuple, Union
+
+import numpy as np
+
+from . import trace, utils
+from .type import SPEECH_ARRAY_INDEX
+
+# The encoder re-encoding the fragments of a codec, the bitstream filter that
+# puts the parameter sets in-band, and the option of the encoder to repeat them
+# at every keyframe, so fragments from different encoders can be joined
+SMART_ENCODERS = {
+    "h264": ("libx264", "h264_mp4toannexb", "-x264-params"),
+    "hevc": ("libx265", "hevc_mp4toannexb", "-x265-params"),
+}
+
+# Shift the timestamps of a fragment to start at 0
+REBASE = "setts=pts=PTS-STARTPTS:dts=DTS-STARTPTS"
+
+# ffmpeg prints profiles by name, the encoders want them like this
+PROFILES = {
+    "constrained baseline": "baseline",
+    "baseline": "baseline",
+    "main": "main",
+    "high": "high",
+    "high 10": "high10",
+    "high 4:2:2": "high422",
+    "high 4:4:4 predictive": "high444",
+    "main 10": "main10",
+}
+
+
+@dataclasses.dataclass
+class VideoStream:
+    codec: str
+    profile: Union[str, None]
+    pix_fmt: str
+
+
+@dataclasses.dataclass
+class Frames:
+    # The presentation time of each video frame in seconds, sorted, and whether
+    # it's a keyframe
+    times: np.ndarray
+    keyframes: np.ndarray
+    # Whether frames are decoded in another order, e.g. there are B-frames, and
+    # how much earlier the first one is decoded than shown, in seconds
+    reordered: bool = False
+    delay: float = 0.0
+    # The time base of the timestamps is 1 / timescale
+    timescale: int = 1000
+
+
+@dataclasses.dataclass
+class Part:
+    # Frames [start, end) of the video, copied or re-encoded
+    copy: bool
+    start: int
+    end: int
+
+
+def _ffmpeg(args, what):
+    p = subprocess.run(
+        ["ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error", "-y"] + args,
+        capture_output=True,
+    )
+    if p.returncode != 0:
+        raise RuntimeError(f"Failed to {what}: {p.stderr.decode(errors='replace')}")
+    return p
+
+
+@contextlib.contextmanager
+def _filter_script(graph: str) -> Iterator[List[str]]:
+    # The graph grows with the segments, pass it in a file to stay below the
+    # command line limit
+    with tempfile.TemporaryDirectory() as tmp:
+        fn = os.path.join(tmp, "graph.txt")
+        with open(fn, "w", encoding="utf-8") as f:
+            f.write(graph)
+        yield ["-filter_complex_script", fn]
+
+
+@functools.lru_cache(maxsize=None)
+def has_encoder(name: str) -> bool:
+    p = subprocess.run(
+        ["ffmpeg", "-nostdin", "-hide_banner", "-encoders"], capture_output=True
+    )
+    return re.search(rf"^ \S+ {re.escape(name)} ", p.stdout.decode(), re.M) is not None
+
+
+def probe_video(file: str) -> Union[VideoStream, None]:
+    # The first video stream from the header that ffmpeg prints, None if there
+    # is none. A cover picture doesn't count
+    p = subprocess.run(
+        ["ffmpeg", "-nostdin", "-hide_banner", "-i", file], capture_output=True
+    )
+    for line in p.stderr.decode(errors="replace").splitlines():
+        m = re.search(r"Stream #\S+: Video: (\w+)(?: \(([^)]*)\))?.*?, (\w+)", line)
+        if m and "attached pic" not in line:
+            codec, profile, pix_fmt = m.groups()
+            return VideoStream(codec, profile and profile.lower(), pix_fmt)
+    return None
+
+
+def has_audio(file: str) -> bool:
+    p = subprocess.run(
+        ["ffmpeg", "-nostdin", "-hide_banner", "-i", file], capture_output=True
+    )
+    return re.search(rb"Stream #\S+: Audio: ", p.stderr) is not None
+
+
+def read_frames(file: str) -> Frames:
+    # Read from the packets without decoding
+    p = _ffmpeg(
+        ["-i", file, "-map", "0:v:0", "-c", "copy", "-f", "framecrc", "-"],
+        "read the frames",
+    )
+    num, den = 1, 1000
+    pts, dts, key = [], [], []
+    for line in p.stdout.decode().splitlines():
+        if line.startswith("#tb 0:"):
+            num, den = (int(x) for x in line.split(":")[1].split("/"))
+        elif not line.startswith("#"):
+            fields = [f.strip() for f in line.split(",")]
+            flags = [f for f in fields[6:] if f.startswith("F=")]
+            dts.append(int(fields[1]))
+            pts.append(int(fields[2]))
+            key.append(not flags or bool(int(flags[0][2:], 16) & 1))
+    tb = num / den
+    pts, key = np.array(pts, dtype=np.int64), np.array(key, dtype=bool)
+    order = np.argsort(pts, kind="stable")
+    return Frames(
+        pts[order] * tb,
+        key[order],
+        reordered=bool(np.any(np.diff(pts) < 0)),
+        delay=(pts[0] - dts[0]) * tb if len(pts) else 0.0,
+        timescale=den // num,
+    )
+
+
+def plan_parts(frames: Frames, segments: List[SPEECH_ARRAY_INDEX]) -> List[Part]:
+    # Copy the frames of each segment from its first keyframe on, and re-encode
+    # the frames before it. A copy can end at any frame if frames are not
+    # reordered, otherwise only right before a keyframe, and the frames after
+    # the last keyframe are re-encoded too
+    times = frames.times
+    key_index = np.flatnonzero(frames.keyframes).tolist()
+    parts = []
+    for s in segments:
+        start, end = (int(i) for i in np.searchsorted(times, [s["start"], s["end"]]))
+        if end <= start:
+            continue
+        after = key_index[bisect.bisect_left(key_index, start) :]
+        first = after[0] if after else end
+        last = end
+        if frames.reordered:
+            before = key_index[: bisect.bisect_right(key_index, end)]
+            last = before[-1] if before else start
+        if first < last:
+            if start < first:
+                parts.append(Part(False, start, first))
+            parts.append(Part(True, first, last))
+            if last < end:
+                parts.append(Part(False, last, end))
+        else:
+            parts.append(Part(False, start, end))
+    return parts
+
+
+class StreamCopier:
+    """Cuts a video by copying the kept frames, re-encoding only around the cut
+    points that are not keyframes.
+
+    The fragments are written as MP4 with in-band parameter sets, joined by the
+    concat demuxer and muxed with the audio of the segments, which is always
+    re-encoded and peak normalized, the same as the moviepy path.
+    """
+
+    def __init__(self, input: str, bitrate: str):
+        self.input = input
+        self.bitrate = bitrate
+
+    def supported(self) -> Union[VideoStream, None]:
+        video = probe_video(self.input)
+        if video is None or video.codec not in SMART_ENCODERS:
+            return None
+        if not has_encoder(SMART_ENCODERS[video.codec][0]):
+            return None
+        return video
+
+    def run(self, segments: List[SPEECH_ARRAY_INDEX], output: str) -> bool:
+        # The segments are in seconds. False if the codec can't be matched,
+        # nothing is written then
+        video = self.supported()
+        if video is None:
+            logging.info(f"Can't stream copy {self.input}, re-encode it")
+            return False
+
+        tic = time.time()
+        with trace.span("read_frames", file=self.input):
+            frames = read_frames(self.input)
+        if len(frames.times) == 0:
+            return False
+        times = frames.times
+        # The time of each frame and of the end of the last one
+        frame_duration = np.median(np.diff(times)) if len(times) > 1 else 0.04
+        self.times = np.append(times, times[-1] + frame_duration)
+        self.frame_duration = frame_duration
+        self.delay = frames.delay
+        # The concat demuxer needs all fragments in the same time base
+        self.mp4_args = ["-video_track_timescale", str(frames.timescale), "-f", "mp4"]
+        parts = plan_parts(frames, segments)
+        if not parts:
+            return False
+
+        kept = self._kept(parts)
+        logging.info(
+            f"Reduced duration from {self.times[-1]:.1f} to "
+            f"{sum(e - s for s, e in kept):.1f}"
+        )
+        copied = sum(p.end - p.start for p in parts if p.copy)
+        total = sum(p.end - p.start for p in parts)
+        # Write next to the output, and move it there once everything succeeded
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(output) or ".") as tmp:
+            fragments = []
+            for i, part in enumerate(parts):
+                fn = os.path.join(tmp, f"{i:05d}.mp4")
+                if part.copy:
+                    self._copy(part, fn, video)
+                else:
+                    self._encode(part, fn, video)
+                fragments.append((fn, self.times[part.end] - self.times[part.start]))
+            tmp_output = os.path.join(tmp, "output" + os.path.splitext(output)[1])
+            concat_fragments(self.input, fragments, kept, tmp_output)
+            os.replace(tmp_output, output)
+
+        logging.info(
+            f"Copied {copied} of {total} frames in {len(parts)} parts "
+            f"in {time.time() - tic:.1f} sec"
+        )
+        return True
+
+    def _seconds(self, part: Part) -> Tuple[float, float]:
+        return self.times[part.start], self.times[part.end] - self.times[part.start]
+
+    def _kept(self, parts: List[Part]) -> List[Tuple[float, float]]:
+        # The kept time ranges with adjacent parts joined, snapped to the frames
+        ranges = []
+        for p in parts:
+            start, end = self.times[p.start], self.times[p.end]
+            if ranges and ranges[-1][1] == start:
+                ranges[-1] = (ranges[-1][0], end)
+            else:
+                ranges.append((start, end))
+        return ranges
+
+    def _encode(self, part: Part, fn: str, video: VideoStream):
+        start, duration = self._seconds(part)
+        encoder, _, params = SMART_ENCODERS[video.codec]
+        profile = PROFILES.get(video.profile)
+        with trace.span("encode", file=fn, seconds=duration):
+            # Seek to the middle of the first frame, ffmpeg keeps the frame
+            # shown at the seek time, whichever way it rounds.
+            # The fragment is encoded without B-frames, and its decode times are
+            # shifted back by the delay of the copied frames, so the decode
+            # times keep increasing across parts. Every fragment starts at 0
+            _ffmpeg(
+                ["-ss", f"{start + self.frame_duration / 2:.6f}", "-i", self.input]
+                + ["-frames:v", str(part.end - part.start), "-map", "0:v:0"]
+                + ["-c:v", encoder, "-pix_fmt", video.pix_fmt, "-b:v", self.bitrate]
+                + (["-profile:v", profile] if profile else [])
+                + ["-bf", "0", params, "repeat-headers=1"]
+                + ["-bsf:v", f"{REBASE}-{self.delay:.6f}/TB"]
+                + self.mp4_args
+                + [fn],
+                f"encode {self.input} from {start:.3f} sec",
+            )
+
+    def _copy(self, part: Part, fn: str, video: VideoStream):
+        start, duration = self._seconds(part)
+        # Seek to the keyframe before, so rounding never skips the one the part
+        # starts at, and drop the frames outside of the part, by presentation
+        # time, before rebasing the timestamps. They start at half a frame
+        half = self.frame_duration / 2
+        drop = f"lt(pts*tb\\,{half / 2:.6f})+gte(pts*tb\\,{duration + half / 2:.6f})"
+        bsf = f"{SMART_ENCODERS[video.codec][1]},noise=drop={drop},{REBASE}"
+        with trace.span("copy", file=fn, seconds=duration):
+            _ffmpeg(
+                ["-ss", f"{start - half:.6f}", "-i", self.input]
+                + ["-t", f"{duration + 1:.6f}", "-map", "0:v:0", "-c", "copy"]
+                + ["-bsf:v", bsf]
+                + self.mp4_args
+                + [fn],
+                f"copy {self.input} from {start:.3f} sec",
+            )
+
+
+class FilterRenderer:
+    """Cuts a media by re-encoding it with a single ffmpeg filter graph.
+
+    The input is decoded once, split into a trim and an atrim per segment, and
+    the segments are joined by the concat filter, so no frame goes through
+    Python. The audio is peak normalized to 0 dB and resampled to 44.1kHz,
+    the same as the moviepy path.
+    """
+
+    def __init__(self, input: str, bitrate: str):
+        self.input = input
+        self.bitrate = bitrate
+
+    def run(self, segments: List[SPEECH_ARRAY_INDEX], output: str, is_video: bool):
+        # The segments are in seconds
+        ranges = [(s["start"], s["end"]) for s in segments]
+        duration = sum(e - s for s, e in ranges)
+        logging.info(f"Reduced duration to {duration:.1f}")
+        audio = has_audio(self.input)
+        graph = trim_graph(ranges, video=is_video, audio=audio)
+        maps = []
+        if is_video:
+            maps += ["-map", "[v]", "-c:v", "libx264", "-pix_fmt", "yuv420p"]
+            maps += ["-b:v", self.bitrate]
+        if audio:
+            with trace.span("max_volume", file=self.input):
+                gain = -max_volume(self.input, ranges)
+            graph += f";[a]volume={gain:.2f}dB[out_a]"
+            maps += ["-map", "[out_a]", "-ar", "44100"]
+            if is_video:
+                maps += ["-c:a", "aac"]
+            else:
+                maps += ["-c:a", "libmp3lame", "-b:a", self.bitrate]
+
+        tic = time.time()
+        with _filter_script(graph) as script:
+            with trace.span("encode", file=output, seconds=duration) as sp:
+                _ffmpeg(
+                    ["-i", self.input]
+                    + script
+                    + maps
+                    + ["-movflags", "+faststart", output],
+                    f"render {self.input}",
+                )
+                sp["bytes"] = os.path.getsize(output)
+        logging.info(f"Rendered {len(ranges)} segments in {time.time() - tic:.1f} sec")
+
+
+class ChunkRenderer:
+    """Re-encodes the video of a cut in chunks in parallel worker processes.
+
+    The kept frames are dealt into chunks of about the same duration, a
+    segment may be split between two of them. Each worker renders a chunk with
+    the chosen backend and the same encoding parameters, and the chunks are
+    joined by the concat demuxer without re-encoding. The audio is rendered
+    once while joining, peak normalized like the other paths.
+    """
+
+    # Shorter chunks are not worth starting a worker for
+    min_chunk_seconds = 10
+
+    def __init__(
+        self, input: str, bitrate: str, backend: str, jobs: Union[int, None] = None
+    ):
+        self.input = input
+        self.bitrate = bitrate
+        self.backend = backend
+        self.jobs = jobs or min(4, os.cpu_count() or 1)
+
+    def run(self, segments: List[SPEECH_ARRAY_INDEX], output: str) -> bool:
+        # The segments are in seconds. False if it's not worth splitting,
+        # nothing is written then
+        if self.jobs < 2:
+            return False
+        tic = time.time()
+        with trace.span("read_frames", file=self.input):
+            frames = read_frames(self.input)
+        times = frames.times
+        if len(times) < 2:
+            return False
+        frame_duration = np.median(np.diff(times))
+        times = np.append(times, times[-1] + frame_duration)
+        ranges = []
+        for s in segments:
+            start, end = (
+                int(i) for i in np.searchsorted(times, [s["start"], s["end"]])
+            )
+            if start < end:
+                ranges.append((start, end))
+        kept = sum(e - s for s, e in ranges)
+        jobs = min(self.jobs, int(kept * frame_duration / self.min_chunk_seconds))
+        if jobs < 2:
+            return False
+
+        chunks = plan_chunks(ranges, jobs)
+        logging.info(
+            f"Rendering {len(ranges)} segments in {len(chunks)} chunks "
+            f"with {jobs} workers"
+        )
+        threads = max(1, (os.cpu_count() or 1) // jobs)
+        # Write next to the output, and move it there once everything succeeded
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(output) or ".") as tmp:
+            tasks = [
+                (
+                    self.backend,
+                    self.input,
+                    [(times[s], times[e]) for s, e in chunk],
+                    os.path.join(tmp, f"{i:05d}.mp4"),
+                    dict(
+                        bitrate=self.bitrate,
+                        threads=threads,
+                        timescale=frames.timescale,
+                        frame_duration=frame_duration,
+                    ),
+                )
+                for i, chunk in enumerate(chunks)
+            ]
+            ctx = multiprocessing.get_context("spawn")
+            with ctx.Pool(
+                jobs, initializer=_init_chunk_worker, initargs=(trace.enabled(),)
+            ) as pool:
+                for events in pool.imap_unordered(_render_chunk, tasks):
+                    trace.add(events)
+
+            fragments = [(task[3], sum(e - s for s, e in task[2])) for task in tasks]
+            kept_ranges = [(times[s], times[e]) for s, e in ranges]
+            tmp_output = os.path.join(tmp, "output" + os.path.splitext(output)[1])
+            concat_fragments(self.input, fragments, kept_ranges, tmp_output)
+            os.replace(tmp_output, output)
+
+        logging.info(
+            f"Rendered {kept * frame_duration:.1f} sec in {len(chunks)} chunks "
+            f"in {time.time() - tic:.1f} sec"
+        )
+        return True
+
+
+class AudioRenderer:
+    """Cuts an audio file sample accurately with NumPy.
+
+    The input is decoded once by a streaming ffmpeg pipe. The kept samples of
+    each block are sliced out into a PCM file next to the output, while their
+    peak is tracked. They are then read back block by block, crossfaded at
+    the joins, normalized and piped into a single encoder, so the memory only
+    holds a few blocks, however long the input is.
+    """
+
+    # The same as the moviepy path
+    sample_rate = 44100
+    channels = 2
+    # Samples per channel decoded or encoded at a time
+    block_size = 2**18
+
+    def __init__(self, input: str, bitrate: str, crossfade: float = 0):
+        self.input = input
+        self.bitrate = bitrate
+        # Seconds each join fades over
+        self.crossfade = crossfade
+
+    def run(self, segments: List[SPEECH_ARRAY_INDEX], output: str):
+        # The segments are in seconds, sorted and not overlapping
+        tic = time.time()
+        sr = self.sample_rate
+        starts = np.array([round(s["start"] * sr) for s in segments], np.int64)
+        ends = np.array([round(s["end"] * sr) for s in segments], np.int64)
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(output) or ".") as tmp:
+            pcm_fn = os.path.join(tmp, "kept.pcm")
+            with trace.span("decode", file=self.input):
+                total, peak = self._gather(starts, ends, pcm_fn)
+            lengths = np.clip(ends, 0, total) - np.clip(starts, 0, total)
+            lengths = lengths[lengths > 0]
+            logging.info(
+                f"Reduced duration from {total / sr:.1f} to {lengths.sum() / sr:.1f}"
+            )
+            # Normalize the peak to full scale, like moviepy's audio_normalize
+            gain = 32767 / peak if peak else 1.0
+            tmp_output = os.path.join(tmp, "output" + os.path.splitext(output)[1])
+            with trace.span("encode", file=output, seconds=lengths.sum() / sr) as sp:
+                self._encode(pcm_fn, lengths, gain, tmp_output)
+                sp["bytes"] = os.path.getsize(tmp_output)
+            os.replace(tmp_output, output)
+        logging.info(
+            f"Cut {len(lengths)} segments of audio in {time.time() - tic:.1f} sec"
+        )
+
+    def _gather(self, starts, ends, pcm_fn) -> Tuple[int, int]:
+        # Write the kept samples to pcm_fn, returns the number of samples
+        # decoded and the peak of the kept ones
+        offset = peak = 0
+        with open(pcm_fn, "wb") as f:
+            for block in utils.iter_pcm_blocks(
+                self.input, self.sample_rate, self.block_size, channels=self.channels
+            ):
+                n = len(block)
+                # The ranges overlapping the block, in the block
+                first = np.searchsorted(ends, offset, side="right")
+                last = np.searchsorted(starts, offset + n)
+                for start, end in zip(
+                    np.clip(starts[first:last] - offset, 0, n),
+                    np.clip(ends[first:last] - offset, 0, n),
+                ):
+                    if end > start:
+                        kept = block[start:end]
+                        peak = max(peak, int(kept.max()), -int(kept.min()))
+                        f.write(kept.tobytes())
+                offset += n
+        return offset, peak
+
+    def _encode(self, pcm_fn, lengths, gain, output):
+        # Pipe the kept samples into the encoder, the last fade samples of a
+        # segment are mixed with the first ones of the next
+        fades = np.minimum(
+            round(self.crossfade * self.sample_rate),
+            np.minimum(lengths[:-1], lengths[1:]) // 2,
+        )
+        fades = np.concatenate([[0], fades, [0]])
+        positions = np.concatenate([[0], np.cumsum(lengths)])
+        frame_bytes = 2 * self.channels
+
+        def read(f, start, end):
+            f.seek(int(start) * frame_bytes)
+            pcm = np.fromfile(f, np.int16, int(end - start) * self.channels)
+            return pcm.reshape(-1, self.channels).astype(np.float32)
+
+        cmd = ["ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error", "-y"]
+        cmd += ["-f", "s16le", "-ar", str(self.sample_rate)]
+        cmd += ["-ac", str(self.channels), "-i", "pipe:", "-b:a", self.bitrate, output]
+        # stderr goes to a file, a full pipe would block ffmpeg
+        with tempfile.TemporaryFile() as stderr, open(pcm_fn, "rb") as f:
+            proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=stderr)
+
+            def write(samples):
+                samples *= gain
+                np.rint(samples, out=samples)
+                np.clip(samples, -32768, 32767, out=samples)
+                proc.stdin.write(samples.astype(np.int16).tobytes())
+
+            try:
+                for i in range(len(lengths)):
+                    start = positions[i] + fades[i]
+                    end = positions[i + 1] - fades[i + 1]
+                    for b in range(start, end, self.block_size):
+                        write(read(f, b, min(b + self.block_size, end)))
+                    fade = fades[i + 1]
+                    if fade:
+                        ramp = np.linspace(0, 1, fade, dtype=np.float32)[:, None]
+                        tail = read(f, end, positions[i + 1])
+                        head = read(f, positions[i + 1], positions[i + 1] + fade)
+                        write(tail * (1 - ramp) + head * ramp)
+                proc.stdin.close()
+            except BrokenPipeError:
+                # The encoder failed, its error is raised below
+                pass
+            except BaseException:
+                proc.kill()
+                raise
+            finally:
+                proc.wait()
+            if proc.returncode != 0:
+                stderr.seek(0)
+                raise RuntimeError(f"Failed to encode audio: {stderr.read().decode()}")
+
+
+def plan_chunks(
+    ranges: List[Tuple[int, int]], jobs: int
+) -> List[List[Tuple[int, int]]]:
+    # Deal the frame ranges [start, end) into jobs chunks of about the same
+    # number of frames, a range is split where a chunk is full
+    total = sum(e - s for s, e in ranges)
+    chunks = [[]]
+    filled = 0
+    for start, end in ranges:
+        while start < end:
+            # The frames where the current chunk is full
+            full = round(total * len(chunks) / jobs)
+            take = min(end, start + full - filled)
+            if take > start:
+                chunks[-1].append((start, take))
+                filled += take - start
+                start = take
+            if filled >= full and len(chunks) < jobs:
+                chunks.append([])
+    return [c for c in chunks if c]
+
+
+def _init_chunk_worker(tracing):
+    logging.basicConfig(
+        format="[autocut:%(processName)s:%(filename)s:L%(lineno)d] %(levelname)-6s "
+        "%(message)s",
+        level=logging.INFO,
+    )
+    if tracing:
+        trace.enable()
+
+
+def _render_chunk(task):
+    backend, input, ranges, fn, options = task
+    duration = sum(e - s for s, e in ranges)
+    with trace.span("render_chunk", file=fn, seconds=duration, backend=backend):
+        if backend == "ffmpeg":
+            _render_chunk_ffmpeg(input, ranges, fn, **options)
+        else:
+            _render_chunk_moviepy(input, ranges, fn, **options)
+    # The spans recorded here go back with the result
+    return trace.collect()
+
+
+def _render_chunk_ffmpeg(
+    input, ranges, fn, bitrate, threads, timescale, frame_duration
+):
+    # Seek a bit earlier, the frames before the seek time may or may not be
+    # decoded, and trim half a frame early, so rounding keeps the same frames
+    seek = max(0.0, ranges[0][0] - frame_duration * 1.5)
+    shift = seek + frame_duration / 2
+    graph = trim_graph([(s - shift, e - shift) for s, e in ranges], audio=False)
+    with _filter_script(graph) as script:
+        _ffmpeg(
+            ["-ss", f"{seek:.6f}", "-i", input]
+            + script
+            + ["-map", "[v]", "-c:v", "libx264", "-pix_fmt", "yuv420p"]
+            + ["-b:v", bitrate, "-threads", str(threads)]
+            + ["-video_track_timescale", str(timescale), "-f", "mp4", fn],
+            f"render {input} from {ranges[0][0]:.3f} sec",
+        )
+
+
+def _render_chunk_moviepy(
+    input, ranges, fn, bitrate, threads, timescale, frame_duration
+):
+    # The same encoding parameters as _render_chunk_ffmpeg
+    from moviepy import editor
+
+    media = editor.VideoFileClip(input, audio=False)
+    # End the clips a bit early, moviepy takes a frame more if rounding makes
+    # a clip longer than its frames
+    clips = [media.subclip(s, e - 1e-6) for s, e in ranges]
+    clip = editor.concatenate_videoclips(clips)
+    clip.write_videofile(
+        fn,
+        codec="libx264",
+        bitrate=bitrate,
+        audio=False,
+        threads=threads,
+        ffmpeg_params=["-video_track_timescale", str(timescale), "-f", "mp4"],
+        logger=None,
+    )
+    media.close()
+
+
+def trim_graph(
+    ranges: List[Tuple[float, float]],
+    video: bool = True,
+    audio: bool = True,
+    input: int = 0,
+) -> str:
+    # A filter graph cutting the ranges out of an input and joining them into
+    # [v] and [a]. The trims drop the frames before their range right away and
+    # are read one after another, so split doesn't hold back any frames
+    n = len(ranges)
+    streams = [("v", "", "split")] if video else []
+    streams += [("a", "a", "asplit")] if audio else []
+    chains = []
+    for kind, prefix, split in streams:
+        chains.append(
+            f"[{input}:{kind}:0]{split}={n}" + "".join(f"[{kind}{i}]" for i in range(n))
+        )
+        for i, (start, end) in enumerate(ranges):
+            chains.append(
+                f"[{kind}{i}]{prefix}trim=start={start:.6f}:end={end:.6f},"
+                f"{prefix}setpts=PTS-STARTPTS[{kind}{i}_cut]"
+            )
+    inputs = "".join(f"[{kind}{i}_cut]" for i in range(n) for kind, _, _ in streams)
+    outputs = "".join(f"[{kind}]" for kind, _, _ in streams)
+    chains.append(f"{inputs}concat=n={n}:v={int(video)}:a={int(audio)}{outputs}")
+    return ";".join(chains)
+
+
+def concat_fragments(
+    input: str,
+    fragments: List[Tuple[str, float]],
+    kept: List[Tuple[float, float]],
+    output: str,
+):
+    # Join the video fragments, each a file and its duration, by the concat
+    # demuxer without re-encoding, and the kept ranges of the audio of input,
+    # peak normalized
+    list_fn = os.path.join(os.path.dirname(output), "fragments.txt")
+    with open(list_fn, "w", encoding="utf-8") as f:
+        for fn, duration in fragments:
+            f.write(f"file '{os.path.basename(fn)}'\nduration {duration:.6f}\n")
+
+    args = ["-f", "concat", "-safe", "0", "-i", list_fn]
+    maps = ["-map", "0:v"]
+    graph = ""
+    if has_audio(input):
+        gain = -max_volume(input, kept)
+        graph = trim_graph(kept, video=False, input=1)
+        graph += f";[a]volume={gain:.2f}dB[out_a]"
+        args += ["-i", input]
+        maps += ["-map", "[out_a]", "-c:a", "aac", "-ar", "44100"]
+    with contextlib.ExitStack() as stack:
+        if graph:
+            args += stack.enter_context(_filter_script(graph))
+        with trace.span("concat", file=output, fragments=len(fragments)) as sp:
+            _ffmpeg(
+                args + maps + ["-c:v", "copy", "-movflags", "+faststart", output],
+                f"join the fragments of {input}",
+            )
+            sp["bytes"] = os.path.getsize(output)
+
+
+def max_volume(file: str, ranges: List[Tuple[float, float]]) -> float:
+    # The peak of the audio in the ranges in dB, to normalize it to 0 dB like
+    # moviepy's audio_normalize
+    graph = trim_graph(ranges, video=False) + ";[a]volumedetect"
+    with _filter_script(graph) as script:
+        p = subprocess.run(
+            ["ffmpeg", "-nostdin", "-hide_banner", "-i", file]
+            + script
+            + ["-f", "null", "-"],
+            capture_output=True,
+        )
+    m = re.search(rb"max_volume: (-?[\d.]+|-inf) dB", p.stderr)
+    if p.returncode != 0 or not m or m.group(1) == b"-inf":
+        return 0.0
+    return float(m.group(1))
@@ -0,0 +1,149 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Union
+
+
+class TokenBucket:
+    """Allows `rate` requests per second on average, with bursts up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def drain(self):
+        # Hold back all waiting requests, e.g. after the server asked to slow down
+        self.tokens = min(self.tokens, 0)
+
+
+class RequestScheduler:
+    """Runs blocking request functions concurrently on an asyncio loop.
+
+    Requests start no faster than `rpm` per minute. A request that fails with a
+    throttling, server or network error is retried with exponential backoff and
+    jitter, other errors are raised.
+    """
+
+    def __init__(
+        self,
+        rpm: int,
+        max_concurrency: int,
+        max_retries: int = 8,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+    ):
+        self.rpm = rpm
+        self.max_concurrency = max(1, min(max_concurrency, rpm))
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def run(
+        self,
+        fns: List[Callable[[], Any]],
+        callback: Union[Callable[[int, Any], None], None] = None,
+    ) -> List[Any]:
+        # callback(i, result) is called in the order the requests finish
+        return asyncio.run(self._run_all(fns, callback))
+
+    async def _run_all(self, fns, callback):
+        loop = asyncio.get_running_loop()
+        bucket = TokenBucket(self.rpm / 60)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        with ThreadPoolExecutor(self.max_concurrency) as executor:
+
+            async def run_one(i, fn):
+                async with semaphore:
+                    result = await self._call(loop, executor, bucket, fn)
+                if callback:
+                    callback(i, result)
+                return result
+
+            return await asyncio.gather(*[run_one(i, fn) for i, fn in enumerate(fns)])
+
+    async def _call(self, loop, executor, bucket, fn):
+        for attempt in range(self.max_retries + 1):
+            await bucket.acquire()
+            try:
+                return await loop.run_in_executor(executor, fn)
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None or attempt == self.max_retries:
+                    raise
+                if isinstance(e, urllib.error.HTTPError) and e.code == 429:
+                    bucket.drain()
+                logging.warning(f"Request failed ({e}), retry in {delay:.1f} sec")
+                await asyncio.sleep(delay)
+
+    def _retry_delay(self, e, attempt) -> Union[float, None]:
+        if isinstance(e, urllib.error.HTTPError):
+            if e.code != 429 and e.code < 500:
+                return None
+            retry_after = e.headers.get("Retry-After") if e.headers else None
+            if retry_after:
+                try:
+                    return float(retry_after)
+                except ValueError:
+                    pass
+        elif not isinstance(e, (OSError, TimeoutError)):
+            return None
+        delay = min(self.max_delay, self.base_delay * 2**attempt)
+        return delay * random.uniform(0.5, 1.0)
+
+
+class RequestJournal:
+    """Keeps the results of finished requests in a JSON file.
+
+    An interrupted run with the same options resumes from the journal instead
+    of sending the finished requests again.
+    """
+
+    def __init__(self, filename: str, options: dict):
+        self.filename = filename
+        self.options = options
+        self.results = {}
+        if os.path.exists(filename):
+            try:
+                with open(filename, encoding="utf-8") as f:
+                    data = json.load(f)
+                if data["options"] == options:
+                    self.results = data["results"]
+            except (ValueError, KeyError) as e:
+                logging.warning(f"Ignoring broken journal {filename}: {e}")
+
+    def __len__(self):
+        return len(self.results)
+
+    def get(self, key: str):
+        return self.results.get(key)
+
+    def put(self, key: str, result):
+        self.results[key] = result
+        tmp = self.filename + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"options": self.options, "results": self.results}, f)
+        os.replace(tmp, self.filename)
+
+    def remove(self):
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
@@ -0,0 +1,105 @@
+from typing import Iterable, List
+
+import numpy as np
+
+from .type import SPEECH_ARRAY_INDEX
+
+
+class SegmentSet:
+    """Segments [start, end) stored in an (n, 2) int64 array, in samples or ms.
+
+    The segments are sorted by start. The operations are vectorized and return
+    new sets, the array is never modified in place. intersect, subtract and
+    invert also expect the segments not to overlap.
+    """
+
+    def __init__(self, array=None):
+        if array is None:
+            array = np.zeros((0, 2), dtype=np.int64)
+        self.array = np.asarray(array, dtype=np.int64).reshape(-1, 2)
+
+    @classmethod
+    def from_dicts(cls, segments: Iterable[SPEECH_ARRAY_INDEX]) -> "SegmentSet":
+        return cls([(s["start"], s["end"]) for s in segments])
+
+    def to_dicts(self) -> List[SPEECH_ARRAY_INDEX]:
+        return [{"start": s, "end": e} for s, e in self.array.tolist()]
+
+    @property
+    def starts(self) -> np.ndarray:
+        return self.array[:, 0]
+
+    @property
+    def ends(self) -> np.ndarray:
+        return self.array[:, 1]
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return self.ends - self.starts
+
+    def __len__(self):
+        return len(self.array)
+
+    def __iter__(self):
+        return iter(self.array.tolist())
+
+    def __eq__(self, other):
+        return isinstance(other, SegmentSet) and np.array_equal(self.array, other.array)
+
+    def __repr__(self):
+        return f"SegmentSet({self.array.tolist()})"
+
+    def filter(self, min_length) -> "SegmentSet":
+        # Remove segments whose length <= min_length
+        return SegmentSet(self.array[self.lengths > min_length])
+
+    def expand(self, head, tail, total_length) -> "SegmentSet":
+        # Pad head and tail for each segment, without crossing the neighbors
+        prev_ends = np.concatenate([[0], self.ends[:-1]])
+        next_starts = np.concatenate([self.starts[1:], [total_length]])
+        return SegmentSet(
+            np.stack(
+                [
+                    np.maximum(self.starts - int(head), prev_ends),
+                    np.minimum(self.ends + int(tail), next_starts),
+                ],
+                axis=1,
+            )
+        )
+
+    def merge(self, gap) -> "SegmentSet":
+        # Merge a segment into the previous one if it starts less than gap after it
+        if len(self) == 0:
+            return self
+        breaks = self.starts[1:] >= self.ends[:-1] + gap
+        first = np.concatenate([[True], breaks])
+        last = np.concatenate([breaks, [True]])
+        return SegmentSet(np.stack([self.starts[first], self.ends[last]], axis=1))
+
+    def invert(self, total_length) -> "SegmentSet":
+        # The gaps in [0, total_length)
+        starts = np.concatenate([[0], self.ends])
+        ends = np.concatenate([self.starts, [total_length]])
+        keep = ends > starts
+        return SegmentSet(np.stack([starts[keep], ends[keep]], axis=1))
+
+    def intersect(self, other: "SegmentSet") -> "SegmentSet":
+        # Sweep over all boundaries, a point is covered by both sets when the
+        # count of open segments is 2. Ends sort before starts at the same point
+        points = np.concatenate([self.starts, other.starts, self.ends, other.ends])
+        n = len(self) + len(other)
+        deltas = np.concatenate([np.ones(n, np.int64), -np.ones(n, np.int64)])
+        order = np.lexsort((deltas, points))
+        points = points[order]
+        covered = np.cumsum(deltas[order]) == 2
+        # A covered run starts at an event that enters it and ends at the next one
+        starts = points[:-1][covered[:-1]]
+        ends = points[1:][covered[:-1]]
+        keep = ends > starts
+        return SegmentSet(np.stack([starts[keep], ends[keep]], axis=1))
+
+    def subtract(self, other: "SegmentSet") -> "SegmentSet":
+        if len(self) == 0:
+            return self
+        total_length = max(self.ends.max(), other.ends.max() if len(other) else 0)
+        return self.intersect(other.invert(total_length))
@@ -0,0 +1,97 @@
+import contextlib
+import json
+import os
+import threading
+import time
+from typing import Iterator, List, Union
+
+# The recorded events, None while tracing is off, so a span costs next to nothing
+_events: Union[List[dict], None] = None
+_lock = threading.Lock()
+_named_threads = set()
+
+
+def enable():
+    global _events
+    if _events is None:
+        _events = []
+
+
+def enabled() -> bool:
+    return _events is not None
+
+
+@contextlib.contextmanager
+def span(name: str, **attrs) -> Iterator[dict]:
+    """Record the time spent in the block as a span of the Chrome trace format.
+
+    Spans nest by time, per thread. The keyword arguments, and what the block
+    adds to the yielded dict, such as counts known at the end, become the
+    attributes of the span.
+    """
+    if _events is None:
+        yield attrs
+        return
+    start = time.time()
+    try:
+        yield attrs
+    except BaseException as e:
+        attrs["error"] = repr(e)
+        raise
+    finally:
+        _add_span(name, start, time.time(), attrs)
+
+
+def _add_span(name, start, end, attrs):
+    pid, thread = os.getpid(), threading.current_thread()
+    with _lock:
+        if (pid, thread.ident) not in _named_threads:
+            _named_threads.add((pid, thread.ident))
+            _events.append(
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": pid,
+                    "tid": thread.ident,
+                    "args": {"name": thread.name},
+                }
+            )
+        _events.append(
+            {
+                "name": name,
+                "cat": "autocut",
+                "ph": "X",
+                # In microseconds since the epoch, so that the spans of
+                # different processes line up
+                "ts": int(start * 1e6),
+                "dur": int((end - start) * 1e6),
+                "pid": pid,
+                "tid": thread.ident,
+                "args": attrs,
+            }
+        )
+
+
+def collect() -> List[dict]:
+    # Take the events recorded so far, e.g. to send them from a worker process
+    # to the main one, which adds them
+    if _events is None:
+        return []
+    with _lock:
+        events = _events[:]
+        _events.clear()
+    return events
+
+
+def add(events: List[dict]):
+    if _events is not None:
+        with _lock:
+            _events.extend(events)
+
+
+def save(filename: str):
+    # Open it in https://ui.perfetto.dev or chrome://tracing
+    with _lock:
+        events = list(_events or [])
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, default=str)
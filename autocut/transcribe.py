@@ -1,123 +1,528 @@
+import collections
+import copy
+import datetime
 import logging
+import multiprocessing
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Any
 
 import numpy as np
-import srt
-import torch
 
-from . import utils, whisper_model
+from . import pipeline, trace, utils, vad, whisper_model
+from .cache import TranscribeCache
+from .scheduler import RequestJournal
+from .segments import SegmentSet
 from .type import WhisperMode, SPEECH_ARRAY_INDEX
 
 
 class Transcribe:
+    # Post-processing of the VAD results, in seconds
+    vad_min_speech = 1.0
+    vad_pad = 0.2
+    vad_merge_gap = 0.5
+    vad_block_seconds = 600
+    # The block size with --pipeline, small so that transcribing starts early
+    pipeline_block_seconds = 30
+    # run_incremental decodes from this long before the transcribed part, and
+    # leaves speeches ending this close to the end for the next call
+    incremental_overlap = 5.0
+    incremental_guard = 2.0
+    # run_live reads the stream in blocks of this length, silero splits more
+    # speeches at the block boundaries if it's shorter. A speech going on for
+    # longer than live_max_seconds is transcribed in parts
+    live_block_seconds = 2.0
+    live_max_seconds = 30.0
+
     def __init__(self, args):
         self.args = args
         self.sampling_rate = 16000
         self.whisper_model = None
         self.vad_model = None
-        self.detect_speech = None
+        # Seconds spent in each stage, over all inputs
+        self.stage_times = collections.Counter()
+        self.cache = (
+            TranscribeCache(self.args.cache_dir, self.args.cache_size * 2**20)
+            if self.args.cache_dir
+            else None
+        )
 
         tic = time.time()
-        if self.whisper_model is None:
-            if self.args.whisper_mode == WhisperMode.WHISPER.value:
-                self.whisper_model = whisper_model.WhisperModel(self.sampling_rate)
-                self.whisper_model.load(self.args.whisper_model, self.args.device)
-            elif self.args.whisper_mode == WhisperMode.OPENAI.value:
-                self.whisper_model = whisper_model.OpenAIModel(
-                    self.args.openai_rpm, self.sampling_rate
-                )
-                self.whisper_model.load()
-            elif self.args.whisper_mode == WhisperMode.FASTER.value:
-                self.whisper_model = whisper_model.FasterWhisperModel(
-                    self.sampling_rate
-                )
-                self.whisper_model.load(self.args.whisper_model, self.args.device)
+        if self.args.whisper_mode == WhisperMode.WHISPER.value:
+            model_name = self.args.whisper_model
+            options = dict(
+                num_workers=self.args.cpu_workers, num_threads=self.args.cpu_threads
+            )
+        elif self.args.whisper_mode == WhisperMode.OPENAI.value:
+            model_name = "whisper-1"
+            options = dict(rpm=self.args.openai_rpm)
+        elif self.args.whisper_mode == WhisperMode.FASTER.value:
+            model_name = self.args.whisper_model
+            options = dict(
+                compute_type=self.args.compute_type,
+                num_workers=self.args.cpu_workers,
+                cpu_threads=self.args.cpu_threads,
+                batch_size=self.args.batch_size,
+            )
+        # Loaded models are kept in a registry, so a new Transcribe with the same
+        # configuration, e.g. for each file found by the daemon, is cheap
+        with trace.span("load_model", mode=self.args.whisper_mode, model=model_name):
+            self.whisper_model = whisper_model.get_model(
+                self.args.whisper_mode,
+                model_name,
+                self.args.device,
+                self.sampling_rate,
+                **options,
+            )
         logging.info(f"Done Init model in {time.time() - tic:.1f} sec")
 
     def run(self):
+        inputs = [
+            input
+            for input in self.args.inputs
+            if not utils.is_live(input)
+            and not utils.check_exists(
+                os.path.splitext(input)[0] + ".md", self.args.force
+            )
+        ]
+        # Decode and VAD the next inputs on a background thread while the model
+        # transcribes the current one. They are decoded into PCM sidecars, so the
+        # memory doesn't grow with the lookahead
+        tic = time.time()
+        executor = ThreadPoolExecutor(1)
+        prefetched = collections.deque()
+        prepared = None
+        try:
+            for i, input in enumerate(inputs):
+                # Keep the current input and the next ones up to the lookahead
+                # submitted, an input is decoded ahead if j > i
+                for j in range(
+                    i + len(prefetched), min(i + self.args.prefetch + 1, len(inputs))
+                ):
+                    prefetched.append(executor.submit(self._prepare, inputs[j], j > i))
+                t = time.time()
+                with trace.span("wait_prefetch", file=input):
+                    prepared = prefetched.popleft().result()
+                self.stage_times["wait"] += time.time() - t
+
+                logging.info(f"Transcribing {input}")
+                name, _ = os.path.splitext(input)
+                output = name + ".srt"
+                with trace.span("transcribe_file", file=input):
+                    self._write_outputs(input, output, name + ".md", prepared)
+                logging.info(f"Transcribed {input} to {output}")
+                logging.info(f'Saved texts to {name + ".md"} to mark sentences')
+        finally:
+            executor.shutdown(cancel_futures=True)
+            # Drop the maps of the sidecars, Windows can't remove a mapped file
+            prefetched.clear()
+            prepared = None
+            # The sidecars take about 115 MB per hour of audio
+            if not self.args.keep_pcm:
+                for input in inputs:
+                    utils.remove_pcm(input)
+
+        if len(inputs) > 1:
+            t = self.stage_times
+            overlap = max(t["decode"] + t["vad"] - t["wait"], 0)
+            logging.info(
+                f"Done {len(inputs)} files in {time.time() - tic:.1f} sec, "
+                f"decoding {t['decode']:.1f} sec, VAD {t['vad']:.1f} sec, "
+                f"transcription {t['transcribe']:.1f} sec, waiting for prefetching "
+                f"{t['wait']:.1f} sec, {overlap:.1f} sec overlapped"
+            )
+
         for input in self.args.inputs:
-            logging.info(f"Transcribing {input}")
-            name, _ = os.path.splitext(input)
-            if utils.check_exists(name + ".md", self.args.force):
-                continue
+            if utils.is_live(input):
+                self.run_live(input)
 
-            audio = utils.load_audio(input, sr=self.sampling_rate)
-            speech_array_indices = self._detect_voice_activity(audio)
-            transcribe_results = self._transcribe(input, audio, speech_array_indices)
+    def run_live(self, input: str):
+        """Transcribe a live stream, e.g. stdin, a named pipe or a stream URL.
 
-            output = name + ".srt"
-            self._save_srt(output, transcribe_results)
-            logging.info(f"Transcribed {input} to {output}")
-            self._save_md(name + ".md", output, input)
-            logging.info(f'Saved texts to {name + ".md"} to mark sentences')
+        Each speech is transcribed once VAD finds its end, and its subtitles are
+        appended to the .srt and .md right away. The outputs of stdin or a URL
+        are named after the current time.
+        """
+        if os.path.exists(input):
+            name = os.path.splitext(input)[0]
+        else:
+            name = datetime.datetime.now().strftime("live-%Y%m%d-%H%M%S")
+        srt_fn, md_fn = name + ".srt", name + ".md"
+        if utils.check_exists(md_fn, self.args.force):
+            return
+        md = utils.MD(md_fn, self.args.encoding)
+        md.clear()
+        self._add_md_header(md, srt_fn, input)
+        md.write()
+        with open(srt_fn, "wb"):
+            pass
+        srt_writer = utils.SRTWriter(srt_fn, self.args.encoding, append=True)
 
-    def _detect_voice_activity(self, audio) -> List[SPEECH_ARRAY_INDEX]:
-        """Detect segments that have voice activities"""
-        if self.args.vad == "0":
-            return [{"start": 0, "end": len(audio)}]
+        def on_speeches(audio, base, speeches):
+            t = time.time()
+            # The openai mode keeps its request journal in name + ".openai.json"
+            res = self._transcribe(name, audio, speeches)
+            shift = datetime.timedelta(seconds=base / self.sampling_rate)
+            subs = []
+            for sub in self.whisper_model.gen_srt(res):
+                sub.start += shift
+                sub.end += shift
+                subs.append(sub)
+            subs = self._append_subs(srt_writer, md, subs)
+            if subs:
+                logging.info(
+                    f"Appended {len(subs)} subtitles up to {subs[-1].end} in "
+                    f"{time.time() - t:.1f} sec"
+                )
 
+        sr = self.sampling_rate
+        segmenter = pipeline.LiveSegmenter(
+            self._get_vad_model(),
+            int(self.vad_min_speech * sr),
+            int(self.vad_pad * sr),
+            int(self.live_max_seconds * sr),
+            on_speeches,
+        )
+        logging.info(f"Transcribing live stream {input} to {srt_fn}")
         tic = time.time()
-        if self.vad_model is None or self.detect_speech is None:
-            # torch load limit https://github.com/pytorch/vision/issues/4156
-            torch.hub._validate_not_a_forked_repo = lambda a, b, c: True
-            self.vad_model, funcs = torch.hub.load(
-                repo_or_dir="snakers4/silero-vad", model="silero_vad", trust_repo=True
+        try:
+            segmenter.run(
+                pipeline.iter_threaded(
+                    utils.iter_audio_blocks(
+                        input, sr, int(self.live_block_seconds * sr)
+                    )
+                )
             )
+        finally:
+            srt_writer.close()
+        logging.info(
+            f"Done live stream {input}, "
+            f"{segmenter.num_samples / sr:.1f} sec audio in {time.time() - tic:.1f} sec"
+        )
 
-            self.detect_speech = funcs[0]
+    def run_incremental(self, input: str) -> bool:
+        """Transcribe the audio added to a growing recording since the last call.
 
-        speeches = self.detect_speech(
-            audio, self.vad_model, sampling_rate=self.sampling_rate
+        The new subtitles are appended to the .srt and .md, numbered after the
+        existing ones. Only speeches followed by some silence are transcribed, the
+        rest waits for the next call. Returns True once the recording stopped
+        growing since the last call and is fully transcribed.
+        """
+        name, _ = os.path.splitext(input)
+        srt_fn, md_fn = name + ".srt", name + ".md"
+        # A new journal, e.g. with other options, starts over from the beginning
+        journal = RequestJournal(input + ".incremental.json", self._cache_options())
+        progress = journal.get("progress")
+        size = os.path.getsize(input)
+        if progress is None:
+            progress = {"offset": 0.0, "index": 1, "size": None, "done": False}
+            with open(srt_fn, "wb"):
+                pass
+            md = utils.MD(md_fn, self.args.encoding)
+            md.clear()
+            self._add_md_header(md, srt_fn, input)
+            md.write()
+        elif progress["size"] == size and progress["done"]:
+            return True
+        final = progress["size"] == size
+
+        # Decode from a bit before the transcribed part, so VAD sees the context
+        tic = time.time()
+        start = max(progress["offset"] - self.incremental_overlap, 0)
+        with trace.span("decode", file=input, bytes=size, start=start):
+            audio = utils.load_audio(input, self.sampling_rate, start)
+        logging.info(
+            f"Done loading {len(audio) / self.sampling_rate:.1f} sec audio from "
+            f"{start:.1f} sec in {time.time() - tic:.1f} sec"
         )
 
-        # Remove too short segments
-        speeches = utils.remove_short_segments(speeches, 1.0 * self.sampling_rate)
+        # In samples from start. A speech ending within the guard may go on
+        offset = int((progress["offset"] - start) * self.sampling_rate)
+        limit = len(audio)
+        if not final:
+            limit -= int(self.incremental_guard * self.sampling_rate)
+        speeches, pending = [], None
+        if limit > offset:
+            detected = self._detect_voice_activity(audio)
+            # Without VAD, or with at most one speech found, the whole audio is
+            # one speech that never ends, it's transcribed up to the limit
+            whole = detected == [{"start": 0, "end": len(audio)}]
+            for s in detected:
+                if s["end"] <= offset:
+                    continue
+                s = {"start": max(s["start"], offset), "end": s["end"]}
+                if s["end"] > limit:
+                    if not whole:
+                        pending = s
+                        break
+                    s["end"] = limit
+                speeches.append(s)
 
-        # Expand to avoid to tight cut. You can tune the pad length
-        speeches = utils.expand_segments(
-            speeches, 0.2 * self.sampling_rate, 0.0 * self.sampling_rate, audio.shape[0]
+        subs = []
+        if speeches:
+            res = self._transcribe(input, audio, speeches)
+            shift = datetime.timedelta(seconds=start)
+            transcribed = datetime.timedelta(seconds=progress["offset"])
+            for sub in self.whisper_model.gen_srt(res):
+                sub.start = max(sub.start + shift, transcribed)
+                sub.end += shift
+                subs.append(sub)
+            srt_writer = utils.SRTWriter(
+                srt_fn, self.args.encoding, progress["index"], append=True
+            )
+            try:
+                subs = self._append_subs(
+                    srt_writer, utils.MD(md_fn, self.args.encoding), subs
+                )
+            finally:
+                srt_writer.close()
+
+        if pending:
+            offset = pending["start"]
+        else:
+            offset = max(limit, offset)
+        journal.put(
+            "progress",
+            {
+                "offset": start + offset / self.sampling_rate,
+                "index": progress["index"] + len(subs),
+                "size": size,
+                "done": final,
+            },
+        )
+        logging.info(
+            f"Appended {len(subs)} subtitles of {input}, transcribed up to "
+            f"{start + offset / self.sampling_rate:.1f} sec"
         )
+        return final
 
-        # Merge very closed segments
-        speeches = utils.merge_adjacent_segments(speeches, 0.5 * self.sampling_rate)
+    def _pipelined(self):
+        return (
+            self.args.pipeline
+            and self.args.vad != "0"
+            and self.args.whisper_mode != WhisperMode.OPENAI.value
+        )
 
-        logging.info(f"Done voice activity detection in {time.time() - tic:.1f} sec")
+    def _prepare(self, input, decode=True):
+        # Decode, look up the cache and run VAD, which can run ahead of the
+        # transcription. With --pipeline, an input that isn't prefetched is
+        # decoded while transcribing instead, and VAD always runs then
+        tic = time.time()
+        if self._pipelined() and not decode:
+            audio = utils.open_pcm(input, self.sampling_rate)
+        else:
+            # Decode once into a PCM sidecar, all later stages map it and read it
+            # in blocks, so the memory usage doesn't grow with the length
+            with trace.span("decode", file=input, bytes=os.path.getsize(input)) as sp:
+                audio = utils.load_pcm(input, self.sampling_rate)
+                sp["audio_seconds"] = len(audio) / self.sampling_rate
+            logging.info(f"Done loading audio in {time.time() - tic:.1f} sec")
+
+        prepared = {"audio": audio, "key": None, "results": None, "speeches": None}
+        if self.cache and audio is not None:
+            prepared["key"] = self.cache.key(audio, **self._cache_options())
+            prepared["results"] = self.cache.get(prepared["key"])
+        self.stage_times["decode"] += time.time() - tic
+        if prepared["results"] is not None:
+            logging.info(f"Loaded transcribe results of {input} from cache")
+        elif not self._pipelined():
+            tic = time.time()
+            prepared["speeches"] = self._detect_voice_activity(audio)
+            self.stage_times["vad"] += time.time() - tic
+        return prepared
+
+    def _write_outputs(self, input, srt_fn, md_fn, prepared):
+        # The subtitles and their tasks are appended to the .srt and .md as the
+        # results come in, the md is made from them without reading the .srt
+        srt_writer = utils.SRTWriter(srt_fn, self.args.encoding)
+        md = utils.MD(md_fn, self.args.encoding)
+        md.clear()
+        self._add_md_header(md, srt_fn, input)
+        md.open()
+        prev_end = None
+
+        def on_result(result):
+            nonlocal prev_end
+            with trace.span("write_srt_md", file=srt_fn) as sp:
+                subs = self.whisper_model.gen_srt([result], prev_end)
+                if subs:
+                    prev_end = subs[-1].end.total_seconds()
+                self._add_md_tasks(md, srt_writer.add(subs))
+                sp["subtitles"] = len(subs)
+
+        self._get_transcribe_results(input, prepared, on_result)
+        srt_writer.close()
+        md.close()
+
+    def _get_transcribe_results(self, input, prepared=None, callback=None):
+        # callback is called with each result in order once it's ready
+        if prepared is None:
+            prepared = self._prepare(input, decode=False)
+        if prepared["results"] is not None:
+            if callback:
+                for r in prepared["results"]:
+                    callback(r)
+            return prepared["results"]
+
+        tic = time.time()
+        if prepared["speeches"] is None:
+            transcribe_results = self._transcribe_pipelined(input, callback)
+        else:
+            transcribe_results = self._transcribe(
+                input, prepared["audio"], prepared["speeches"], callback
+            )
+        self.stage_times["transcribe"] += time.time() - tic
+
+        if self.cache:
+            key = prepared["key"]
+            if key is None:
+                audio = utils.open_pcm(input, self.sampling_rate)
+                key = self.cache.key(audio, **self._cache_options())
+            self.cache.put(key, transcribe_results)
+        return transcribe_results
+
+    def _cache_options(self):
+        options = {
+            "whisper_mode": self.args.whisper_mode,
+            "whisper_model": self.args.whisper_model,
+            "device": self.args.device,
+            "lang": self.args.lang,
+            "prompt": self.args.prompt,
+            "vad": self.args.vad,
+            "vad_backend": self.args.vad_backend,
+            "vad_model": self.args.vad_model,
+            "vad_params": [
+                self.vad_min_speech,
+                self.vad_pad,
+                self.vad_merge_gap,
+                self.vad_block_seconds,
+            ],
+            "window_seconds": self.whisper_model.window_seconds,
+            "pack_gap_seconds": self.whisper_model.pack_gap_seconds,
+        }
+        # The quantization and the batching of faster-whisper change the results
+        if self.args.whisper_mode == WhisperMode.FASTER.value:
+            options["compute_type"] = self.args.compute_type
+            options["batch_size"] = self.args.batch_size
+        return options
+
+    def _get_vad_model(self):
+        if self.vad_model is None:
+            self.vad_model = vad.get_vad(
+                self.args.vad_backend, self.args.vad_model, self.sampling_rate
+            )
+        return self.vad_model
+
+    def _detect_voice_activity(self, audio) -> List[SPEECH_ARRAY_INDEX]:
+        """Detect segments that have voice activities"""
+        if self.args.vad == "0":
+            return [{"start": 0, "end": len(audio)}]
+
+        speeches = vad.detect_speech(
+            self._get_vad_model(), audio, self.vad_block_seconds
+        )
+
+        speeches = self._postprocess(speeches, len(audio))
         return speeches if len(speeches) > 1 else [{"start": 0, "end": len(audio)}]
 
+    def _postprocess(self, speeches, total_length) -> List[SPEECH_ARRAY_INDEX]:
+        return (
+            SegmentSet.from_dicts(speeches)
+            # Remove too short segments
+            .filter(self.vad_min_speech * self.sampling_rate)
+            # Expand to avoid to tight cut. You can tune the pad length
+            .expand(self.vad_pad * self.sampling_rate, 0, total_length)
+            # Merge very closed segments
+            .merge(self.vad_merge_gap * self.sampling_rate).to_dicts()
+        )
+
     def _transcribe(
         self,
         input: str,
         audio: np.ndarray,
         speech_array_indices: List[SPEECH_ARRAY_INDEX],
+        callback=None,
     ) -> List[Any]:
         tic = time.time()
-        res = (
-            self.whisper_model.transcribe(
-                audio, speech_array_indices, self.args.lang, self.args.prompt
-            )
-            if self.args.whisper_mode == WhisperMode.WHISPER.value
-            or self.args.whisper_mode == WhisperMode.FASTER.value
-            else self.whisper_model.transcribe(
-                input, audio, speech_array_indices, self.args.lang, self.args.prompt
+        with trace.span(
+            "transcribe",
+            file=input,
+            segments=len(speech_array_indices),
+            audio_seconds=len(audio) / self.sampling_rate,
+        ):
+            res = (
+                self.whisper_model.transcribe(
+                    audio,
+                    speech_array_indices,
+                    self.args.lang,
+                    self.args.prompt,
+                    callback=callback,
+                )
+                if self.args.whisper_mode == WhisperMode.WHISPER.value
+                or self.args.whisper_mode == WhisperMode.FASTER.value
+                else self.whisper_model.transcribe(
+                    input,
+                    audio,
+                    speech_array_indices,
+                    self.args.lang,
+                    self.args.prompt,
+                    callback=callback,
+                )
             )
-        )
 
-        logging.info(f"Done transcription in {time.time() - tic:.1f} sec")
+        elapsed = time.time() - tic
+        logging.info(
+            f"Done transcription in {elapsed:.1f} sec, "
+            f"real-time factor {elapsed / max(len(audio) / self.sampling_rate, 1e-3):.3f}"
+        )
         return res
 
-    def _save_srt(self, output, transcribe_results):
-        subs = self.whisper_model.gen_srt(transcribe_results)
-        with open(output, "wb") as f:
-            f.write(srt.compose(subs).encode(self.args.encoding, "replace"))
+    def _transcribe_pipelined(self, input: str, callback=None) -> List[Any]:
+        # Decode and VAD run on a producer thread, the speech windows are
+        # transcribed as soon as they are found
+        tic = time.time()
+        producer = pipeline.SpeechProducer(
+            input,
+            self._get_vad_model(),
+            self.vad_min_speech,
+            self.vad_pad,
+            self.vad_merge_gap,
+            self.whisper_model.window_seconds,
+            self.whisper_model.pack_gap_seconds,
+            self.pipeline_block_seconds,
+        )
+        producer.start()
+        res = []
+        transcribe_time = 0
+        try:
+            for windows in producer.batches():
+                if not res:
+                    logging.info(
+                        f"First speech window ready in {time.time() - tic:.1f} sec"
+                    )
+                t = time.time()
+                with trace.span("transcribe", file=input, segments=len(windows)):
+                    res += self.whisper_model.transcribe(
+                        producer.audio(),
+                        windows,
+                        self.args.lang,
+                        self.args.prompt,
+                        callback=callback,
+                    )
+                transcribe_time += time.time() - t
+        finally:
+            producer.close()
 
-    def _save_md(self, md_fn, srt_fn, video_fn):
-        with open(srt_fn, encoding=self.args.encoding) as f:
-            subs = srt.parse(f.read())
+        elapsed = time.time() - tic
+        logging.info(
+            f"Done pipelined transcription in {elapsed:.1f} sec, transcribing took "
+            f"{transcribe_time:.1f} sec, real-time factor "
+            f"{elapsed / max(producer.num_samples / self.sampling_rate, 1e-3):.3f}"
+        )
+        return res
 
-        md = utils.MD(md_fn, self.args.encoding)
-        md.clear()
+    def _add_md_header(self, md, srt_fn, video_fn):
         md.add_done_editing(False)
         md.add_video(os.path.basename(video_fn))
         md.add(
@@ -126,8 +531,102 @@ class Transcribe:
             "The format is [subtitle_index,duration_in_second] subtitle context.\n\n"
         )
 
+    def _append_subs(self, srt_writer, md, subs):
+        # Append the subtitles to the .srt and their tasks to the .md of a live
+        # stream or a growing recording, both are complete after each call.
+        # Returns the subtitles written, numbered after the ones before
+        subs = srt_writer.add(subs)
+        self._add_md_tasks(md, subs)
+        md.write()
+        return subs
+
+    def _add_md_tasks(self, md, subs):
         for s in subs:
             sec = s.start.seconds
             pre = f"[{s.index},{sec // 60:02d}:{sec % 60:02d}]"
             md.add_task(False, f"{pre:11} {s.content.strip()}")
-        md.write()
+
+
+def run_jobs(args):
+    """Transcribe the inputs in args.jobs processes, each one holding a model
+    replica and an even share of the cores.
+
+    The longest inputs are scheduled first, so that the processes finish at
+    about the same time. Every input is transcribed by Transcribe.run as in the
+    serial path.
+    """
+    live = [input for input in args.inputs if utils.is_live(input)]
+    if live:
+        # Live streams come in real time, transcribe them in this process after
+        # the files
+        files = copy.copy(args)
+        files.inputs = [input for input in args.inputs if input not in live]
+        run_jobs(files)
+        args = copy.copy(args)
+        args.inputs = live
+        Transcribe(args).run()
+        return
+
+    inputs = [
+        input
+        for input in args.inputs
+        if not utils.check_exists(os.path.splitext(input)[0] + ".md", args.force)
+    ]
+    if not inputs:
+        return
+    durations = {input: utils.get_duration(input) or 0 for input in inputs}
+    inputs.sort(key=lambda input: durations[input], reverse=True)
+
+    jobs = min(args.jobs, len(inputs))
+    cpus = os.cpu_count() or 1
+    ctx = multiprocessing.get_context("spawn")
+    # Each worker takes one from the queue, the remainder goes to the first ones
+    threads = ctx.Queue()
+    for i in range(jobs):
+        threads.put(max(1, cpus // jobs + (i < cpus % jobs)))
+    logging.info(f"Transcribing {len(inputs)} files with {jobs} jobs")
+
+    tic = time.time()
+    with ctx.Pool(jobs, initializer=_init_job, initargs=(args, threads)) as pool:
+        for input, elapsed, events in pool.imap_unordered(_run_job, inputs):
+            logging.info(f"Done {input} in {elapsed:.1f} sec")
+            trace.add(events)
+    elapsed = time.time() - tic
+    hours = sum(durations.values()) / 3600
+    logging.info(
+        f"Done {len(inputs)} files, {hours:.2f} hours of audio in {elapsed:.1f} sec, "
+        f"{hours * 3600 / max(elapsed, 1e-3):.1f} audio hours per hour"
+    )
+
+
+# The Transcribe held by each process of run_jobs
+_job_transcribe = None
+
+
+def _init_job(args, threads):
+    global _job_transcribe
+    import torch
+
+    logging.basicConfig(
+        format="[autocut:%(processName)s:%(filename)s:L%(lineno)d] %(levelname)-6s "
+        "%(message)s",
+        level=logging.INFO,
+    )
+    num_threads = threads.get()
+    torch.set_num_threads(num_threads)
+    args = copy.copy(args)
+    args.cpu_workers = 1
+    args.cpu_threads = num_threads
+    # The inputs are handed out one by one
+    args.prefetch = 0
+    if args.trace:
+        trace.enable()
+    _job_transcribe = Transcribe(args)
+
+
+def _run_job(input):
+    tic = time.time()
+    _job_transcribe.args.inputs = [input]
+    with trace.span("job", file=input):
+        _job_transcribe.run()
+    return input, time.time() - tic, trace.collect()
@@ -1,24 +1,239 @@
+import functools
 import logging
 import os
 import re
+import stat
+import struct
+import subprocess
+import tempfile
+from typing import Iterator, List, Union
 
-import ffmpeg
 import numpy as np
-import opencc
 import srt
 
 
-def load_audio(file: str, sr: int = 16000) -> np.ndarray:
+def iter_pcm_blocks(
+    file: str,
+    sr: int = 16000,
+    block_size: int = 2**20,
+    start: float = 0,
+    channels: int = 1,
+) -> Iterator[np.ndarray]:
+    # Decode a media file into 16-bit mono PCM blocks of block_size samples,
+    # seeking to start seconds first. With more channels, the blocks are of
+    # shape (samples, channels). The same buffer is reused for every block,
+    # copy it if you need to keep it.
+    import ffmpeg
+
+    cmd = (
+        ffmpeg.input(file, threads=0, **({"ss": start} if start else {}))
+        .output("-", format="s16le", acodec="pcm_s16le", ac=channels, ar=sr)
+        .compile(cmd=["ffmpeg", "-nostdin"])
+    )
+    # stderr goes to a file, a full pipe would block ffmpeg on long inputs
+    with tempfile.TemporaryFile() as stderr:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr)
+        buf = np.empty(block_size * channels, np.int16)
+        view = memoryview(buf).cast("B")
+        try:
+            while True:
+                read = 0
+                while read < len(view):
+                    r = proc.stdout.readinto(view[read:])
+                    if not r:
+                        break
+                    read += r
+                n = read // (2 * channels)
+                if n:
+                    block = buf[: n * channels]
+                    yield block.reshape(-1, channels) if channels > 1 else block
+                if read < len(view):
+                    break
+        except BaseException:
+            proc.kill()
+            raise
+        finally:
+            proc.stdout.close()
+            proc.wait()
+        if proc.returncode != 0:
+            stderr.seek(0)
+            raise RuntimeError(f"Failed to load audio: {stderr.read().decode()}")
+
+
+def iter_audio_blocks(
+    file: str, sr: int = 16000, block_size: int = 2**20
+) -> Iterator[np.ndarray]:
+    # The float32 version of iter_pcm_blocks, also with a reused buffer
+    buf = np.empty(block_size, np.float32)
+    for pcm in iter_pcm_blocks(file, sr, block_size):
+        out = buf[: len(pcm)]
+        np.divide(pcm, 32768.0, out=out, dtype=np.float32)
+        yield out
+
+
+def load_audio(file: str, sr: int = 16000, start: float = 0) -> np.ndarray:
+    pcm = [b.copy() for b in iter_pcm_blocks(file, sr, start=start)]
+    audio = np.empty(sum(len(b) for b in pcm), np.float32)
+    i = 0
+    for b in pcm:
+        np.divide(b, 32768.0, out=audio[i : i + len(b)], dtype=np.float32)
+        i += len(b)
+    return audio
+
+
+class PCMAudio:
+    """16-bit mono PCM audio stored in a file, mapped with np.memmap.
+
+    It can be used in place of a float32 array by the VAD and the whisper
+    models. Slicing only converts the requested samples, so the audio never
+    needs to be fully loaded into memory. Pickling only sends the filename,
+    processes map the same file instead of holding private copies.
+    """
+
+    def __init__(self, filename: str, sr: int = 16000, offset: int = 0):
+        self.filename = filename
+        self.sr = sr
+        self.offset = offset
+        if os.path.getsize(filename) > offset:
+            self.pcm = np.memmap(filename, np.int16, mode="r", offset=offset)
+        else:
+            # np.memmap refuses to map an empty file
+            self.pcm = np.zeros(0, np.int16)
+        self.shape = self.pcm.shape
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key: slice) -> np.ndarray:
+        return np.divide(self.pcm[key], 32768.0, dtype=np.float32)
+
+    def __reduce__(self):
+        return PCMAudio, (self.filename, self.sr, self.offset)
+
+
+def iter_decode_pcm(
+    file: str,
+    pcm_fn: str,
+    sr: int = 16000,
+    header: bytes = b"",
+    block_size: int = 2**20,
+) -> Iterator[np.ndarray]:
+    # Decode a media file into a PCM file, yield every int16 block once it is
+    # written, so the file can be mapped up to the end of the block
+    with open(pcm_fn, "wb") as f:
+        f.write(header)
+        for block in iter_pcm_blocks(file, sr, block_size):
+            f.write(block)
+            f.flush()
+            yield block
+
+
+def decode_to_pcm(
+    file: str, pcm_fn: str, sr: int = 16000, header: bytes = b""
+) -> PCMAudio:
+    # Decode a media file into a PCM file block by block
+    for _ in iter_decode_pcm(file, pcm_fn, sr, header):
+        pass
+    return PCMAudio(pcm_fn, sr, len(header))
+
+
+# The header of a PCM sidecar records the source it was decoded from
+PCM_SIDECAR_MAGIC = b"AUTOCUT1"
+PCM_SIDECAR_HEADER_SIZE = 64
+
+
+def pcm_sidecar_header(file: str, sr: int = 16000) -> bytes:
+    st = os.stat(file)
+    return struct.pack(
+        "<8sIqq", PCM_SIDECAR_MAGIC, sr, st.st_size, st.st_mtime_ns
+    ).ljust(PCM_SIDECAR_HEADER_SIZE, b"\0")
+
+
+def open_pcm(file: str, sr: int = 16000) -> Union[PCMAudio, None]:
+    # Map the PCM sidecar of a media file, None if it's missing or outdated
+    pcm_fn = file + ".pcm"
+    header = pcm_sidecar_header(file, sr)
     try:
-        out, _ = (
-            ffmpeg.input(file, threads=0)
-            .output("-", format="s16le", acodec="pcm_s16le", ac=1, ar=sr)
-            .run(cmd=["ffmpeg", "-nostdin"], capture_stdout=True, capture_stderr=True)
-        )
-    except ffmpeg.Error as e:
-        raise RuntimeError(f"Failed to load audio: {e.stderr.decode()}") from e
+        with open(pcm_fn, "rb") as f:
+            if f.read(len(header)) == header:
+                return PCMAudio(pcm_fn, sr, len(header))
+    except FileNotFoundError:
+        pass
+    return None
+
+
+def load_pcm(file: str, sr: int = 16000) -> PCMAudio:
+    # Decode a media file once into a PCM sidecar next to it, named file + ".pcm",
+    # and map it. The sidecar is decoded again if the source size or mtime changes
+    audio = open_pcm(file, sr)
+    if audio is not None:
+        return audio
+
+    # Decode into a temp file first, so a partial sidecar is never used
+    pcm_fn = file + ".pcm"
+    tmp = f"{pcm_fn}.{os.getpid()}.tmp"
+    try:
+        decode_to_pcm(file, tmp, sr, pcm_sidecar_header(file, sr))
+        os.replace(tmp, pcm_fn)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return PCMAudio(pcm_fn, sr, PCM_SIDECAR_HEADER_SIZE)
 
-    return np.frombuffer(out, np.int16).flatten().astype(np.float32) / 32768.0
+
+def remove_pcm(file: str):
+    # Remove the PCM sidecar of a media file if there is one
+    try:
+        os.remove(file + ".pcm")
+    except FileNotFoundError:
+        pass
+
+
+def encode_pcm(pcm: np.ndarray, sr: int = 16000, format: str = "flac") -> bytes:
+    # Encode 16-bit mono PCM in memory, format is flac, ogg (opus) or wav
+    output_args = {
+        "flac": {"acodec": "flac"},
+        "ogg": {"acodec": "libopus", "audio_bitrate": "32k"},
+        "wav": {"acodec": "pcm_s16le"},
+    }[format]
+    import ffmpeg
+
+    cmd = (
+        ffmpeg.input("pipe:", format="s16le", acodec="pcm_s16le", ac=1, ar=sr)
+        .output("pipe:", format=format, **output_args)
+        .compile(cmd=["ffmpeg", "-nostdin"])
+    )
+    p = subprocess.run(cmd, input=pcm.astype(np.int16).tobytes(), capture_output=True)
+    if p.returncode != 0:
+        raise RuntimeError(f"Failed to encode audio: {p.stderr.decode()}")
+    return p.stdout
+
+
+def get_duration(file: str) -> Union[float, None]:
+    # The duration in seconds from the header that ffmpeg prints, so no ffprobe
+    # is needed. None if it's unknown, e.g. a stream
+    p = subprocess.run(
+        ["ffmpeg", "-nostdin", "-hide_banner", "-i", file], capture_output=True
+    )
+    m = re.search(rb"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)", p.stderr)
+    if not m:
+        return None
+    h, m, s = m.groups()
+    return int(h) * 3600 + int(m) * 60 + float(s)
+
+
+def iter_blocks(audio, block_size: int) -> Iterator[np.ndarray]:
+    # Iterate over a float32 array or a PCMAudio block by block
+    for i in range(0, len(audio), block_size):
+        yield audio[i : i + block_size]
+
+
+def is_live(input: str) -> bool:
+    # stdin, a named pipe or a stream URL, which can only be read once as it comes
+    if input == "-" or re.match(r"[a-z][a-z0-9+.-]*://", input):
+        return True
+    return os.path.exists(input) and stat.S_ISFIFO(os.stat(input).st_mode)
 
 
 def is_video(filename):
@@ -49,6 +264,59 @@ def add_cut(filename):
     return base + ext
 
 
+class AtomicWriter:
+    """Writes a text file piece by piece into filename + ".tmp", which close()
+    renames to filename.
+
+    Every piece is flushed right away, so the temp file keeps the progress if
+    the process dies, while filename is never left half written.
+    """
+
+    def __init__(self, filename: str, encoding: str):
+        self.filename = filename
+        self.tmp = filename + ".tmp"
+        self.encoding = encoding
+        self.f = open(self.tmp, "wb")
+
+    def write(self, text: str):
+        self.f.write(text.encode(self.encoding, "replace"))
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+        os.replace(self.tmp, self.filename)
+
+
+class SRTWriter(AtomicWriter):
+    # Appends subtitles as they come, numbered after the ones written before,
+    # from index on. With append, they go to the end of filename right away, so
+    # it can be read while it grows, e.g. the .srt of a live stream
+
+    def __init__(self, filename: str, encoding: str, index=1, append=False):
+        if append:
+            self.filename = self.tmp = filename
+            self.encoding = encoding
+            self.f = open(filename, "ab")
+        else:
+            super().__init__(filename, encoding)
+        self.index = index
+        self.append = append
+
+    def close(self):
+        if self.append:
+            self.f.close()
+        else:
+            super().close()
+
+    def add(self, subs: List[srt.Subtitle]) -> List[srt.Subtitle]:
+        # Returns the subtitles written, invalid ones such as empty texts are
+        # skipped as srt.compose does
+        subs = list(srt.sort_and_reindex(subs, start_index=self.index))
+        self.index += len(subs)
+        self.write(srt.compose(subs, reindex=False))
+        return subs
+
+
 # a very simple markdown parser
 class MD:
     def __init__(self, filename, encoding):
@@ -56,13 +324,14 @@ class MD:
         self.EDIT_DONE_MAKR = "<-- Mark if you are done editing."
         self.encoding = encoding
         self.filename = filename
+        self.writer = None
         if filename:
             self.load_file()
 
     def load_file(self):
         if os.path.exists(self.filename):
             with open(self.filename, encoding=self.encoding) as f:
-                self.lines = f.readlines()
+                self.lines = f.read().splitlines()
 
     def clear(self):
         self.lines = []
@@ -71,6 +340,16 @@ class MD:
         with open(self.filename, "wb") as f:
             f.write("\n".join(self.lines).encode(self.encoding, "replace"))
 
+    def open(self):
+        # Write the lines so far, and then each line once it's added, through an
+        # AtomicWriter. close() puts the file in place
+        self.writer = AtomicWriter(self.filename, self.encoding)
+        self.writer.write("\n".join(self.lines))
+
+    def close(self):
+        self.writer.close()
+        self.writer = None
+
     def tasks(self):
         # get all tasks with their status
         ret = []
@@ -87,6 +366,8 @@ class MD:
         return False
 
     def add(self, line):
+        if self.writer:
+            self.writer.write("\n" + line if self.lines else line)
         self.lines.append(line)
 
     def add_task(self, mark, contents):
@@ -145,7 +426,7 @@ def merge_adjacent_segments(segments, threshold):
     results = []
     i = 0
     while i < len(segments):
-        s = segments[i]
+        s = dict(segments[i])
         for j in range(i + 1, len(segments)):
             if segments[j]["start"] < s["end"] + threshold:
                 s["end"] = segments[j]["end"]
@@ -157,8 +438,35 @@ def merge_adjacent_segments(segments, threshold):
     return results
 
 
+def pack_segments(segments, max_length, max_gap=None):
+    # Group consecutive segments into windows no longer than max_length, so each
+    # window is decoded at once. A segment longer than max_length is kept as is.
+    # Segments further apart than max_gap are not packed together, a long silence
+    # inside a window makes whisper hallucinate
+    results = []
+    for s in segments:
+        if (
+            results
+            and s["end"] - results[-1]["start"] <= max_length
+            and (max_gap is None or s["start"] - results[-1]["end"] <= max_gap)
+        ):
+            results[-1]["end"] = s["end"]
+        else:
+            results.append({"start": s["start"], "end": s["end"]})
+    return results
+
+
+@functools.lru_cache(maxsize=None)
+def opencc_t2s():
+    # whisper sometimes generates traditional Chinese, explicitly convert it.
+    # Created on first use and shared
+    import opencc
+
+    return opencc.OpenCC("t2s")
+
+
 def compact_rst(sub_fn, encoding):
-    cc = opencc.OpenCC("t2s")
+    cc = opencc_t2s()
 
     base, ext = os.path.splitext(sub_fn)
     COMPACT = "_compact"
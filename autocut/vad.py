@@ -0,0 +1,255 @@
+import importlib.resources
+import importlib.util
+import itertools
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Iterable, Iterator, List, Union
+
+import numpy as np
+
+from . import trace, utils
+from .registry import registry
+from .type import SPEECH_ARRAY_INDEX
+
+
+def default_model_path() -> str:
+    # The model files shipped with the silero-vad package. ONNX Runtime is
+    # faster than TorchScript on CPU, use it if it is installed
+    if importlib.util.find_spec("onnxruntime"):
+        name = "silero_vad.onnx"
+    else:
+        name = "silero_vad.jit"
+    return str(importlib.resources.files("silero_vad.data").joinpath(name))
+
+
+class AbstractVAD(ABC):
+    """A VAD backend returns the speeches in an audio as SPEECH_ARRAY_INDEX"""
+
+    sample_rate: int
+
+    @abstractmethod
+    def stream(
+        self, blocks: Iterable[np.ndarray], partial: bool = False
+    ) -> Iterator[SPEECH_ARRAY_INDEX]:
+        # Yield each speech as soon as it is known to be complete. The blocks are
+        # consecutive float32 audio of any length, a block may be reused after
+        # the next one is requested. With partial, a speech that may still go on
+        # at the end of a block is yielded so far with "partial": True, and again
+        # after every block until it's complete
+        pass
+
+    def __call__(self, audio, block_size: int) -> List[SPEECH_ARRAY_INDEX]:
+        # The audio is read block by block with at most block_size samples
+        return list(self.stream(utils.iter_blocks(audio, block_size)))
+
+
+class SileroVAD(AbstractVAD):
+    """Silero VAD loaded from a local .onnx or .jit file, no network is needed"""
+
+    def __init__(self, model_path: Union[str, None] = None, sample_rate: int = 16000):
+        # silero_vad limits torch to one thread when imported, which would slow
+        # down whisper on CPU, restore it
+        import torch
+
+        num_threads = torch.get_num_threads()
+        from silero_vad.utils_vad import (
+            OnnxWrapper,
+            get_speech_timestamps,
+            init_jit_model,
+        )
+
+        torch.set_num_threads(num_threads)
+
+        self.model_path = model_path or default_model_path()
+        if not os.path.exists(self.model_path):
+            raise FileNotFoundError(f"VAD model {self.model_path} not found")
+        self.sample_rate = sample_rate
+        self.get_speech_timestamps = get_speech_timestamps
+        tic = time.time()
+        if self.model_path.endswith(".onnx"):
+            self.model = OnnxWrapper(self.model_path, force_onnx_cpu=True)
+        else:
+            self.model = init_jit_model(self.model_path)
+        # The model keeps states between frames, run one audio at a time
+        self.lock = threading.Lock()
+        logging.info(
+            f"Done loading VAD model {os.path.basename(self.model_path)} "
+            f"in {time.time() - tic:.2f} sec"
+        )
+
+    def stream(
+        self, blocks: Iterable[np.ndarray], partial: bool = False
+    ) -> Iterator[SPEECH_ARRAY_INDEX]:
+        # Run VAD block by block, a speech crossing a block boundary is split into
+        # two, join them back
+        last = None
+        offset = 0
+        tolerance = 0.1 * self.sample_rate
+        for block in blocks:
+            with self.lock:
+                block_speeches = self.get_speech_timestamps(
+                    block, self.model, sampling_rate=self.sample_rate
+                )
+            for s in block_speeches:
+                s = {"start": s["start"] + offset, "end": s["end"] + offset}
+                if (
+                    last
+                    and last["end"] >= offset - tolerance
+                    and s["start"] <= offset + tolerance
+                ):
+                    last["end"] = s["end"]
+                else:
+                    if last:
+                        yield last
+                    last = s
+            offset += len(block)
+            # Too far from the next block to be joined
+            if last and last["end"] < offset - tolerance:
+                yield last
+                last = None
+            if last and partial:
+                yield dict(last, partial=True)
+        if last:
+            yield last
+
+
+class EnergyVAD(AbstractVAD):
+    """Frame-wise energy and zero-crossing rate VAD in NumPy.
+
+    A speech starts at a frame whose energy is start_db above the noise floor
+    and whose zero-crossing rate is below max_zcr, which rejects hiss. It lasts
+    until the energy falls below stop_db above the floor, plus a hangover.
+    Much cheaper than silero, good enough for clean recordings.
+    """
+
+    frame_ms = 30
+    start_db = 15.0
+    stop_db = 8.0
+    max_zcr = 0.35
+    hangover_ms = 300
+    # The noise floor is this percentile of the frame energies read so far
+    floor_percentile = 10
+    min_floor_db = -60.0
+
+    def __init__(self, sample_rate: int = 16000):
+        self.sample_rate = sample_rate
+        self.frame_size = sample_rate * self.frame_ms // 1000
+
+    def stream(
+        self, blocks: Iterable[np.ndarray], partial: bool = False
+    ) -> Iterator[SPEECH_ARRAY_INDEX]:
+        # The noise floor is estimated from a histogram of the frame energies read
+        # so far, in steps of 0.1 dB
+        hist = np.zeros(1001, dtype=np.int64)
+        hangover = self.hangover_ms * self.sample_rate // 1000 // self.frame_size
+        # The states carried over from the previous block
+        rest = np.zeros(0, dtype=np.float32)
+        high_state = False
+        last_active = -hangover - 1
+        start = None
+        offset = 0  # in frames
+        num_samples = 0
+
+        for block in itertools.chain(blocks, [None]):
+            if block is None:
+                # Pad the last partial frame
+                if len(rest) == 0:
+                    break
+                frames = np.zeros(self.frame_size, dtype=np.float32)
+                frames[: len(rest)] = rest
+                rest = rest[:0]
+            else:
+                num_samples += len(block)
+                frames = np.concatenate([rest, block])
+                n = len(frames) // self.frame_size * self.frame_size
+                frames, rest = frames[:n], frames[n:]
+            if len(frames) == 0:
+                continue
+            energy, zcr = self._features(frames.reshape(-1, self.frame_size))
+            hist += np.bincount(
+                np.clip(np.round((energy + 100) * 10), 0, 1000).astype(np.int64),
+                minlength=len(hist),
+            )
+            floor = np.searchsorted(
+                np.cumsum(hist), hist.sum() * self.floor_percentile / 100
+            )
+            floor = max(floor / 10 - 100, self.min_floor_db)
+
+            high = (energy >= floor + self.start_db) & (zcr <= self.max_zcr)
+            low = energy < floor + self.stop_db
+            index = np.arange(len(energy))
+
+            # Hysteresis, a frame between the two thresholds keeps the state of the
+            # last frame outside of them
+            last = np.maximum.accumulate(np.where(high | low, index, -1))
+            active = np.where(last >= 0, high[np.maximum(last, 0)], high_state)
+            high_state = active[-1]
+
+            # Hangover, keep the speech on for a few frames after it stops
+            index += offset
+            last = np.maximum.accumulate(np.where(active, index, last_active))
+            last_active = last[-1]
+            active = index - last <= hangover
+
+            edges = np.diff(active.astype(np.int8), prepend=np.int8(start is not None))
+            for i in np.flatnonzero(edges):
+                if edges[i] > 0:
+                    start = (i + offset) * self.frame_size
+                else:
+                    yield {"start": start, "end": (i + offset) * self.frame_size}
+                    start = None
+            offset += len(energy)
+            if start is not None and partial:
+                end = min(offset * self.frame_size, num_samples)
+                yield {"start": start, "end": end, "partial": True}
+
+        if start is not None:
+            yield {"start": start, "end": num_samples}
+
+    def _features(self, frames):
+        energy = 10 * np.log10(np.mean(frames**2, axis=1) + 1e-10)
+        signs = np.signbit(frames)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1)
+        return energy, zcr / (self.frame_size - 1)
+
+
+BACKENDS = {"silero": SileroVAD, "energy": EnergyVAD}
+
+
+def get_vad(
+    backend: str = "silero",
+    model_path: Union[str, None] = None,
+    sample_rate: int = 16000,
+) -> AbstractVAD:
+    # Loaded once per process and shared by all Transcribe instances
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown VAD backend {backend}")
+
+    def load():
+        if backend == "silero":
+            return SileroVAD(model_path, sample_rate)
+        return BACKENDS[backend](sample_rate)
+
+    return registry.get((f"{backend}-vad", model_path, sample_rate), {}, load)
+
+
+def detect_speech(
+    vad: AbstractVAD, audio, block_seconds: float
+) -> List[SPEECH_ARRAY_INDEX]:
+    tic = time.time()
+    with trace.span(
+        "vad",
+        backend=type(vad).__name__,
+        audio_seconds=len(audio) / vad.sample_rate,
+    ) as sp:
+        speeches = vad(audio, int(block_seconds * vad.sample_rate))
+        sp["speeches"] = len(speeches)
+    elapsed = time.time() - tic
+    logging.info(
+        f"Done voice activity detection in {elapsed:.1f} sec, "
+        f"{len(audio) / vad.sample_rate / max(elapsed, 1e-3):.0f} sec audio per sec"
+    )
+    return speeches
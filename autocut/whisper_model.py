@@ -1,22 +1,52 @@
+import dataclasses
 import datetime
+import functools
 import logging
+import multiprocessing
 import os
+import urllib.request
+import uuid
+import weakref
 from abc import ABC, abstractmethod
-from typing import Literal, Union, List, Any, TypedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Literal, Union, List, Any, Callable
 
 import numpy as np
-import opencc
 import srt
-from pydub import AudioSegment
+from multiprocessing import shared_memory
 from tqdm import tqdm
 
-from .type import SPEECH_ARRAY_INDEX, LANG
+from . import trace, utils
+from .registry import registry
+from .scheduler import RequestJournal, RequestScheduler
+from .type import SPEECH_ARRAY_INDEX, LANG, WhisperMode
 
-# whisper sometimes generate traditional chinese, explicitly convert
-cc = opencc.OpenCC("t2s")
+
+def _split_cores(num_workers, num_threads, default_workers):
+    # Split the cores among the workers, so that they don't compete for them
+    cpus = os.cpu_count() or 1
+    if num_workers is None:
+        num_workers = (
+            max(1, cpus // num_threads) if num_threads else min(default_workers, cpus)
+        )
+    if not num_threads:
+        num_threads = max(1, cpus // num_workers)
+    return num_workers, num_threads
+
+
+def _shift_segment(segment, offset):
+    # faster-whisper's Segment is a dataclass, or a namedtuple before 1.0
+    if dataclasses.is_dataclass(segment):
+        return dataclasses.replace(
+            segment, start=segment.start + offset, end=segment.end + offset
+        )
+    return segment._replace(start=segment.start + offset, end=segment.end + offset)
 
 
 class AbstractWhisperModel(ABC):
+    window_seconds = 30  # the receptive field of whisper
+    pack_gap_seconds = 2  # longer silences are not packed into a window
+
     def __init__(self, mode, sample_rate=16000):
         self.mode = mode
         self.whisper_model = None
@@ -35,14 +65,49 @@ class AbstractWhisperModel(ABC):
         pass
 
     @abstractmethod
-    def gen_srt(self, transcribe_results: List[Any]) -> List[srt.Subtitle]:
+    def gen_srt(
+        self, transcribe_results: List[Any], prev_end: Union[float, None] = None
+    ) -> List[srt.Subtitle]:
+        # prev_end is the end in seconds of the subtitles generated before, when
+        # the results are converted piece by piece as they come
         pass
 
+    def close(self):
+        pass
+
+    def _span_attrs(self, seg):
+        # The attributes of the span of transcribing a segment
+        return {
+            "start": seg["start"] / self.sample_rate,
+            "audio_seconds": (seg["end"] - seg["start"]) / self.sample_rate,
+        }
+
+    def _pack(
+        self, speech_array_indices: List[SPEECH_ARRAY_INDEX]
+    ) -> List[SPEECH_ARRAY_INDEX]:
+        # Whisper pads every input to 30 sec, so decoding short segments one by one
+        # wastes most of the encoder. Pack adjacent segments into windows instead,
+        # the segment timestamps are then relative to the window start. Only short
+        # gaps are packed, whisper hallucinates on long silences.
+        windows = utils.pack_segments(
+            speech_array_indices,
+            self.window_seconds * self.sample_rate,
+            self.pack_gap_seconds * self.sample_rate,
+        )
+        logging.info(
+            f"Packed {len(speech_array_indices)} speech segments into {len(windows)} windows"
+        )
+        return windows
+
 
 class WhisperModel(AbstractWhisperModel):
     def __init__(self, sample_rate=16000):
         super().__init__("whisper", sample_rate)
         self.device = None
+        self.model_name = None
+        self.num_workers = None
+        self.num_threads = None
+        self._pool = None
 
     def load(
         self,
@@ -50,16 +115,73 @@ class WhisperModel(AbstractWhisperModel):
             "tiny", "base", "small", "medium", "large", "large-v2"
         ] = "small",
         device: Union[Literal["cpu", "cuda"], None] = None,
+        num_workers: Union[int, None] = None,
+        num_threads: Union[int, None] = None,
     ):
         self.device = device
+        self.model_name = model_name
+
+        self.num_workers, self.num_threads = _split_cores(
+            num_workers, num_threads, default_workers=4
+        )
 
         import whisper
 
         self.whisper_model = whisper.load_model(model_name, device)
 
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def _get_pool(self):
+        # The pool lives as long as the model, each worker loads the weights once
+        if self._pool is None:
+            logging.info(
+                f"Starting {self.num_workers} CPU workers with "
+                f"{self.num_threads} threads each"
+            )
+            self._pool = multiprocessing.get_context("spawn").Pool(
+                processes=self.num_workers,
+                initializer=_init_cpu_worker,
+                initargs=(
+                    self.model_name,
+                    self.sample_rate,
+                    self.num_threads,
+                    trace.enabled(),
+                ),
+            )
+            weakref.finalize(self, self._pool.terminate)
+        return self._pool
+
+    def _transcribe_in_pool(
+        self, audio_source, speech_array_indices, lang, prompt, callback
+    ):
+        pool = self._get_pool()
+        pbar = tqdm(total=len(speech_array_indices))
+        sub_res = []
+        for seg in speech_array_indices:
+            sub_res.append(
+                pool.apply_async(
+                    _transcribe_in_cpu_worker,
+                    (audio_source, seg, lang, prompt),
+                    callback=lambda x: pbar.update(),
+                )
+            )
+        res = []
+        for i in sub_res:
+            r, events = i.get()
+            trace.add(events)
+            res.append(r)
+            if callback:
+                callback(res[-1])
+        pbar.close()
+        return res
+
     def _transcribe(self, audio, seg, lang, prompt):
         r = self.whisper_model.transcribe(
-            audio[int(seg["start"]) : int(seg["end"])],
+            np.array(audio[int(seg["start"]) : int(seg["end"])]),
             task="transcribe",
             language=lang,
             initial_prompt=prompt,
@@ -73,52 +195,60 @@ class WhisperModel(AbstractWhisperModel):
         speech_array_indices: List[SPEECH_ARRAY_INDEX],
         lang: LANG,
         prompt: str,
+        callback: Union[Callable[[Any], None], None] = None,
     ):
+        # callback is called with each result in order as soon as it's ready
         res = []
-        if self.device == "cpu" and len(speech_array_indices) > 1:
-            from multiprocessing import Pool
-
-            pbar = tqdm(total=len(speech_array_indices))
-
-            pool = Pool(processes=4)
-            sub_res = []
-            # TODO, a better way is merging these segments into a single one, so whisper can get more context
-            for seg in speech_array_indices:
-                sub_res.append(
-                    pool.apply_async(
-                        self._transcribe,
-                        (
-                            self.whisper_model,
-                            audio,
-                            seg,
-                            lang,
-                            prompt,
-                        ),
-                        callback=lambda x: pbar.update(),
-                    )
+        speech_array_indices = self._pack(speech_array_indices)
+        if (
+            self.device == "cpu"
+            and self.num_workers > 1
+            and len(speech_array_indices) > 1
+        ):
+            if isinstance(audio, utils.PCMAudio):
+                # Workers map the same PCM file, only its filename is pickled
+                res = self._transcribe_in_pool(
+                    audio, speech_array_indices, lang, prompt, callback
                 )
-            pool.close()
-            pool.join()
-            pbar.close()
-            res = [i.get() for i in sub_res]
+            else:
+                # Workers read the segments from shared memory, so only the
+                # segment bounds are sent with each task
+                shm = shared_memory.SharedMemory(create=True, size=max(audio.nbytes, 1))
+                try:
+                    shared = np.ndarray(audio.shape, dtype=np.float32, buffer=shm.buf)
+                    shared[:] = audio
+                    del shared
+                    res = self._transcribe_in_pool(
+                        (shm.name, audio.shape[0]),
+                        speech_array_indices,
+                        lang,
+                        prompt,
+                        callback,
+                    )
+                finally:
+                    shm.close()
+                    shm.unlink()
         else:
             for seg in (
                 speech_array_indices
                 if len(speech_array_indices) == 1
                 else tqdm(speech_array_indices)
             ):
-                r = self.whisper_model.transcribe(
-                    audio[int(seg["start"]) : int(seg["end"])],
-                    task="transcribe",
-                    language=lang,
-                    initial_prompt=prompt,
-                    verbose=False if len(speech_array_indices) == 1 else None,
-                )
+                with trace.span("asr", **self._span_attrs(seg)):
+                    r = self.whisper_model.transcribe(
+                        audio[int(seg["start"]) : int(seg["end"])],
+                        task="transcribe",
+                        language=lang,
+                        initial_prompt=prompt,
+                        verbose=False if len(speech_array_indices) == 1 else None,
+                    )
                 r["origin_timestamp"] = seg
                 res.append(r)
+                if callback:
+                    callback(r)
         return res
 
-    def gen_srt(self, transcribe_results):
+    def gen_srt(self, transcribe_results, prev_end=None):
         subs = []
 
         def _add_sub(start, end, text):
@@ -127,11 +257,11 @@ class WhisperModel(AbstractWhisperModel):
                     index=0,
                     start=datetime.timedelta(seconds=start),
                     end=datetime.timedelta(seconds=end),
-                    content=cc.convert(text.strip()),
+                    content=utils.opencc_t2s().convert(text.strip()),
                 )
             )
 
-        prev_end = 0
+        prev_end = prev_end or 0
         for r in transcribe_results:
             origin = r["origin_timestamp"]
             for s in r["segments"]:
@@ -151,30 +281,67 @@ class WhisperModel(AbstractWhisperModel):
         return subs
 
 
+# The model held by each process of the WhisperModel CPU pool
+_cpu_worker_model = None
+
+
+def _init_cpu_worker(model_name, sample_rate, num_threads, tracing):
+    global _cpu_worker_model
+    import torch
+
+    torch.set_num_threads(num_threads)
+    if tracing:
+        trace.enable()
+    _cpu_worker_model = WhisperModel(sample_rate)
+    _cpu_worker_model.load(model_name, "cpu", 1, num_threads)
+
+
+def _transcribe_in_cpu_worker(audio_source, seg, lang, prompt):
+    # audio_source is either a PCMAudio or the name and the length of a shared
+    # memory block
+    if isinstance(audio_source, utils.PCMAudio):
+        segment = audio_source[int(seg["start"]) : int(seg["end"])]
+    else:
+        shm_name, num_samples = audio_source
+        shm = shared_memory.SharedMemory(name=shm_name)
+        try:
+            audio = np.ndarray((num_samples,), dtype=np.float32, buffer=shm.buf)
+            segment = audio[int(seg["start"]) : int(seg["end"])].copy()
+            del audio
+        finally:
+            shm.close()
+    with trace.span("asr", **_cpu_worker_model._span_attrs(seg)):
+        r = _cpu_worker_model._transcribe(
+            segment, {"start": 0, "end": segment.shape[0]}, lang, prompt
+        )
+    r["origin_timestamp"] = seg
+    # The spans recorded here go back with the result
+    return r, trace.collect()
+
+
 class OpenAIModel(AbstractWhisperModel):
     max_single_audio_bytes = 25 * 2**20  # 25MB
     split_audio_bytes = 23 * 2**20  # 23MB, 2MB for safety(header, etc.)
+    chunk_seconds = 600  # speech segments are packed into chunks up to 10 min
+    upload_format = "flac"  # flac, ogg (opus) or wav
+    max_concurrency = 8
+    retry_base_delay = 1.0
     rpm = 3
 
     def __init__(self, rpm: int, sample_rate=16000):
         super().__init__("openai_whisper-1", sample_rate)
         self.rpm = rpm
-        if (
-            os.environ.get("OPENAI_API_KEY") is None
-            and os.environ.get("OPENAI_API_KEY_PATH") is None
-        ):
+        self.model_name = None
+        self.base_url = os.environ.get("OPENAI_BASE_URL", "https://api.openai.com/v1")
+        self.api_key = os.environ.get("OPENAI_API_KEY")
+        if self.api_key is None and os.environ.get("OPENAI_API_KEY_PATH") is not None:
+            with open(os.environ["OPENAI_API_KEY_PATH"]) as f:
+                self.api_key = f.read().strip()
+        if self.api_key is None:
             raise Exception("OPENAI_API_KEY is not set")
 
     def load(self, model_name: Literal["whisper-1"] = "whisper-1"):
-        try:
-            import openai
-        except ImportError:
-            raise Exception(
-                "Please use openai mode(pip install '.[openai]') or all mode(pip install '.[all]')"
-            )
-        from functools import partial
-
-        self.whisper_model = partial(openai.Audio.transcribe, model=model_name)
+        self.model_name = model_name
 
     def transcribe(
         self,
@@ -183,130 +350,190 @@ class OpenAIModel(AbstractWhisperModel):
         speech_array_indices: List[SPEECH_ARRAY_INDEX],
         lang: LANG,
         prompt: str,
+        callback: Union[Callable[[Any], None], None] = None,
     ) -> List[srt.Subtitle]:
-        res = []
-        name, _ = os.path.splitext(input)
-        raw_audio = AudioSegment.from_file(input)
-        ms_bytes = len(raw_audio[:1].raw_data)
-        audios: List[
-            TypedDict(
-                "AudioInfo", {"input": str, "audio": AudioSegment, "start_ms": float}
-            )
-        ] = []
-
-        i = 0
-        for index in speech_array_indices:
-            start = int(index["start"]) / self.sample_rate * 1000
-            end = int(index["end"]) / self.sample_rate * 1000
-            audio_seg = raw_audio[start:end]
-            if len(audio_seg.raw_data) < self.split_audio_bytes:
-                temp_file = f"{name}_temp_{i}.wav"
-                audios.append(
-                    {"input": temp_file, "audio": audio_seg, "start_ms": start}
-                )
-            else:
-                logging.info(
-                    f"Long audio with a size({len(audio_seg.raw_data)} bytes) greater than 25M({25 * 2 ** 20} bytes) "
-                    "will be segmented"
-                    "due to Openai's API restrictions on files smaller than 25M"
-                )
-                split_num = len(audio_seg.raw_data) // self.split_audio_bytes + 1
-                for j in range(split_num):
-                    temp_file = f"{name}_{i}_temp_{j}.wav"
-                    split_audio = audio_seg[
-                        j
-                        * self.split_audio_bytes
-                        // ms_bytes : (j + 1)
-                        * self.split_audio_bytes
-                        // ms_bytes
-                    ]
-                    audios.append(
-                        {
-                            "input": temp_file,
-                            "audio": split_audio,
-                            "start_ms": start + j * self.split_audio_bytes // ms_bytes,
-                        }
-                    )
-            i += 1
-
-        if len(audios) > 1:
-            from multiprocessing import Pool
-
-            pbar = tqdm(total=len(audios))
-
-            pool = Pool(processes=min(8, self.rpm))
-            sub_res = []
-            for audio in audios:
-                sub_res.append(
-                    pool.apply_async(
-                        self._transcribe,
-                        (
-                            audio["input"],
-                            audio["audio"],
-                            prompt,
-                            lang,
-                            audio["start_ms"],
-                        ),
-                        callback=lambda x: pbar.update(),
-                    )
-                )
-            pool.close()
-            pool.join()
-            pbar.close()
-            for subs in sub_res:
-                subtitles = subs.get()
-                res.extend(subtitles)
-        else:
-            res = self._transcribe(
-                audios[0]["input"],
-                audios[0]["audio"],
-                prompt,
-                lang,
-                audios[0]["start_ms"],
+        # Concatenate the speech segments into a few long chunks, each one is
+        # encoded in memory and uploaded in a single request. The silences between
+        # them are not uploaded, the subtitle times are mapped back to the input
+        # with the spans of each chunk
+        chunks = []
+        max_length = self.chunk_seconds * self.sample_rate
+        length = max_length
+        for seg in speech_array_indices:
+            start, end = int(seg["start"]), int(seg["end"])
+            for i in range(start, end, max_length):
+                span = (i, min(i + max_length, end))
+                if length + span[1] - span[0] > max_length:
+                    chunks.append([])
+                    length = 0
+                chunks[-1].append(span)
+                length += span[1] - span[0]
+        logging.info(
+            f"Packed {len(speech_array_indices)} speech segments into {len(chunks)} chunks"
+        )
+
+        # Finished chunks are recorded in a journal next to the input, so an
+        # interrupted run only sends the remaining ones
+        journal = RequestJournal(
+            input + ".openai.json",
+            {
+                "model": self.model_name,
+                "lang": lang,
+                "prompt": prompt,
+                "sample_rate": self.sample_rate,
+                "format": self.upload_format,
+                "layout": "spans",
+            },
+        )
+        key = lambda c: f"{c[0][0]}-{c[-1][1]}"
+        pending = [c for c in chunks if journal.get(key(c)) is None]
+        if len(pending) < len(chunks):
+            logging.info(
+                f"Resume from {input}.openai.json, {len(chunks) - len(pending)} chunks are done"
             )
 
+        pbar = tqdm(total=len(chunks), initial=len(chunks) - len(pending))
+
+        def on_done(i, result):
+            journal.put(key(pending[i]), result)
+            pbar.update()
+
+        scheduler = RequestScheduler(
+            self.rpm, self.max_concurrency, base_delay=self.retry_base_delay
+        )
+        scheduler.run(
+            [
+                functools.partial(self._transcribe, audio, c, prompt, lang)
+                for c in pending
+            ],
+            on_done,
+        )
+        pbar.close()
+
+        res = []
+        for c in chunks:
+            for spans, subtitles in journal.get(key(c)):
+                for x in srt.parse(subtitles):
+                    x.start = self._input_time(spans, x.start)
+                    x.end = self._input_time(spans, x.end, is_end=True)
+                    res.append(x)
+                    if callback:
+                        callback(x)
+        journal.remove()
         return res
 
-    def _transcribe(
-        self, input: srt, audio: AudioSegment, prompt: str, lang: LANG, start_ms: float
-    ):
-        audio.export(input, "wav")
-        subtitles = self.whisper_model(
-            file=open(input, "rb"), prompt=prompt, language=lang, response_format="srt"
+    def _pcm(self, audio, spans) -> np.ndarray:
+        # Cut the 16-bit PCM from the decoded audio rather than decoding the
+        # input again
+        if isinstance(audio, utils.PCMAudio):
+            return np.concatenate([audio.pcm[start:end] for start, end in spans])
+        return np.concatenate(
+            [
+                (np.clip(audio[start:end], -1, 1) * 32767).astype(np.int16)
+                for start, end in spans
+            ]
         )
-        os.remove(input)
-        return list(
-            map(
-                lambda x: (
-                    setattr(
-                        x, "start", x.start + datetime.timedelta(milliseconds=start_ms)
-                    ),
-                    setattr(
-                        x, "end", x.end + datetime.timedelta(milliseconds=start_ms)
-                    ),
-                    x,
-                )[-1],
-                list(srt.parse(subtitles)),
+
+    def _input_time(self, spans, t: datetime.timedelta, is_end=False):
+        # Map a time in the concatenated spans back to the input. A time on the
+        # boundary of two spans is the end of the first one if is_end, a time
+        # after the last span is its end
+        t = t.total_seconds() * self.sample_rate
+        offset = 0
+        for start, end in spans:
+            if t < offset + end - start or (is_end and t == offset + end - start):
+                return datetime.timedelta(
+                    seconds=(start + t - offset) / self.sample_rate
+                )
+            offset += end - start
+        return datetime.timedelta(seconds=spans[-1][1] / self.sample_rate)
+
+    def _split(self, spans):
+        # Split the spans into two halves of the same length
+        half = sum(end - start for start, end in spans) // 2
+        left, right = [], []
+        for start, end in spans:
+            n = min(end - start, half)
+            if n > 0:
+                left.append((start, start + n))
+            if start + n < end:
+                right.append((start + n, end))
+            half -= n
+        return left, right
+
+    def _transcribe(self, audio, spans, prompt: str, lang: LANG):
+        # Returns a list of (spans, srt text), a chunk whose encoded size exceeds
+        # the API limit is split into halves
+        data = utils.encode_pcm(
+            self._pcm(audio, spans), self.sample_rate, self.upload_format
+        )
+        if len(data) > self.split_audio_bytes:
+            logging.info(
+                f"Long audio with a size({len(data)} bytes) greater than 25M({25 * 2 ** 20} bytes) "
+                "will be segmented"
+                "due to Openai's API restrictions on files smaller than 25M"
             )
+            left, right = self._split(spans)
+            return self._transcribe(audio, left, prompt, lang) + self._transcribe(
+                audio, right, prompt, lang
+            )
+        with trace.span(
+            "asr_request",
+            bytes=len(data),
+            start=spans[0][0] / self.sample_rate,
+            audio_seconds=sum(end - start for start, end in spans) / self.sample_rate,
+        ):
+            return [(spans, self._request(data, prompt, lang))]
+
+    def _request(self, data: bytes, prompt: str, lang: LANG) -> str:
+        # POST the audio to the transcriptions endpoint as multipart/form-data
+        boundary = uuid.uuid4().hex
+        fields = {
+            "model": self.model_name,
+            "prompt": prompt,
+            "language": lang,
+            "response_format": "srt",
+        }
+        body = b""
+        for k, v in fields.items():
+            body += (
+                f"--{boundary}\r\n"
+                f'Content-Disposition: form-data; name="{k}"\r\n\r\n'
+                f"{v}\r\n"
+            ).encode()
+        body += (
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="file"; filename="audio.{self.upload_format}"\r\n'
+            f"Content-Type: application/octet-stream\r\n\r\n"
+        ).encode()
+        body += data + f"\r\n--{boundary}--\r\n".encode()
+
+        request = urllib.request.Request(
+            f"{self.base_url}/audio/transcriptions",
+            data=body,
+            headers={
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": f"multipart/form-data; boundary={boundary}",
+            },
         )
+        with urllib.request.urlopen(request, timeout=600) as r:
+            return r.read().decode("utf-8")
 
-    def gen_srt(self, transcribe_results: List[srt.Subtitle]):
-        if len(transcribe_results) == 0:
-            return []
-        if len(transcribe_results) == 1:
-            return transcribe_results
-        subs = [transcribe_results[0]]
-        for subtitle in transcribe_results[1:]:
-            if subtitle.start - subs[-1].end > datetime.timedelta(seconds=1):
+    def gen_srt(self, transcribe_results: List[srt.Subtitle], prev_end=None):
+        subs = []
+        end = None if prev_end is None else datetime.timedelta(seconds=prev_end)
+        for subtitle in transcribe_results:
+            if end is not None and subtitle.start - end > datetime.timedelta(seconds=1):
                 subs.append(
                     srt.Subtitle(
                         index=0,
-                        start=subs[-1].end,
+                        start=end,
                         end=subtitle.start,
                         content="< No Speech >",
                     )
                 )
             subs.append(subtitle)
+            end = subtitle.end
         return subs
 
 
@@ -314,6 +541,9 @@ class FasterWhisperModel(AbstractWhisperModel):
     def __init__(self, sample_rate=16000):
         super().__init__("faster-whisper", sample_rate)
         self.device = None
+        self.num_workers = 1
+        self.batch_size = 0
+        self.batched_model = None
 
     def load(
         self,
@@ -321,6 +551,10 @@ class FasterWhisperModel(AbstractWhisperModel):
             "tiny", "base", "small", "medium", "large", "large-v2"
         ] = "small",
         device: Union[Literal["cpu", "cuda"], None] = None,
+        compute_type: str = "default",
+        num_workers: Union[int, None] = None,
+        cpu_threads: Union[int, None] = None,
+        batch_size: int = 0,
     ):
         try:
             from faster_whisper import WhisperModel
@@ -330,20 +564,29 @@ class FasterWhisperModel(AbstractWhisperModel):
             )
 
         self.device = device if device else "cpu"
-        self.whisper_model = WhisperModel(model_name, self.device)
+        # CTranslate2 runs num_workers transcriptions in parallel when called from
+        # as many threads, each one with cpu_threads threads
+        self.num_workers, cpu_threads = _split_cores(
+            num_workers, cpu_threads, default_workers=1
+        )
+        self.whisper_model = WhisperModel(
+            model_name,
+            self.device,
+            compute_type=compute_type,
+            cpu_threads=cpu_threads if self.device == "cpu" else 0,
+            num_workers=self.num_workers,
+        )
 
-    def _transcribe(self):
-        raise Exception("Not implemented")
+        self.batch_size = batch_size
+        if batch_size > 1:
+            try:
+                from faster_whisper import BatchedInferencePipeline
+            except ImportError:
+                raise Exception("Batched inference requires faster-whisper>=1.1")
+            self.batched_model = BatchedInferencePipeline(self.whisper_model)
 
-    def transcribe(
-        self,
-        audio: np.ndarray,
-        speech_array_indices: List[SPEECH_ARRAY_INDEX],
-        lang: LANG,
-        prompt: str,
-    ):
-        res = []
-        for seg in speech_array_indices:
+    def _transcribe(self, audio, seg, lang, prompt):
+        with trace.span("asr", **self._span_attrs(seg)):
             segments, info = self.whisper_model.transcribe(
                 audio[int(seg["start"]) : int(seg["end"])],
                 task="transcribe",
@@ -352,11 +595,85 @@ class FasterWhisperModel(AbstractWhisperModel):
                 vad_filter=False,
             )
             segments = list(segments)  # The transcription will actually run here.
-            r = {"origin_timestamp": seg, "segments": segments, "info": info}
-            res.append(r)
+        return {"origin_timestamp": seg, "segments": segments, "info": info}
+
+    def _transcribe_batch(self, audio, segs, lang, prompt):
+        # Decode a batch of windows at once. They are concatenated into one
+        # array, the segments are then mapped back to their windows
+        chunks = [audio[int(seg["start"]) : int(seg["end"])] for seg in segs]
+        offsets = np.cumsum([0] + [len(c) for c in chunks]) / self.sample_rate
+        with trace.span(
+            "asr_batch", windows=len(segs), audio_seconds=float(offsets[-1])
+        ):
+            segments, info = self.batched_model.transcribe(
+                np.concatenate(chunks),
+                task="transcribe",
+                language=lang,
+                initial_prompt=prompt,
+                clip_timestamps=[
+                    {"start": float(offsets[i]), "end": float(offsets[i + 1])}
+                    for i in range(len(segs))
+                ],
+                batch_size=self.batch_size,
+            )
+            segments = list(segments)
+        res = [{"origin_timestamp": seg, "segments": [], "info": info} for seg in segs]
+        for s in segments:
+            mid = (s.start + s.end) / 2
+            i = min(max(np.searchsorted(offsets, mid) - 1, 0), len(segs) - 1)
+            res[i]["segments"].append(_shift_segment(s, -float(offsets[i])))
+        return res
+
+    def transcribe(
+        self,
+        audio: np.ndarray,
+        speech_array_indices: List[SPEECH_ARRAY_INDEX],
+        lang: LANG,
+        prompt: str,
+        callback: Union[Callable[[Any], None], None] = None,
+    ):
+        # callback is called with each result in order as soon as it's ready
+        windows = self._pack(speech_array_indices)
+        if self.batch_size > 1:
+            # A batched clip is cut at 30 sec, so split longer windows
+            max_length = self.window_seconds * self.sample_rate
+            windows = [
+                {"start": i, "end": min(i + max_length, int(w["end"]))}
+                for w in windows
+                for i in range(int(w["start"]), int(w["end"]), max_length)
+            ]
+            batches = [
+                windows[i : i + self.batch_size]
+                for i in range(0, len(windows), self.batch_size)
+            ]
+            transcribe_fn = self._transcribe_batch
+        else:
+            batches = windows
+            transcribe_fn = self._transcribe
+
+        res = []
+
+        def collect(batch_res):
+            for r in batch_res if self.batch_size > 1 else [batch_res]:
+                res.append(r)
+                if callback:
+                    callback(r)
+
+        if self.num_workers == 1 or len(batches) == 1:
+            for b in batches if len(batches) == 1 else tqdm(batches):
+                collect(transcribe_fn(audio, b, lang, prompt))
+        else:
+            with ThreadPoolExecutor(self.num_workers) as executor:
+                for batch_res in tqdm(
+                    executor.map(
+                        lambda b: transcribe_fn(audio, b, lang, prompt), batches
+                    ),
+                    total=len(batches),
+                ):
+                    collect(batch_res)
         return res
 
-    def gen_srt(self, transcribe_results):
+    def gen_srt(self, transcribe_results, prev_end=None):
         subs = []
 
         def _add_sub(start, end, text):
@@ -365,11 +682,11 @@ class FasterWhisperModel(AbstractWhisperModel):
                     index=0,
                     start=datetime.timedelta(seconds=start),
                     end=datetime.timedelta(seconds=end),
-                    content=cc.convert(text.strip()),
+                    content=utils.opencc_t2s().convert(text.strip()),
                 )
             )
 
-        prev_end = 0
+        prev_end = prev_end or 0
         for r in transcribe_results:
             origin = r["origin_timestamp"]
             for seg in r["segments"]:
@@ -388,3 +705,29 @@ class FasterWhisperModel(AbstractWhisperModel):
                 prev_end = end
 
         return subs
+
+
+def get_model(
+    mode: str,
+    model_name: str,
+    device: Union[Literal["cpu", "cuda"], None] = None,
+    sample_rate: int = 16000,
+    **options,
+) -> AbstractWhisperModel:
+    # Returns a loaded model, each (mode, model, device) is loaded only once. The
+    # options are passed to the constructor of OpenAIModel and to load() otherwise
+    def load():
+        if mode == WhisperMode.WHISPER.value:
+            model = WhisperModel(sample_rate)
+            model.load(model_name, device, **options)
+        elif mode == WhisperMode.OPENAI.value:
+            model = OpenAIModel(sample_rate=sample_rate, **options)
+            model.load(model_name)
+        elif mode == WhisperMode.FASTER.value:
+            model = FasterWhisperModel(sample_rate)
+            model.load(model_name, device, **options)
+        else:
+            raise ValueError(f"Unknown whisper mode {mode}")
+        return model
+
+    return registry.get((mode, model_name, device, sample_rate), options, load)
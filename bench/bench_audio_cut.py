@@ -0,0 +1,129 @@
+"""Compare the time and the peak memory of cutting a podcast with NumPy and
+with moviepy, which the cut command used for audio files before.
+
+A speech-like mp3 is cut by a 3 sec subtitle every 4 sec, each method in a
+fresh process.
+
+    python bench/bench_audio_cut.py --minutes 120
+    python bench/bench_audio_cut.py --minutes 10 60 --crossfade 0.01
+"""
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import srt
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from suite import speech_like, write_srt  # noqa: E402
+
+from autocut import utils  # noqa: E402
+
+SR = 16000
+
+
+def legacy_cut(fn, segments, output, bitrate):
+    # The moviepy path of Cutter before the audio was cut with NumPy
+    from moviepy import editor
+
+    media = editor.AudioFileClip(fn)
+    clips = [media.subclip(s["start"], s["end"]) for s in segments]
+    final_clip = editor.concatenate_audioclips(clips)
+    final_clip = final_clip.fx(editor.afx.audio_normalize)
+    final_clip.write_audiofile(
+        output, codec="libmp3lame", fps=44100, bitrate=bitrate, logger=None
+    )
+    media.close()
+
+
+def run(method, fn, crossfade):
+    from autocut.cut import Cutter
+
+    srt_fn = os.path.splitext(fn)[0] + ".srt"
+    tic = time.time()
+    if method == "numpy":
+        args = argparse.Namespace(
+            inputs=[fn, srt_fn],
+            encoding="utf-8",
+            force=True,
+            bitrate="128k",
+            stream_copy=False,
+            render_backend="moviepy",
+            render_jobs=1,
+            crossfade=crossfade,
+        )
+        Cutter(args).run()
+    elif method == "moviepy":
+        with open(srt_fn) as f:
+            segments = [
+                {"start": s.start.total_seconds(), "end": s.end.total_seconds()}
+                for s in srt.parse(f.read())
+            ]
+        output = utils.change_ext(utils.add_cut(fn), "mp3")
+        legacy_cut(fn, segments, output, "128k")
+    else:
+        raise ValueError(method)
+    elapsed = time.time() - tic
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    print(f"{method:>8} {elapsed:8.1f} sec {rss:8.0f} MB {children:8.0f} MB")
+
+
+def gen_media(fn, minutes):
+    wav = os.path.splitext(fn)[0] + ".wav"
+    with open(wav, "wb") as f:
+        f.write(utils.encode_pcm(speech_like(minutes * 60, 0.8) * 32767, SR, "wav"))
+    subprocess.run(
+        ["ffmpeg", "-nostdin", "-y", "-loglevel", "error", "-i", wav]
+        + ["-ac", "2", "-ar", "44100", "-b:a", "128k", fn],
+        check=True,
+    )
+    os.remove(wav)
+    write_srt(os.path.splitext(fn)[0] + ".srt", minutes * 60)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--minutes", type=int, nargs="+", default=[120])
+    parser.add_argument("--crossfade", type=float, default=0)
+    parser.add_argument(
+        "--methods", nargs="+", default=["numpy", "moviepy"], help="numpy, moviepy"
+    )
+    parser.add_argument("--run", nargs=2, help=argparse.SUPPRESS)
+    parser.add_argument("--gen", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run(*args.run, args.crossfade)
+        return
+    if args.gen:
+        gen_media(args.gen[0], int(args.gen[1]))
+        return
+
+    print(f"{'method':>8} {'time':>12} {'peak RSS':>11} {'ffmpeg RSS':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for minutes in args.minutes:
+            fn = os.path.join(tmp, f"{minutes}.mp3")
+            # In a fresh process too, a child starts with the peak RSS of its
+            # parent
+            subprocess.run(
+                [sys.executable, __file__, "--gen", fn, str(minutes)], check=True
+            )
+            print(f"{minutes} min")
+            for method in args.methods:
+                subprocess.run(
+                    [sys.executable, __file__, "--run", method, fn]
+                    + ["--crossfade", str(args.crossfade)],
+                    check=True,
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Compare FasterWhisperModel configurations on CPU.
+
+The serial configuration is the loop FasterWhisperModel used to run, one
+VAD segment after another with the default compute type, without packing
+them into windows. The others run FasterWhisperModel.transcribe.
+
+    python bench/bench_faster_whisper.py --media talk.mp4 --model tiny
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from autocut import utils  # noqa: E402
+from autocut.whisper_model import FasterWhisperModel  # noqa: E402
+
+CONFIGS = {
+    "serial": dict(compute_type="default", num_workers=1, cpu_threads=4),
+    "int8": dict(compute_type="int8", num_workers=1),
+    "int8-workers": dict(compute_type="int8", num_workers=4),
+    "int8-batched": dict(compute_type="int8", num_workers=1, batch_size=8),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--media", default=os.path.join("test", "media", "test001.mp4"))
+    parser.add_argument("--repeat", type=int, default=30, help="Repeat the media")
+    parser.add_argument("--model", default="tiny")
+    parser.add_argument("--lang", default="zh")
+    parser.add_argument("--configs", nargs="+", default=list(CONFIGS))
+    args = parser.parse_args()
+
+    audio = np.tile(utils.load_audio(args.media), args.repeat)
+    sr = 16000
+    # VAD-like segments, 8 sec of speech followed by 2 sec of silence
+    segments = [
+        {"start": i, "end": min(i + 8 * sr, len(audio))}
+        for i in range(0, len(audio), 10 * sr)
+    ]
+    duration = len(audio) / sr
+    print(f"{duration / 60:.1f} min audio, {len(segments)} segments")
+
+    for name in args.configs:
+        model = FasterWhisperModel(sr)
+        model.load(args.model, "cpu", **CONFIGS[name])
+        tic = time.time()
+        if name == "serial":
+            res = [model._transcribe(audio, s, args.lang, "") for s in segments]
+        else:
+            res = model.transcribe(audio, segments, args.lang, "")
+        elapsed = time.time() - tic
+        subs = model.gen_srt(res)
+        print(
+            f"{name:>14} {elapsed:8.1f} sec  real-time factor {elapsed / duration:.3f}"
+            f"  {len(subs)} subtitles"
+        )
+
+
+if __name__ == "__main__":
+    main()
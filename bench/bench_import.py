@@ -0,0 +1,87 @@
+"""Measure the cold-start import time of each CLI command with -X importtime.
+
+Each command imports a module of autocut first, the heavy libraries are only
+imported once they are needed. Reports the best cumulative import time of
+--repeat fresh interpreters, the heaviest modules, and fails if a module
+exceeds its budget or imports a library it shouldn't.
+
+    python bench/bench_import.py
+    python bench/bench_import.py --budget-scale 2 --top 10
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+# The module a command imports, its budget in ms, and the libraries it must
+# not import. -s, -m and --help only need autocut.main
+COMMANDS = {
+    "--help, -s, -m": (
+        "autocut.main",
+        300,
+        ["torch", "whisper", "faster_whisper", "moviepy", "opencc", "ffmpeg", "tqdm"],
+    ),
+    "-c": ("autocut.cut", 400, ["torch", "whisper", "faster_whisper", "moviepy"]),
+    "-t": (
+        "autocut.transcribe",
+        600,
+        ["torch", "whisper", "faster_whisper", "moviepy"],
+    ),
+}
+
+
+def import_times(module):
+    # {module: (self us, cumulative us)} of a fresh interpreter importing module
+    p = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in p.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative, name = line[len("import time:") :].split("|")
+        times[name.strip()] = (int(self_us), int(cumulative))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="Report the best")
+    parser.add_argument("--top", type=int, default=5, help="Show the heaviest modules")
+    parser.add_argument(
+        "--budget-scale", type=float, default=1, help="Scale the budgets, e.g. on CI"
+    )
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'command':>16} {'module':>20} {'ms':>8} {'budget':>8}")
+    for command, (module, budget, forbidden) in COMMANDS.items():
+        runs = [import_times(module) for _ in range(args.repeat)]
+        best = min(runs, key=lambda t: t[module][1])
+        ms = best[module][1] / 1000
+        budget *= args.budget_scale
+        errors = []
+        if ms > budget:
+            errors.append("OVER BUDGET")
+        loaded = sorted(m for m in forbidden if m in best)
+        if loaded:
+            errors.append(f"imports {', '.join(loaded)}")
+        failed |= bool(errors)
+        print(f"{command:>16} {module:>20} {ms:8.1f} {budget:8.0f} {' '.join(errors)}")
+        heaviest = sorted(best.items(), key=lambda x: -x[1][0])[: args.top]
+        for name, (self_us, _) in heaviest:
+            print(f"{'':>38} {self_us / 1000:8.1f} {name}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
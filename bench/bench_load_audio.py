@@ -0,0 +1,83 @@
+"""Compare the peak memory of decoding audio in one go and block by block.
+
+python bench/bench_load_audio.py --minutes 10 60 180
+"""
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import ffmpeg
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from autocut import utils  # noqa: E402
+
+
+def legacy_load_audio(file, sr=16000):
+    # utils.load_audio before it was rewritten to decode block by block
+    out, _ = (
+        ffmpeg.input(file, threads=0)
+        .output("-", format="s16le", acodec="pcm_s16le", ac=1, ar=sr)
+        .run(cmd=["ffmpeg", "-nostdin"], capture_stdout=True, capture_stderr=True)
+    )
+    return np.frombuffer(out, np.int16).flatten().astype(np.float32) / 32768.0
+
+
+def run(method, file):
+    tic = time.time()
+    if method == "legacy":
+        n = len(legacy_load_audio(file))
+    elif method == "load_audio":
+        n = len(utils.load_audio(file))
+    elif method == "stream":
+        # What Transcribe does: decode into a PCM file, then read it in blocks
+        with tempfile.TemporaryDirectory() as tmp:
+            audio = utils.decode_to_pcm(file, os.path.join(tmp, "audio.pcm"))
+            n = 0
+            for block in utils.iter_blocks(audio, 600 * 16000):
+                n += len(block)
+    else:
+        raise ValueError(method)
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(
+        f"{method:>12} {n / 16000 / 60:8.1f} min {rss:10.1f} MB {time.time() - tic:8.1f} sec"
+    )
+
+
+def gen_media(fn, minutes):
+    # Stereo 44.1kHz, a typical audio track of a video
+    ffmpeg.input(
+        f"sine=frequency=440:sample_rate=44100:duration={minutes * 60}", f="lavfi"
+    ).output(fn, ac=2, audio_bitrate="64k").run(quiet=True, overwrite_output=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--minutes", type=int, nargs="+", default=[10, 60])
+    parser.add_argument("--run", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run(*args.run)
+        return
+
+    print(f"{'method':>12} {'length':>12} {'peak RSS':>13} {'time':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for minutes in args.minutes:
+            fn = os.path.join(tmp, f"{minutes}.m4a")
+            gen_media(fn, minutes)
+            # A fresh process for each method, so the peak RSS are not mixed up
+            for method in ["legacy", "load_audio", "stream"]:
+                subprocess.run(
+                    [sys.executable, __file__, "--run", method, fn], check=True
+                )
+
+
+if __name__ == "__main__":
+    main()
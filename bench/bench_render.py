@@ -0,0 +1,113 @@
+"""Compare the render backends of the cut command on the test media.
+
+Each media is cut by a fresh `autocut -c` of each backend and each number of
+--render-jobs, keeping 3 sec out of every 4, and the best seconds of --repeat
+runs, the peak RSS of the process and its children and the speedup over
+moviepy in one piece are reported. --minutes adds a synthetic 720p video of
+that length, the test media are too short to be rendered in chunks.
+
+    python bench/bench_render.py
+    python bench/bench_render.py --minutes 5 --repeat 1 --jobs 1 2 4
+"""
+
+import argparse
+import glob
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+BACKENDS = ["moviepy", "ffmpeg"]
+
+
+def write_srt(fn, seconds):
+    # A 3 sec subtitle every 4 sec
+    def srt_time(sec):
+        return f"{sec // 3600:02d}:{sec // 60 % 60:02d}:{sec % 60:02d},000"
+
+    with open(fn, "w") as f:
+        for i, t in enumerate(range(0, max(int(seconds) - 3, 1), 4)):
+            f.write(f"{i + 1}\n{srt_time(t)} --> {srt_time(t + 3)}\nsub {i}\n\n")
+
+
+def gen_media(fn, minutes):
+    subprocess.run(
+        ["ffmpeg", "-nostdin", "-y", "-loglevel", "error"]
+        + ["-f", "lavfi", "-i", f"testsrc2=size=1280x720:rate=25:d={minutes * 60}"]
+        + ["-f", "lavfi", "-i", f"sine=f=440:d={minutes * 60}"]
+        + ["-c:v", "libx264", "-preset", "ultrafast", "-c:a", "aac", fn],
+        check=True,
+    )
+
+
+def run(backend, jobs, fn):
+    # The seconds and the peak RSS in MB of cutting fn, the one of the process
+    # or of ffmpeg run by it, whichever is larger
+    tic = time.time()
+    p = subprocess.Popen(
+        [sys.executable, "-m", "autocut", "-c", fn, os.path.splitext(fn)[0] + ".srt"]
+        + ["--render-backend", backend, "--render-jobs", str(jobs)]
+        + ["--force", "--bitrate", "1m"],
+        cwd=ROOT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    _, status, usage = os.wait4(p.pid, 0)
+    if status != 0:
+        raise RuntimeError(f"Failed to cut {fn} with {backend} in {jobs} jobs")
+    return time.time() - tic, usage.ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--media", nargs="+", help="In default the videos and audios of test/media"
+    )
+    parser.add_argument("--minutes", type=float, help="Add a synthetic video")
+    parser.add_argument("--repeat", type=int, default=3, help="Report the best")
+    parser.add_argument(
+        "--jobs", type=int, nargs="+", default=[1], help="--render-jobs"
+    )
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    from autocut import utils
+
+    media = args.media or sorted(glob.glob(os.path.join(ROOT, "test/media/*")))
+    print(
+        f"{'media':>16} {'length':>8} {'backend':>8} {'jobs':>5} {'sec':>8} "
+        f"{'peak RSS':>11} {'speedup':>8}"
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        files = []
+        for fn in media:
+            files.append(os.path.join(tmp, os.path.basename(fn)))
+            shutil.copy(fn, files[-1])
+        if args.minutes:
+            files.append(os.path.join(tmp, "synthetic.mp4"))
+            gen_media(files[-1], args.minutes)
+
+        for fn in files:
+            seconds = utils.get_duration(fn)
+            write_srt(os.path.splitext(fn)[0] + ".srt", seconds)
+            baseline = None
+            for backend in BACKENDS:
+                for jobs in args.jobs:
+                    elapsed, rss = min(
+                        run(backend, jobs, fn) for _ in range(args.repeat)
+                    )
+                    baseline = baseline or elapsed
+                    print(
+                        f"{os.path.basename(fn):>16} {seconds:7.1f}s {backend:>8} "
+                        f"{jobs:5d} {elapsed:8.2f} {rss:8.0f} MB "
+                        f"{baseline / elapsed:7.2f}x"
+                    )
+
+
+if __name__ == "__main__":
+    main()
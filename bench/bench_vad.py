@@ -0,0 +1,62 @@
+"""Compare the speed of the VAD backends and how their speeches overlap.
+
+The overlap is the intersection over union of the speech samples, against
+the first backend.
+
+    python bench/bench_vad.py --backends silero energy
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from autocut import utils, vad  # noqa: E402
+
+
+def mask(speeches, n):
+    m = np.zeros(n, dtype=bool)
+    for s in speeches:
+        m[s["start"] : s["end"]] = True
+    return m
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--media",
+        nargs="+",
+        default=sorted(glob.glob(os.path.join("test", "media", "*.mp[34]"))),
+    )
+    parser.add_argument("--backends", nargs="+", default=list(vad.BACKENDS))
+    parser.add_argument("--repeat", type=int, default=1, help="Repeat the media")
+    args = parser.parse_args()
+
+    models = {name: vad.get_vad(name) for name in args.backends}
+    print(
+        f"{'media':>20} {'backend':>8} {'speeches':>9} {'sec':>7} {'x RT':>7} {'IoU':>6}"
+    )
+    for fn in args.media:
+        audio = np.tile(utils.load_audio(fn), args.repeat)
+        ref = None
+        for name, model in models.items():
+            tic = time.time()
+            speeches = model(audio, 600 * model.sample_rate)
+            elapsed = time.time() - tic
+            m = mask(speeches, len(audio))
+            if ref is None:
+                ref = m
+            iou = np.count_nonzero(m & ref) / max(np.count_nonzero(m | ref), 1)
+            print(
+                f"{os.path.basename(fn):>20} {name:>8} {len(speeches):9d} {elapsed:7.2f}"
+                f" {len(audio) / model.sample_rate / elapsed:7.0f} {iou:6.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+"""Benchmark each stage on synthetic media, and compare with a baseline.
+
+The media are generated locally. "speech" is speech-like syllables with short
+pauses, "sparse" is mostly silence with a few utterances. Both are videos
+with an AAC track, as autocut usually gets them.
+
+Each case runs in a fresh process and reports the best seconds of --repeat
+runs, the real-time factor (seconds per second of media) and the peak RSS of
+the process and of its children, e.g. ffmpeg. A case that fails, e.g. as the
+whisper weights can't be downloaded, is reported with its error.
+
+    python bench/suite.py run --out baseline.json
+    python bench/suite.py run --out new.json
+    python bench/suite.py compare baseline.json new.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from autocut import utils  # noqa: E402
+
+SR = 16000
+MEDIA = {"speech": 0.8, "sparse": 0.1}  # the fraction of speech
+
+
+def speech_like(seconds, speech_ratio, seed=0):
+    # Utterances of syllables, each a few harmonics of a gliding pitch under a
+    # Hann window, between pauses, over a low noise floor
+    rng = np.random.RandomState(seed)
+    n = int(seconds * SR)
+    audio = rng.normal(0, 1e-3, n).astype(np.float32)
+    i = int(rng.uniform(0.5, 2) * SR)
+    while i < n:
+        start = i
+        end = min(i + int(rng.uniform(1, 6) * SR), n)
+        while i < end:
+            length = int(rng.uniform(0.1, 0.3) * SR)
+            t = np.arange(min(length, n - i)) / SR
+            f0 = rng.uniform(100, 250) * (1 + rng.uniform(-0.2, 0.2) * t)
+            phase = 2 * np.pi * np.cumsum(f0) / SR
+            syllable = sum(np.sin(k * phase) / k for k in range(1, 8))
+            audio[i : i + len(t)] += 0.1 * syllable * np.hanning(len(t))
+            i += length + int(rng.uniform(0.03, 0.08) * SR)
+        pause = (i - start) * (1 - speech_ratio) / speech_ratio
+        i += int(rng.uniform(0.5, 1.5) * pause)
+    return audio
+
+
+def gen_media(media_dir, minutes):
+    for name, ratio in MEDIA.items():
+        fn = os.path.join(media_dir, name + ".mp4")
+        if os.path.exists(fn):
+            continue
+        wav = os.path.join(media_dir, name + ".wav")
+        audio = speech_like(minutes * 60, ratio)
+        with open(wav, "wb") as f:
+            f.write(utils.encode_pcm(np.clip(audio, -1, 1) * 32767, SR, "wav"))
+        subprocess.run(
+            ["ffmpeg", "-nostdin", "-y", "-loglevel", "error"]
+            + ["-f", "lavfi", "-i", "testsrc2=size=320x240:rate=25", "-i", wav]
+            + ["-shortest", "-c:v", "libx264", "-preset", "ultrafast"]
+            + ["-c:a", "aac", "-ar", "44100", fn],
+            check=True,
+        )
+        os.remove(wav)
+
+
+def make_args(**kwargs):
+    # The options of autocut.main that the benchmarked classes read
+    args = argparse.Namespace(
+        inputs=[],
+        encoding="utf-8",
+        force=True,
+        bitrate="1m",
+        stream_copy=False,
+        render_backend="moviepy",
+        render_jobs=1,
+        crossfade=0,
+        whisper_mode="whisper",
+        whisper_model="tiny",
+        device="cpu",
+        cpu_workers=None,
+        cpu_threads=None,
+        compute_type="int8",
+        batch_size=0,
+        cache_dir=None,
+        cache_size=1024,
+        lang="en",
+        prompt="",
+    )
+    vars(args).update(kwargs)
+    return args
+
+
+def fake_results(seconds):
+    # Results like whisper's, a sentence every 2 sec in 30 sec windows
+    window = 30
+    return [
+        {
+            "origin_timestamp": {
+                "start": start * SR,
+                "end": min(start + window, seconds) * SR,
+            },
+            "segments": [
+                {"start": i, "end": i + 1.5, "text": f"sentence {start + i}"}
+                for i in range(0, min(window, int(seconds) - start), 2)
+            ],
+        }
+        for start in range(0, int(seconds), window)
+    ]
+
+
+def write_srt(fn, seconds):
+    # A 3 sec subtitle every 4 sec, so the cut removes a second out of four
+    subs = [
+        f"{i + 1}\n{srt_time(t)} --> {srt_time(t + 3)}\nsub {i}\n"
+        for i, t in enumerate(range(0, int(seconds) - 3, 4))
+    ]
+    with open(fn, "w") as f:
+        f.write("\n".join(subs))
+
+
+def srt_time(sec):
+    return f"{sec // 3600:02d}:{sec // 60 % 60:02d}:{sec % 60:02d},000"
+
+
+def setup_case(name, media_dir):
+    # Returns the function to time and the seconds of media it handles
+    stage, _, media = name.partition("/")
+    fn = os.path.join(media_dir, (media or "speech") + ".mp4")
+    seconds = utils.get_duration(fn)
+
+    if stage == "load_audio":
+        return lambda: utils.load_audio(fn), seconds
+
+    if stage.startswith("vad-"):
+        from autocut import vad
+
+        model = vad.get_vad(stage[4:])
+        audio = utils.load_audio(fn)
+        return lambda: vad.detect_speech(model, audio, 600), seconds
+
+    if stage.startswith("transcribe-"):
+        from autocut import vad, whisper_model
+
+        mode = stage[len("transcribe-") :]
+        options = {"faster": dict(compute_type="int8")}.get(mode, {})
+        model = whisper_model.get_model(mode, "tiny", "cpu", SR, **options)
+        audio = utils.load_audio(fn)
+        speeches = vad.detect_speech(vad.get_vad(), audio, 600)
+        return lambda: model.transcribe(audio, speeches, "en", ""), seconds
+
+    if stage == "srt-md":
+        from autocut import whisper_model
+        from autocut.registry import registry
+        from autocut.transcribe import Transcribe
+
+        # The real writer on fake results, a model without weights can gen_srt
+        registry.get(
+            ("whisper", "tiny", "cpu", SR),
+            dict(num_workers=None, num_threads=None),
+            lambda: whisper_model.WhisperModel(SR),
+        )
+        transcribe = Transcribe(make_args())
+        prepared = {"results": fake_results(seconds)}
+        name = os.path.join(media_dir, "speech")
+        return (
+            lambda: transcribe._write_outputs(
+                fn, name + ".srt", name + ".md", prepared
+            ),
+            seconds,
+        )
+
+    if stage in ["cut", "cut-ffmpeg"]:
+        from autocut.cut import Cutter
+
+        srt_fn = os.path.join(media_dir, "cut.srt")
+        write_srt(srt_fn, seconds)
+        args = make_args(inputs=[fn, srt_fn], render_backend=stage[4:] or "moviepy")
+        return lambda: Cutter(args).run(), seconds
+
+    if stage == "merge":
+        from autocut.cut import Merger
+
+        md_fn = os.path.join(media_dir, "merge.md")
+        md = utils.MD(md_fn, "utf-8")
+        md.clear()
+        md.add_done_editing(True)
+        for media in MEDIA:
+            md.add_task(True, f"[{media}.mp4]({media}.md)")
+        md.write()
+        seconds = sum(
+            utils.get_duration(os.path.join(media_dir, m + ".mp4")) for m in MEDIA
+        )
+        return lambda: Merger(make_args(inputs=[md_fn])).run(), seconds
+
+    raise ValueError(f"Unknown case {name}")
+
+
+def run_case(name, media_dir, repeat):
+    # Runs in a fresh process, prints the result as JSON on the last line
+    fn, seconds = setup_case(name, media_dir)
+    elapsed = float("inf")
+    for _ in range(repeat):
+        tic = time.time()
+        fn()
+        elapsed = min(elapsed, time.time() - tic)
+    print(
+        json.dumps(
+            {
+                "seconds": elapsed,
+                "media_seconds": seconds,
+                "rtf": elapsed / seconds,
+                "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                / 1024,
+                "children_peak_rss_mb": resource.getrusage(
+                    resource.RUSAGE_CHILDREN
+                ).ru_maxrss
+                / 1024,
+            }
+        )
+    )
+
+
+def all_cases(modes):
+    cases = [f"load_audio/{m}" for m in MEDIA]
+    cases += [f"vad-{b}/{m}" for b in ["silero", "energy"] for m in MEDIA]
+    cases += [f"transcribe-{mode}/speech" for mode in modes]
+    return cases + ["srt-md", "cut", "cut-ffmpeg", "merge"]
+
+
+def run(args):
+    results = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "minutes": args.minutes,
+        },
+        "cases": {},
+    }
+    cases = args.cases or all_cases(args.modes)
+    with tempfile.TemporaryDirectory() as tmp:
+        media_dir = args.media_dir or tmp
+        os.makedirs(media_dir, exist_ok=True)
+        gen_media(media_dir, args.minutes)
+
+        print(f"{'case':>28} {'sec':>9} {'RTF':>8} {'peak RSS':>11}")
+        for name in cases:
+            # Transcribing is slow and steady enough to run once
+            repeat = 1 if name.startswith("transcribe-") else args.repeat
+            p = subprocess.run(
+                [sys.executable, __file__, "_case", name, media_dir, str(repeat)],
+                capture_output=True,
+                text=True,
+            )
+            if p.returncode == 0:
+                r = json.loads(p.stdout.strip().splitlines()[-1])
+                print(
+                    f"{name:>28} {r['seconds']:9.3f} {r['rtf']:8.4f} "
+                    f"{r['peak_rss_mb']:8.0f} MB"
+                )
+            else:
+                lines = p.stderr.strip().splitlines()
+                r = {"error": lines[-1] if lines else f"exit {p.returncode}"}
+                print(f"{name:>28} failed: {r['error']}")
+            results["cases"][name] = r
+
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved to {args.out}")
+
+
+def compare(args):
+    # A case regresses if its RTF or peak RSS grows by more than the threshold.
+    # Timings below min_seconds are too noisy to judge
+    with open(args.baseline) as f:
+        baseline = json.load(f)["cases"]
+    with open(args.current) as f:
+        current = json.load(f)["cases"]
+
+    regressions = 0
+    print(f"{'case':>28} {'RTF':>19} {'change':>8} {'peak RSS MB':>15} {'change':>8}")
+    for name, base in baseline.items():
+        cur = current.get(name)
+        if cur is None or "error" in cur or "error" in base:
+            print(f"{name:>28} skipped, {'missing' if cur is None else 'failed'}")
+            continue
+        rtf = cur["rtf"] / base["rtf"] - 1
+        rss = cur["peak_rss_mb"] / base["peak_rss_mb"] - 1
+        slower = rtf > args.threshold and cur["seconds"] > args.min_seconds
+        bigger = rss > args.threshold
+        flag = " ".join(x for x, y in [("SLOWER", slower), ("BIGGER", bigger)] if y)
+        regressions += bool(flag)
+        print(
+            f"{name:>28} {base['rtf']:8.4f} -> {cur['rtf']:8.4f} {rtf:+8.1%} "
+            f"{base['peak_rss_mb']:6.0f} -> {cur['peak_rss_mb']:6.0f} {rss:+8.1%} "
+            f"{flag}"
+        )
+    print(f"{regressions} regressions")
+    sys.exit(1 if regressions else 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("run", help="Run the benchmarks and save the results")
+    p.add_argument("--out", default="bench.json")
+    p.add_argument("--minutes", type=float, default=2, help="Length of the media")
+    p.add_argument("--repeat", type=int, default=3, help="Report the best of them")
+    p.add_argument(
+        "--modes", nargs="+", default=["whisper", "faster"], help="Whisper modes"
+    )
+    p.add_argument("--cases", nargs="+", help="In default all, e.g. vad-energy/speech")
+    p.add_argument(
+        "--media-dir", help="Keep the generated media here to reuse them next time"
+    )
+
+    p = sub.add_parser("compare", help="Flag the regressions against a baseline")
+    p.add_argument("baseline")
+    p.add_argument("current")
+    p.add_argument("--threshold", type=float, default=0.15)
+    p.add_argument("--min-seconds", type=float, default=0.05)
+
+    p = sub.add_parser("_case", help="Run a single case, used by run")
+    p.add_argument("name")
+    p.add_argument("media_dir")
+    p.add_argument("repeat", type=int)
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args)
+    elif args.command == "compare":
+        compare(args)
+    else:
+        run_case(args.name, args.media_dir, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
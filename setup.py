@@ -6,7 +6,7 @@ requirements = [
     "openai-whisper",
     "opencc-python-reimplemented",
     "parameterized",
-    "pydub",
+    "silero-vad",
     "srt",
     "torchaudio",
     "tqdm",
@@ -24,9 +24,10 @@ setup(
     long_description=open("README.md", "r", encoding="utf-8").read(),
     long_description_content_type="text/markdown",
     extras_require={
-        "all": ["openai", "faster-whisper"],
+        "all": ["openai", "faster-whisper", "onnxruntime"],
         "openai": ["openai"],
         "faster": ["faster-whisper"],
+        "onnx": ["onnxruntime"],
     },
     packages=find_packages(),
     entry_points={
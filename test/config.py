@@ -46,14 +46,32 @@ class TestArgs:
     def __init__(self):
         self.inputs = []
         self.bitrate = "10m"
+        self.stream_copy = False
+        self.render_backend = "moviepy"
+        self.render_jobs = 1
+        self.crossfade = 0
         self.encoding = "utf-8"
         self.sampling_rate = 16000
         self.lang = "zh"
         self.prompt = ""
         self.whisper_model = "small"
         self.device = None
+        self.cpu_workers = None
+        self.cpu_threads = None
+        self.compute_type = "default"
+        self.batch_size = 0
         self.vad = False
+        self.vad_backend = "silero"
+        self.vad_model = None
+        self.pipeline = False
+        self.prefetch = 1
+        self.keep_pcm = False
+        self.jobs = 1
+        self.incremental = False
         self.force = False
+        self.cache_dir = None
+        self.cache_size = 1024
+        self.trace = None
         self.whisper_mode = (
             "faster" if os.environ.get("WHISPER_MODE") == "faster" else "whisper"
         )
@@ -0,0 +1,64 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from test_pipeline import fake_args
+
+from autocut.cache import TranscribeCache
+from autocut.registry import registry
+from autocut.transcribe import Transcribe
+
+
+class TestTranscribeCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.audio = np.random.RandomState(0).rand(16000 * 3).astype(np.float32)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_key(self):
+        cache = TranscribeCache(self.tmp.name)
+        key = cache.key(self.audio, lang="zh", prompt="")
+        self.assertEqual(key, cache.key(self.audio.copy(), prompt="", lang="zh"))
+        self.assertNotEqual(key, cache.key(self.audio, lang="en", prompt=""))
+        self.assertNotEqual(key, cache.key(self.audio[1:], lang="zh", prompt=""))
+
+    def test_get_put(self):
+        cache = TranscribeCache(self.tmp.name)
+        results = [{"origin_timestamp": {"start": 0, "end": 10}, "segments": []}]
+        key = cache.key(self.audio, lang="zh")
+        self.assertIsNone(cache.get(key))
+        cache.put(key, results)
+        self.assertEqual(cache.get(key), results)
+
+    def test_evict(self):
+        cache = TranscribeCache(self.tmp.name, max_size=2500)
+        keys = [cache.key(self.audio, i=i) for i in range(3)]
+        for i, key in enumerate(keys[:2]):
+            cache.put(key, b"x" * 1000)
+            os.utime(cache._filename(key), (i, i))
+        # keys[0] is used recently, so keys[1] is evicted
+        cache.get(keys[0])
+        cache.put(keys[2], b"x" * 1000)
+        self.assertIsNotNone(cache.get(keys[0]))
+        self.assertIsNone(cache.get(keys[1]))
+        self.assertIsNotNone(cache.get(keys[2]))
+
+    def test_options(self):
+        # The options that change the results are in the key
+        args = fake_args()
+        transcribe = Transcribe(args)
+        options = transcribe._cache_options()
+        args.device = "cuda"
+        self.assertNotEqual(transcribe._cache_options(), options)
+
+        args.whisper_mode = "faster"
+        options = transcribe._cache_options()
+        for name, value in [("compute_type", "int8"), ("batch_size", 8)]:
+            setattr(args, name, value)
+            self.assertNotEqual(transcribe._cache_options(), options)
+            options = transcribe._cache_options()
+        registry.clear()
@@ -0,0 +1,39 @@
+import subprocess
+import sys
+import unittest
+
+from parameterized import parameterized
+
+
+class TestImport(unittest.TestCase):
+    @parameterized.expand(
+        [
+            ("autocut", ["torch", "moviepy", "whisper", "ffmpeg", "opencc"]),
+            ("autocut.main", ["torch", "moviepy", "whisper", "ffmpeg", "opencc"]),
+            ("autocut.cut", ["torch", "moviepy", "whisper"]),
+            ("autocut.transcribe", ["torch", "moviepy", "whisper", "faster_whisper"]),
+            ("autocut.vad", ["torch", "whisper", "autocut.whisper_model"]),
+        ]
+    )
+    def test_lazy(self, module, heavy):
+        # The heavy libraries are imported only once a command needs them
+        p = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                f"import sys, {module}; print(' '.join(sys.modules))",
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        loaded = set(p.stdout.split())
+        self.assertEqual([m for m in heavy if m in loaded], [])
+
+    def test_package_exports(self):
+        import autocut
+
+        self.assertEqual(autocut.Transcribe.__name__, "Transcribe")
+        self.assertTrue(callable(autocut.load_audio))
+        with self.assertRaises(AttributeError):
+            autocut.missing
@@ -0,0 +1,89 @@
+import os
+import tempfile
+import unittest
+
+import ffmpeg
+import numpy as np
+import srt
+from parameterized import parameterized
+
+from config import TEST_MEDIA_PATH
+from test_pipeline import fake_args
+
+from autocut import utils
+from autocut.registry import registry
+from autocut.transcribe import Transcribe
+
+
+class TestIncremental(unittest.TestCase):
+    @parameterized.expand([("1",), ("0",)])
+    def test_growing_recording(self, vad):
+        args = fake_args()
+        args.vad = vad
+        audio = np.tile(
+            utils.load_audio(os.path.join(TEST_MEDIA_PATH, "test001.mp4")), 6
+        )
+        with tempfile.TemporaryDirectory() as tmp:
+            full = os.path.join(tmp, "full.mp3")
+            ffmpeg.input("pipe:", format="f32le", ar=16000, ac=1).output(full).run(
+                input=audio.tobytes(), quiet=True
+            )
+            with open(full, "rb") as f:
+                data = f.read()
+
+            # Record it in 4 steps, then it stops growing
+            input = os.path.join(tmp, "live.mp3")
+            transcribe = Transcribe(args)
+            previous = []
+            for size in [
+                len(data) // 4,
+                len(data) // 2,
+                len(data),
+                len(data),
+                len(data),
+            ]:
+                with open(input, "wb") as f:
+                    f.write(data[:size])
+                done = transcribe.run_incremental(input)
+                with open(os.path.join(tmp, "live.srt")) as f:
+                    subs = list(srt.parse(f.read()))
+                # The subtitles written before are kept as they are
+                self.assertEqual(subs[: len(previous)], previous)
+                previous = subs
+            self.assertTrue(done)
+            # --vad 0 never runs VAD
+            self.assertEqual(transcribe.vad_model is None, vad == "0")
+
+            self.assertEqual([s.index for s in subs], list(range(1, len(subs) + 1)))
+            for a, b in zip(subs, subs[1:]):
+                self.assertLessEqual(a.end, b.start)
+            self.assertAlmostEqual(
+                subs[-1].end.total_seconds(), len(audio) / 16000, delta=2
+            )
+            md = utils.MD(os.path.join(tmp, "live.md"), args.encoding)
+            self.assertEqual(len(md.tasks()), len(subs) + 1)
+            self.assertTrue(md.tasks()[-1][1].startswith(f"[{len(subs)},"))
+        registry.clear()
+
+    def test_no_speech(self):
+        # VAD finds no speech in noise, which is then transcribed as a whole, up
+        # to the guard while the recording grows
+        args = fake_args()
+        audio = np.random.RandomState(0).normal(0, 1e-4, 60 * 16000)
+        with tempfile.TemporaryDirectory() as tmp:
+            input = os.path.join(tmp, "live.wav")
+            transcribe = Transcribe(args)
+            ends = []
+            for seconds in [30, 60, 60]:
+                with open(input, "wb") as f:
+                    f.write(
+                        utils.encode_pcm(audio[: seconds * 16000] * 32767, 16000, "wav")
+                    )
+                transcribe.run_incremental(input)
+                with open(os.path.join(tmp, "live.srt")) as f:
+                    subs = list(srt.parse(f.read()))
+                ends.append(subs[-1].end.total_seconds() if subs else 0)
+            self.assertAlmostEqual(ends[0], 30 - transcribe.incremental_guard, 1)
+            self.assertAlmostEqual(ends[-1], 60, 1)
+            self.assertEqual([s.index for s in subs], list(range(1, len(subs) + 1)))
+        registry.clear()
@@ -0,0 +1,101 @@
+import os
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+
+import numpy as np
+import srt
+
+from config import TEST_MEDIA_PATH
+from test_pipeline import fake_args
+
+from autocut import pipeline, utils, vad
+from autocut.registry import registry
+from autocut.transcribe import Transcribe
+
+
+class TestLive(unittest.TestCase):
+    def test_segmenter(self):
+        # Tone bursts between silences, the third one is too long to wait for
+        sr = 16000
+        rng = np.random.RandomState(0)
+        parts, bursts = [], []
+        for seconds in [3, 5, 70, 2, 0.5, 4]:
+            start = sum(len(p) for p in parts) + sr
+            parts.append(rng.normal(0, 1e-4, sr).astype(np.float32))
+            t = np.arange(int(seconds * sr)) / sr
+            # Short pauses like between syllables, the hangover bridges them
+            tone = 0.3 * np.sin(2 * np.pi * 220 * t) * (t % 1 < 0.8)
+            parts.append(tone.astype(np.float32))
+            bursts.append((start, start + len(t)))
+        parts.append(rng.normal(0, 1e-4, 2 * sr).astype(np.float32))
+        audio = np.concatenate(parts)
+
+        handed = []
+        buffered = []
+
+        def callback(buf, base, speeches):
+            buffered.append(len(buf))
+            handed.extend((s["start"] + base, s["end"] + base) for s in speeches)
+
+        segmenter = pipeline.LiveSegmenter(
+            vad.EnergyVAD(sr), sr, sr // 5, 30 * sr, callback
+        )
+        segmenter.run(utils.iter_blocks(audio, sr // 2))
+
+        self.assertEqual(segmenter.num_samples, len(audio))
+        self.assertLessEqual(max(buffered), 31 * sr)
+        for a, b in zip(handed, handed[1:]):
+            self.assertLessEqual(a[1], b[0])
+        # Every burst but the short one is covered, the long one in parts
+        for start, end in bursts:
+            covered = sum(max(0, min(e, end) - max(s, start)) for s, e in handed)
+            if end - start > sr:
+                self.assertGreater(covered, 0.95 * (end - start))
+            else:
+                self.assertEqual(covered, 0)
+        self.assertGreater(len(handed), len(bursts))
+
+    @unittest.skipUnless(hasattr(os, "mkfifo"), "named pipes are not supported")
+    def test_named_pipe(self):
+        args = fake_args()
+        with tempfile.TemporaryDirectory() as tmp:
+            fifo = os.path.join(tmp, "live.wav")
+            os.mkfifo(fifo)
+            self.assertTrue(utils.is_live(fifo))
+            # Stream the test file into the pipe at real-time speed
+            proc = subprocess.Popen(
+                ["ffmpeg", "-nostdin", "-y", "-re", "-i"]
+                + [os.path.join(TEST_MEDIA_PATH, "test001.mp4")]
+                + ["-ac", "1", "-ar", "16000", "-f", "wav", fifo],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            srt_fn = os.path.join(tmp, "live.srt")
+            first = []
+
+            def watch():
+                while proc.poll() is None and not first:
+                    if os.path.exists(srt_fn) and os.path.getsize(srt_fn):
+                        first.append(time.time())
+                    time.sleep(0.05)
+
+            watcher = threading.Thread(target=watch)
+            watcher.start()
+            Transcribe(args).run_live(fifo)
+            end = time.time()
+            watcher.join()
+            self.assertEqual(proc.wait(), 0)
+
+            # Subtitles were written while the stream was still going on
+            self.assertTrue(first)
+            self.assertLess(first[0], end - 2)
+            with open(srt_fn) as f:
+                subs = list(srt.parse(f.read()))
+            self.assertGreater(len(subs), 1)
+            self.assertEqual([s.index for s in subs], list(range(1, len(subs) + 1)))
+            md = utils.MD(os.path.join(tmp, "live.md"), args.encoding)
+            self.assertEqual(len(md.tasks()), len(subs) + 1)
+        registry.clear()
@@ -0,0 +1,138 @@
+import datetime
+import http.server
+import os
+import tempfile
+import threading
+import unittest
+import urllib.error
+from unittest import mock
+
+from autocut import utils
+from autocut.whisper_model import OpenAIModel
+from config import TEST_MEDIA_PATH
+
+SRT = """1
+00:00:00,000 --> 00:00:01,000
+hello
+"""
+
+
+class FakeTranscriptionHandler(http.server.BaseHTTPRequestHandler):
+    # Mimics POST /v1/audio/transcriptions with response_format=srt
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        with self.server.lock:
+            self.server.requests.append((self.path, self.headers, body))
+            # Injected failures are returned first, in order
+            status = self.server.failures.pop(0) if self.server.failures else 200
+        if status != 200:
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        data = SRT.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestOpenAIModel(unittest.TestCase):
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(
+            ("127.0.0.1", 0), FakeTranscriptionHandler
+        )
+        self.server.requests = []
+        self.server.failures = []
+        self.server.lock = threading.Lock()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        env = {
+            "OPENAI_API_KEY": "test-key",
+            "OPENAI_BASE_URL": f"http://127.0.0.1:{self.server.server_port}/v1",
+        }
+        with mock.patch.dict(os.environ, env):
+            self.model = OpenAIModel(rpm=3)
+        self.model.load()
+        self.model.rpm = 6000
+        self.model.retry_base_delay = 0.01
+        self.tmp = tempfile.TemporaryDirectory()
+        self.input = os.path.join(self.tmp.name, "test001.mp4")
+        self.audio = utils.load_audio(os.path.join(TEST_MEDIA_PATH, "test001.mp4"))
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    def test_transcribe(self):
+        speeches = [{"start": 1952, "end": 76256}, {"start": 94112, "end": 158176}]
+        subs = self.model.transcribe(self.input, self.audio, speeches, "zh", "")
+        self.assertEqual(len(self.server.requests), 1)
+        path, headers, body = self.server.requests[0]
+        self.assertEqual(path, "/v1/audio/transcriptions")
+        self.assertEqual(headers["Authorization"], "Bearer test-key")
+        self.assertIn(b'filename="audio.flac"', body)
+        self.assertIn(b"fLaC", body)
+        # compressed 16kHz mono, smaller than the raw PCM of the chunk
+        self.assertLess(len(body), (158176 - 1952) * 2)
+        self.assertEqual(len(subs), 1)
+        self.assertAlmostEqual(subs[0].start.total_seconds(), 1952 / 16000, 3)
+
+    def test_spans(self):
+        # Only the speeches are uploaded, the silence between them is not
+        self.model.upload_format = "wav"
+        speeches = [{"start": 1952, "end": 76256}, {"start": 94112, "end": 158176}]
+        self.model.transcribe(self.input, self.audio, speeches, "zh", "")
+        self.assertEqual(len(self.server.requests), 1)
+        body = self.server.requests[0][2]
+        wav = body[body.index(b"RIFF") : body.rindex(b"\r\n--")]
+        pcm = wav[wav.index(b"data") + 8 :]
+        self.assertEqual(len(pcm), (76256 - 1952 + 158176 - 94112) * 2)
+
+        spans = [(16000, 32000), (64000, 80000)]
+        t = lambda sec: datetime.timedelta(seconds=sec)
+        self.assertEqual(self.model._input_time(spans, t(0.5)), t(1.5))
+        self.assertEqual(self.model._input_time(spans, t(1)), t(4))
+        self.assertEqual(self.model._input_time(spans, t(1), is_end=True), t(2))
+        self.assertEqual(self.model._input_time(spans, t(1.5)), t(4.5))
+        self.assertEqual(self.model._input_time(spans, t(3)), t(5))
+
+        left, right = self.model._split([(0, 10), (20, 26)])
+        self.assertEqual(left, [(0, 8)])
+        self.assertEqual(right, [(8, 10), (20, 26)])
+
+    def test_chunks(self):
+        self.model.chunk_seconds = 4
+        speeches = [{"start": 0, "end": len(self.audio)}]
+        subs = self.model.transcribe(self.input, self.audio, speeches, "zh", "")
+        # 10.26 sec are split into 3 chunks
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(sorted(s.start.total_seconds() for s in subs), [0.0, 4.0, 8.0])
+
+    def test_retry(self):
+        self.model.chunk_seconds = 4
+        self.server.failures = [429, 500, 503]
+        speeches = [{"start": 0, "end": len(self.audio)}]
+        subs = self.model.transcribe(self.input, self.audio, speeches, "zh", "")
+        self.assertEqual(len(self.server.requests), 6)
+        self.assertEqual(len(subs), 3)
+
+    def test_resume(self):
+        self.model.chunk_seconds = 4
+        self.model.max_concurrency = 1
+        speeches = [{"start": 0, "end": len(self.audio)}]
+        # The second chunk fails with an error that is not retried
+        self.server.failures = [200, 400]
+        with self.assertRaises(urllib.error.HTTPError):
+            self.model.transcribe(self.input, self.audio, speeches, "zh", "")
+        self.assertTrue(os.path.exists(self.input + ".openai.json"))
+
+        self.server.requests = []
+        subs = self.model.transcribe(self.input, self.audio, speeches, "zh", "")
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(sorted(s.start.total_seconds() for s in subs), [0.0, 4.0, 8.0])
+        self.assertFalse(os.path.exists(self.input + ".openai.json"))
@@ -0,0 +1,169 @@
+import copy
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import srt
+from parameterized import parameterized
+
+from config import TEST_MEDIA_PATH, TestArgs
+
+from autocut import pipeline, utils, whisper_model
+from autocut.registry import registry
+from autocut.transcribe import Transcribe
+
+
+def random_segments(seed, n=200):
+    rng = np.random.RandomState(seed)
+    bounds = np.cumsum(rng.randint(1, 5 * 16000, 2 * n))
+    return [{"start": int(s), "end": int(e)} for s, e in bounds.reshape(-1, 2)]
+
+
+class FakeModel(whisper_model.WhisperModel):
+    def transcribe(self, audio, speech_array_indices, lang, prompt, callback=None):
+        res = []
+        for seg in self._pack(speech_array_indices):
+            samples = audio[seg["start"] : seg["end"]]
+            assert len(samples) == seg["end"] - seg["start"]
+            res.append(
+                {
+                    "origin_timestamp": seg,
+                    "segments": [
+                        {"start": 0, "end": len(samples) / 16000, "text": "x"}
+                    ],
+                }
+            )
+            if callback:
+                callback(res[-1])
+        return res
+
+
+def fake_args():
+    args = TestArgs()
+    args.whisper_mode = "whisper"
+    args.vad = "1"
+    args.vad_backend = "energy"
+    options = dict(num_workers=None, num_threads=None)
+    registry.get(
+        ("whisper", args.whisper_model, args.device, 16000),
+        options,
+        lambda: FakeModel(),
+    )
+    return args
+
+
+class TestPipeline(unittest.TestCase):
+    @parameterized.expand([(0,), (1,), (2,)])
+    def test_postprocess(self, seed):
+        speeches = random_segments(seed)
+        expected = utils.remove_short_segments(copy.deepcopy(speeches), 16000)
+        expected = utils.expand_segments(expected, 3200, 0, speeches[-1]["end"])
+        expected = utils.merge_adjacent_segments(expected, 8000)
+        self.assertEqual(
+            list(pipeline.iter_postprocess(speeches, 16000, 3200, 8000)), expected
+        )
+
+        self.assertEqual(
+            list(pipeline.iter_pack(expected, 30 * 16000)),
+            utils.pack_segments(expected, 30 * 16000),
+        )
+        self.assertEqual(
+            list(pipeline.iter_pack(expected, 30 * 16000, 2 * 16000)),
+            utils.pack_segments(expected, 30 * 16000, 2 * 16000),
+        )
+
+    def test_transcribe(self):
+        args = fake_args()
+        with tempfile.TemporaryDirectory() as tmp:
+            input = os.path.join(tmp, "test001.mp4")
+            shutil.copy(os.path.join(TEST_MEDIA_PATH, "test001.mp4"), input)
+            transcribe = Transcribe(args)
+            expected = transcribe._get_transcribe_results(input)
+            os.remove(input + ".pcm")
+
+            args.pipeline = True
+            self.assertEqual(transcribe._get_transcribe_results(input), expected)
+            self.assertEqual(
+                sorted(os.listdir(tmp)), ["test001.mp4", "test001.mp4.pcm"]
+            )
+            # Run again from the sidecar
+            self.assertEqual(transcribe._get_transcribe_results(input), expected)
+        registry.clear()
+
+    def test_write_outputs(self):
+        args = fake_args()
+        args.force = True
+        args.vad_backend = "silero"
+        with tempfile.TemporaryDirectory() as tmp:
+            # Long enough for a few windows
+            audio = utils.load_audio(os.path.join(TEST_MEDIA_PATH, "test001.mp4"))
+            input = os.path.join(tmp, "test001.wav")
+            with open(input, "wb") as f:
+                f.write(utils.encode_pcm(np.tile(audio, 8) * 32767, format="wav"))
+            transcribe = Transcribe(args)
+            results = transcribe._get_transcribe_results(input)
+            subs = transcribe.whisper_model.gen_srt(results)
+            self.assertGreater(len(results), 1)
+
+            # Nothing is in place until all results are written
+            outputs = []
+            transcribe_fn = transcribe.whisper_model.transcribe
+
+            def check(*args, callback):
+                def on_result(r):
+                    callback(r)
+                    outputs.append(sorted(os.listdir(tmp)))
+
+                return transcribe_fn(*args, callback=on_result)
+
+            transcribe.whisper_model.transcribe = check
+            args.inputs = [input]
+            transcribe.run()
+            del transcribe.whisper_model.transcribe
+            self.assertEqual(len(outputs), len(results))
+            for files in outputs:
+                self.assertIn("test001.srt.tmp", files)
+                self.assertNotIn("test001.srt", files)
+
+            # The same as composing all subtitles at once
+            with open(os.path.join(tmp, "test001.srt")) as f:
+                self.assertEqual(f.read(), srt.compose(subs))
+            md = utils.MD(os.path.join(tmp, "test001.md"), args.encoding)
+            tasks = [t for _, t in md.tasks()[1:]]
+            self.assertEqual(len(tasks), len(subs))
+            self.assertTrue(tasks[-1].startswith(f"[{len(subs)},"))
+            self.assertEqual(
+                sorted(os.listdir(tmp)),
+                ["test001.md", "test001.srt", "test001.wav"],
+            )
+        registry.clear()
+
+    @parameterized.expand(
+        [(0, False, False), (1, False, True), (3, False, False), (2, True, True)]
+    )
+    def test_prefetch(self, prefetch, pipelined, keep_pcm):
+        args = fake_args()
+        args.force = True
+        args.prefetch = prefetch
+        args.pipeline = pipelined
+        args.keep_pcm = keep_pcm
+        with tempfile.TemporaryDirectory() as tmp:
+            args.inputs = []
+            for i in range(3):
+                input = os.path.join(tmp, f"{i}.mp4")
+                shutil.copy(os.path.join(TEST_MEDIA_PATH, "test001.mp4"), input)
+                args.inputs.append(input)
+            transcribe = Transcribe(args)
+            transcribe.run()
+
+            for input in args.inputs:
+                with open(input[:-4] + ".srt") as f:
+                    srt = f.read()
+                with open(args.inputs[0][:-4] + ".srt") as f:
+                    self.assertEqual(srt, f.read())
+                self.assertEqual(os.path.exists(input + ".pcm"), keep_pcm)
+            self.assertEqual(len(os.listdir(tmp)), 12 if keep_pcm else 9)
+            self.assertGreater(transcribe.stage_times["transcribe"], 0)
+        registry.clear()
@@ -0,0 +1,296 @@
+import datetime
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+import wave
+from unittest import mock
+
+import numpy as np
+import srt
+from parameterized import parameterized
+
+from config import TestArgs
+
+from autocut import render, utils
+from autocut.cut import Cutter
+
+# The kept seconds, cut points are not at keyframes, which are every 2 sec
+SEGMENTS = [(0.5, 3.3), (5.1, 9.7), (10.5, 11.9)]
+
+
+def make_media(fn, codec="libx264", seconds=12):
+    # A white flash and a beep every 1.3 sec, to find out whether the video and
+    # the audio are still in sync after cutting
+    marker = "lt(mod(t\\,1.3)\\,0.2)"
+    subprocess.run(
+        [
+            "ffmpeg",
+            "-nostdin",
+            "-loglevel",
+            "error",
+            "-y",
+            "-f",
+            "lavfi",
+            "-i",
+            f"color=black:s=160x120:r=25:d={seconds},"
+            f"drawbox=c=white:t=fill:enable='{marker}',format=yuv420p",
+            "-f",
+            "lavfi",
+            "-i",
+            f"sine=f=1000:r=48000:d={seconds},volume=0:enable='not({marker})'",
+            "-c:v",
+            codec,
+            "-g",
+            "50",
+            "-sc_threshold",
+            "0",
+            "-c:a",
+            "aac",
+            "-shortest",
+            fn,
+        ],
+        check=True,
+    )
+
+
+def starts(on, rate):
+    return np.flatnonzero(np.diff(on.astype(int), prepend=0) > 0) / rate
+
+
+def beeps(fn):
+    # The start times of the beeps
+    audio = utils.load_audio(fn)
+    rms = np.sqrt(np.mean(audio[: len(audio) // 160 * 160].reshape(-1, 160) ** 2, 1))
+    return starts(rms > 0.05, 100)
+
+
+def markers(fn):
+    # The start times of the flashes and the beeps
+    p = subprocess.run(
+        ["ffmpeg", "-nostdin", "-i", fn, "-map", "0:v", "-f", "rawvideo"]
+        + ["-pix_fmt", "gray", "-s", "16x12", "-"],
+        capture_output=True,
+        check=True,
+    )
+    flash = np.frombuffer(p.stdout, np.uint8).reshape(-1, 16 * 12).mean(axis=1) > 128
+    return starts(flash, 25), beeps(fn)
+
+
+def cut(media_fn, **kwargs):
+    srt_fn = os.path.splitext(media_fn)[0] + ".srt"
+    subs = [
+        srt.Subtitle(
+            i, datetime.timedelta(seconds=s), datetime.timedelta(seconds=e), "x"
+        )
+        for i, (s, e) in enumerate(SEGMENTS, 1)
+    ]
+    with open(srt_fn, "w") as f:
+        f.write(srt.compose(subs))
+    args = TestArgs()
+    args.inputs = [media_fn, srt_fn]
+    args.force = True
+    args.bitrate = kwargs.pop("bitrate", "1m")
+    for k, v in kwargs.items():
+        setattr(args, k, v)
+    Cutter(args).run()
+    ext = "mp4" if utils.is_video(media_fn) else "mp3"
+    return utils.change_ext(utils.add_cut(media_fn), ext)
+
+
+class TestRender(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        cls.h264 = os.path.join(cls.tmp, "h264.mp4")
+        make_media(cls.h264)
+        # What the moviepy backend makes of it
+        cls.expected = cut(cls.h264)
+        os.rename(cls.expected, cls.expected + ".moviepy.mp4")
+        cls.expected += ".moviepy.mp4"
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    @parameterized.expand([(True,), (False,)])
+    def test_plan(self, reordered):
+        times = np.arange(300) * 0.04
+        keyframes = np.arange(300) % 50 == 0
+        segments = [{"start": s, "end": e} for s, e in SEGMENTS]
+        parts = render.plan_parts(render.Frames(times, keyframes, reordered), segments)
+
+        # Every kept frame is in exactly one part, copies start at keyframes
+        frames = [i for p in parts for i in range(p.start, p.end)]
+        expected = [
+            i for i in range(300) if any(s <= times[i] < e for s, e in SEGMENTS)
+        ]
+        self.assertEqual(frames, expected)
+        for p in parts:
+            if p.copy:
+                self.assertTrue(keyframes[p.start])
+                # With reordered frames a copy ends right before a keyframe
+                self.assertTrue(not reordered or keyframes[p.end])
+        self.assertEqual(
+            sum(p.end - p.start for p in parts if p.copy), 50 if reordered else 126
+        )
+
+    def assertSynced(self, output):
+        # The flashes and beeps are where moviepy has them, and in sync within
+        # a frame
+        flashes, beeps = markers(output)
+        expected_flashes, expected_beeps = markers(self.expected)
+        self.assertGreater(len(flashes), 5)
+        np.testing.assert_allclose(flashes, expected_flashes, atol=0.045)
+        np.testing.assert_allclose(beeps, expected_beeps, atol=0.03)
+        np.testing.assert_allclose(beeps, flashes, atol=0.045)
+
+        p = subprocess.run(
+            ["ffmpeg", "-nostdin", "-v", "error", "-i", output, "-f", "null", "-"],
+            capture_output=True,
+        )
+        self.assertEqual(p.stderr, b"")
+
+    def test_stream_copy(self):
+        output = cut(self.h264, stream_copy=True)
+
+        # Frame accurate, moviepy may add a frame
+        kept = sum(
+            np.ceil(e / 0.04 - 1e-9) - np.ceil(s / 0.04 - 1e-9) for s, e in SEGMENTS
+        )
+        self.assertAlmostEqual(utils.get_duration(output), kept * 0.04, delta=0.03)
+        self.assertAlmostEqual(
+            utils.get_duration(output), utils.get_duration(self.expected), delta=0.05
+        )
+        self.assertSynced(output)
+
+    def test_ffmpeg_backend(self):
+        output = cut(self.h264, render_backend="ffmpeg")
+        self.assertAlmostEqual(
+            utils.get_duration(output), utils.get_duration(self.expected), delta=0.05
+        )
+        self.assertSynced(output)
+
+        # Peak normalized like moviepy
+        audio, expected = utils.load_audio(output), utils.load_audio(self.expected)
+        self.assertAlmostEqual(np.abs(audio).max(), np.abs(expected).max(), delta=0.05)
+
+    def audio(self):
+        media_fn = os.path.join(self.tmp, "audio.m4a")
+        if not os.path.exists(media_fn):
+            subprocess.run(
+                ["ffmpeg", "-nostdin", "-loglevel", "error", "-y", "-i", self.h264]
+                + ["-vn", "-c", "copy", media_fn],
+                check=True,
+            )
+        return media_fn
+
+    def test_ffmpeg_backend_audio(self):
+        output = os.path.join(self.tmp, "audio_ffmpeg.mp3")
+        segments = [{"start": s, "end": e} for s, e in SEGMENTS]
+        render.FilterRenderer(self.audio(), "1m").run(segments, output, False)
+        self.assertAlmostEqual(
+            utils.get_duration(output), sum(e - s for s, e in SEGMENTS), delta=0.1
+        )
+        np.testing.assert_allclose(beeps(output), beeps(self.expected), atol=0.03)
+
+    def test_audio(self):
+        output = cut(self.audio())
+        self.assertAlmostEqual(
+            utils.get_duration(output), sum(e - s for s, e in SEGMENTS), delta=0.1
+        )
+        np.testing.assert_allclose(beeps(output), beeps(self.expected), atol=0.03)
+        self.assertAlmostEqual(np.abs(utils.load_audio(output)).max(), 1, delta=0.05)
+
+    @parameterized.expand([(0,), (0.01,)])
+    def test_audio_samples(self, crossfade):
+        # Sample accurate, written to wav to compare the samples
+        sr = render.AudioRenderer.sample_rate
+        pcm = np.random.RandomState(0).randint(-16000, 16000, (sr * 3, 2), np.int16)
+        media_fn = os.path.join(self.tmp, "noise.wav")
+        with wave.open(media_fn, "wb") as f:
+            f.setnchannels(2)
+            f.setsampwidth(2)
+            f.setframerate(sr)
+            f.writeframes(pcm.tobytes())
+        # The last one is cut short by the end of the audio
+        segments = [(0.1, 0.5), (0.52, 1.3), (2.0, 2.004), (2.5, 5)]
+        output = os.path.join(self.tmp, "noise_cut.wav")
+        with mock.patch.object(render.AudioRenderer, "block_size", 10000):
+            render.AudioRenderer(media_fn, "1m", crossfade).run(
+                [{"start": s, "end": e} for s, e in segments], output
+            )
+
+        pieces = [pcm[round(s * sr) : round(e * sr)].astype(float) for s, e in segments]
+        peak = max(np.abs(p).max() for p in pieces)
+        expected = pieces[0]
+        for prev, piece in zip(pieces, pieces[1:]):
+            # Over at most half of the shorter segment
+            fade = min(round(crossfade * sr), len(prev) // 2, len(piece) // 2)
+            ramp = np.linspace(0, 1, fade)[:, None]
+            mixed = expected[len(expected) - fade :] * (1 - ramp) + piece[:fade] * ramp
+            expected = np.concatenate(
+                [expected[: len(expected) - fade], mixed, piece[fade:]]
+            )
+        expected *= 32767 / peak
+        with wave.open(output) as f:
+            actual = np.frombuffer(f.readframes(f.getnframes()), np.int16)
+        self.assertEqual(actual.shape, expected.reshape(-1).shape)
+        self.assertLessEqual(np.abs(actual - expected.reshape(-1)).max(), 1)
+
+    @parameterized.expand([(True, True), (True, False), (False, True)])
+    def test_trim_graph(self, video, audio):
+        graph = render.trim_graph(SEGMENTS, video=video, audio=audio)
+        self.assertEqual(graph.count("split=3"), video + audio)
+        self.assertEqual(graph.count("trim=start="), 3 * (video + audio))
+        self.assertTrue(
+            graph.endswith(
+                f"concat=n=3:v={int(video)}:a={int(audio)}"
+                + "[v]" * video
+                + "[a]" * audio
+            )
+        )
+
+    def test_fallback(self):
+        media_fn = os.path.join(self.tmp, "mpeg4.mp4")
+        make_media(media_fn, codec="mpeg4")
+        copier = render.StreamCopier(media_fn, "1m")
+        segments = [{"start": s, "end": e} for s, e in SEGMENTS]
+        self.assertFalse(copier.run(segments, os.path.join(self.tmp, "x.mp4")))
+        self.assertFalse(os.path.exists(os.path.join(self.tmp, "x.mp4")))
+
+        # Re-encoded by the chosen backend
+        output = cut(media_fn, stream_copy=True, render_backend="ffmpeg")
+        self.assertTrue(os.path.exists(output))
+
+    @parameterized.expand([("ffmpeg",), ("moviepy",)])
+    def test_chunks(self, backend):
+        with mock.patch.object(render.ChunkRenderer, "min_chunk_seconds", 1):
+            output = cut(self.h264, render_backend=backend, render_jobs=3)
+        self.assertAlmostEqual(
+            utils.get_duration(output), utils.get_duration(self.expected), delta=0.05
+        )
+        self.assertSynced(output)
+
+    def test_chunks_failed(self):
+        # A worker fails, nothing is left behind
+        media_fn = os.path.join(self.tmp, "failed", "h264.mp4")
+        os.makedirs(os.path.dirname(media_fn))
+        shutil.copy(self.h264, media_fn)
+        with mock.patch.object(render.ChunkRenderer, "min_chunk_seconds", 1):
+            with self.assertRaises(RuntimeError):
+                cut(media_fn, render_backend="ffmpeg", render_jobs=2, bitrate="x")
+        self.assertEqual(
+            sorted(os.listdir(os.path.dirname(media_fn))), ["h264.mp4", "h264.srt"]
+        )
+
+    @parameterized.expand([([(0, 100)], 3), ([(0, 10), (20, 25), (30, 60)], 4)])
+    def test_plan_chunks(self, ranges, jobs):
+        chunks = render.plan_chunks(ranges, jobs)
+        self.assertEqual(len(chunks), jobs)
+        # Every frame is in one chunk, in order, and they differ by a frame
+        frames = [i for c in chunks for s, e in c for i in range(s, e)]
+        self.assertEqual(frames, [i for s, e in ranges for i in range(s, e)])
+        sizes = [sum(e - s for s, e in c) for c in chunks]
+        self.assertLessEqual(max(sizes) - min(sizes), 1)
@@ -0,0 +1,99 @@
+import copy
+import unittest
+
+import numpy as np
+from parameterized import parameterized
+
+from autocut import utils
+from autocut.segments import SegmentSet
+
+SEEDS = [(i,) for i in range(10)]
+
+
+def random_segments(seed, n=100, overlap=False):
+    # Sorted segments, overlapping neighbors if overlap
+    rng = np.random.RandomState(seed)
+    starts = np.cumsum(rng.randint(0, 2000, n))
+    lengths = rng.randint(1, 3000 if overlap else 2000, n)
+    if not overlap:
+        lengths = np.minimum(lengths, np.diff(starts, append=starts[-1] + 2000))
+    return [
+        {"start": int(s), "end": int(s + l)} for s, l in zip(starts, lengths) if l > 0
+    ]
+
+
+def mask(segments, n):
+    m = np.zeros(n, dtype=bool)
+    for s, e in segments:
+        m[s:e] = True
+    return m
+
+
+def cut_merge(segments, gap):
+    # The merge loop Cutter.run used before
+    results = []
+    for x in segments:
+        if results and x["start"] - results[-1]["end"] < gap:
+            results[-1]["end"] = x["end"]
+        else:
+            results.append(dict(x))
+    return results
+
+
+class TestSegmentSet(unittest.TestCase):
+    @parameterized.expand(SEEDS)
+    def test_filter(self, seed):
+        segments = random_segments(seed)
+        self.assertEqual(
+            SegmentSet.from_dicts(segments).filter(500).to_dicts(),
+            utils.remove_short_segments(segments, 500),
+        )
+
+    @parameterized.expand(SEEDS)
+    def test_expand(self, seed):
+        segments = random_segments(seed)
+        total = segments[-1]["end"] + 100
+        for head, tail in [(0, 0), (200, 0), (200, 300)]:
+            self.assertEqual(
+                SegmentSet.from_dicts(segments).expand(head, tail, total).to_dicts(),
+                utils.expand_segments(segments, head, tail, total),
+            )
+
+    @parameterized.expand(SEEDS)
+    def test_merge(self, seed):
+        for overlap in [False, True]:
+            segments = random_segments(seed, overlap=overlap)
+            original = copy.deepcopy(segments)
+            for gap in [0, 500, 5000]:
+                expected = utils.merge_adjacent_segments(segments, gap)
+                self.assertEqual(segments, original)
+                merged = SegmentSet.from_dicts(segments).merge(gap).to_dicts()
+                self.assertEqual(merged, expected)
+                self.assertEqual(merged, cut_merge(segments, gap))
+
+    @parameterized.expand(SEEDS)
+    def test_set_operations(self, seed):
+        a = SegmentSet.from_dicts(random_segments(seed))
+        b = SegmentSet.from_dicts(random_segments(seed + 100))
+        n = max(a.ends.max(), b.ends.max()) + 10
+        ma, mb = mask(a, n), mask(b, n)
+
+        inverted = a.invert(n)
+        np.testing.assert_array_equal(mask(inverted, n), ~ma)
+        np.testing.assert_array_equal(mask(a.intersect(b), n), ma & mb)
+        np.testing.assert_array_equal(mask(a.subtract(b), n), ma & ~mb)
+        for s in [inverted, a.intersect(b), a.subtract(b)]:
+            self.assertTrue(np.all(s.lengths > 0))
+            self.assertTrue(np.all(s.starts[1:] >= s.ends[:-1]))
+
+    def test_empty(self):
+        empty = SegmentSet()
+        a = SegmentSet([[0, 10], [20, 30]])
+        self.assertEqual(empty.merge(5), empty)
+        self.assertEqual(empty.invert(10), SegmentSet([[0, 10]]))
+        self.assertEqual(a.intersect(empty), empty)
+        self.assertEqual(a.subtract(empty), a)
+        self.assertEqual(empty.subtract(a), empty)
+        self.assertEqual(a.merge(10), a)
+        self.assertEqual(a.merge(11), SegmentSet([[0, 30]]))
+        self.assertEqual(a.invert(30), SegmentSet([[10, 20]]))
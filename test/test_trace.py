@@ -0,0 +1,92 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from parameterized import parameterized
+
+from config import TEST_MEDIA_PATH
+from test_pipeline import fake_args
+
+from autocut import trace
+from autocut.registry import registry
+from autocut.transcribe import Transcribe
+
+
+class TestTrace(unittest.TestCase):
+    def setUp(self):
+        trace._events = None
+        trace._named_threads.clear()
+
+    def tearDown(self):
+        trace._events = None
+
+    def spans(self, events):
+        return [e for e in events if e["ph"] == "X"]
+
+    def test_disabled(self):
+        with trace.span("a", x=1) as sp:
+            sp["y"] = 2
+        self.assertFalse(trace.enabled())
+        self.assertEqual(trace.collect(), [])
+
+    def test_nested(self):
+        trace.enable()
+        with trace.span("outer", file="a.mp4") as sp:
+            with trace.span("inner"):
+                pass
+            sp["count"] = 3
+        with self.assertRaises(ValueError):
+            with trace.span("failed"):
+                raise ValueError("bad")
+
+        def run():
+            with trace.span("thread"):
+                pass
+
+        t = threading.Thread(target=run)
+        t.start()
+        t.join()
+
+        events = trace.collect()
+        inner, outer, failed, thread = self.spans(events)
+        self.assertEqual(outer["name"], "outer")
+        self.assertEqual(outer["args"], {"file": "a.mp4", "count": 3})
+        self.assertGreaterEqual(inner["ts"], outer["ts"])
+        self.assertLessEqual(inner["ts"] + inner["dur"], outer["ts"] + outer["dur"])
+        self.assertIn("bad", failed["args"]["error"])
+        self.assertNotEqual(thread["tid"], outer["tid"])
+        # One thread name per thread
+        self.assertEqual(len([e for e in events if e["ph"] == "M"]), 2)
+        self.assertEqual(trace.collect(), [])
+
+        trace.add(events)
+        self.assertEqual(len(trace.collect()), len(events))
+
+    @parameterized.expand([(False,), (True,)])
+    def test_transcribe(self, pipelined):
+        args = fake_args()
+        args.pipeline = pipelined
+        trace.enable()
+        with tempfile.TemporaryDirectory() as tmp:
+            input = os.path.join(tmp, "test001.mp4")
+            shutil.copy(os.path.join(TEST_MEDIA_PATH, "test001.mp4"), input)
+            args.inputs = [input]
+            Transcribe(args).run()
+            trace_fn = os.path.join(tmp, "trace.json")
+            trace.save(trace_fn)
+            with open(trace_fn) as f:
+                events = json.load(f)["traceEvents"]
+
+        names = {e["name"] for e in self.spans(events)}
+        expected = {"transcribe_file", "transcribe", "write_srt_md"}
+        expected |= {"decode_vad"} if pipelined else {"decode", "vad"}
+        self.assertLessEqual(expected, names)
+        for e in self.spans(events):
+            if e["name"] == "transcribe_file":
+                self.assertEqual(e["args"]["file"], input)
+            if e["name"] == "write_srt_md":
+                self.assertGreater(e["args"]["subtitles"], 0)
+        registry.clear()
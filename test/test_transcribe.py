@@ -12,7 +12,7 @@ from config import (
     TEST_MEDIA_FILE_LANG,
     TEST_MEDIA_PATH,
 )
-from autocut.transcribe import Transcribe
+from autocut.transcribe import Transcribe, run_jobs
 
 
 class TestTranscribe(unittest.TestCase):
@@ -38,7 +38,7 @@ class TestTranscribe(unittest.TestCase):
     @classmethod
     def tearDownClass(cls):
         for file in os.listdir(TEST_MEDIA_PATH):
-            if file.endswith("md") or file.endswith("srt"):
+            if file.endswith("md") or file.endswith("srt") or file.endswith("pcm"):
                 os.remove(TEST_MEDIA_PATH + file)
 
     def tearDown(self):
@@ -132,3 +132,26 @@ class TestTranscribe(unittest.TestCase):
         self.assertTrue(
             os.path.exists(TEST_MEDIA_PATH + file_name.split(".")[0] + ".md")
         )
+
+    def test_jobs_transcribe(self):
+        logging.info("检查--jobs参数生成相同的字幕")
+        args = TestArgs()
+        args.force = True
+        args.inputs = [TEST_MEDIA_PATH + file for file in TEST_MEDIA_FILE_SIMPLE]
+        srt_fns = [
+            TEST_MEDIA_PATH + file.split(".")[0] + ".srt"
+            for file in TEST_MEDIA_FILE_SIMPLE
+        ]
+
+        def read_srts():
+            contents = []
+            for fn in srt_fns:
+                with open(fn, encoding=args.encoding) as f:
+                    contents.append(f.read())
+            return contents
+
+        Transcribe(args).run()
+        serial = read_srts()
+        args.jobs = 2
+        run_jobs(args)
+        self.assertEqual(read_srts(), serial)
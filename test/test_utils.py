@@ -0,0 +1,116 @@
+import datetime
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import srt
+
+from autocut import utils
+from config import TEST_MEDIA_PATH
+
+
+class TestSegments(unittest.TestCase):
+    def test_pack_segments(self):
+        segments = [
+            {"start": 0, "end": 10},
+            {"start": 12, "end": 25},
+            {"start": 26, "end": 35},
+            {"start": 40, "end": 100},
+            {"start": 101, "end": 102},
+        ]
+        self.assertEqual(
+            utils.pack_segments(segments, 30),
+            [
+                {"start": 0, "end": 25},
+                {"start": 26, "end": 35},
+                {"start": 40, "end": 100},
+                {"start": 101, "end": 102},
+            ],
+        )
+        # input segments are not modified
+        self.assertEqual(segments[0], {"start": 0, "end": 10})
+        self.assertEqual(utils.pack_segments([], 30), [])
+        # a gap longer than max_gap starts a new window
+        self.assertEqual(
+            utils.pack_segments(segments, 30, max_gap=1),
+            [
+                {"start": 0, "end": 10},
+                {"start": 12, "end": 35},
+                {"start": 40, "end": 100},
+                {"start": 101, "end": 102},
+            ],
+        )
+
+
+class TestPCMSidecar(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.media = os.path.join(self.tmp.name, "test001.mp4")
+        shutil.copy(os.path.join(TEST_MEDIA_PATH, "test001.mp4"), self.media)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_load_pcm(self):
+        audio = utils.load_pcm(self.media)
+        expected = utils.load_audio(self.media)
+        self.assertEqual(len(audio), len(expected))
+        np.testing.assert_array_equal(audio[:], expected)
+        np.testing.assert_array_equal(audio[100:200], expected[100:200])
+        np.testing.assert_array_equal(pickle.loads(pickle.dumps(audio))[:], expected)
+
+    def test_invalidate(self):
+        utils.load_pcm(self.media)
+        mtime = os.path.getmtime(self.media + ".pcm")
+        utils.load_pcm(self.media)
+        self.assertEqual(mtime, os.path.getmtime(self.media + ".pcm"))
+
+        st = os.stat(self.media)
+        os.utime(self.media, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        utils.load_pcm(self.media)
+        self.assertNotEqual(mtime, os.path.getmtime(self.media + ".pcm"))
+
+
+class TestWriters(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_srt_writer(self):
+        subs = [
+            srt.Subtitle(
+                0,
+                datetime.timedelta(seconds=i),
+                datetime.timedelta(seconds=i + 1),
+                "" if i == 2 else f"sub {i}",
+            )
+            for i in range(5)
+        ]
+        fn = os.path.join(self.tmp.name, "a.srt")
+        writer = utils.SRTWriter(fn, "utf-8")
+        self.assertEqual([s.index for s in writer.add(subs[:3])], [1, 2])
+        self.assertFalse(os.path.exists(fn))
+        with open(fn + ".tmp") as f:
+            self.assertEqual(f.read(), srt.compose(subs[:2]))
+        self.assertEqual([s.index for s in writer.add(subs[3:])], [3, 4])
+        writer.close()
+        self.assertFalse(os.path.exists(fn + ".tmp"))
+        with open(fn) as f:
+            self.assertEqual(f.read(), srt.compose(subs))
+
+    def test_md_stream(self):
+        fn = os.path.join(self.tmp.name, "a.md")
+        md = utils.MD(fn, "utf-8")
+        md.add_done_editing(False)
+        md.open()
+        for i in range(3):
+            md.add_task(False, f"task {i}")
+            with open(fn + ".tmp") as f:
+                self.assertEqual(f.read(), "\n".join(md.lines))
+        md.close()
+        self.assertEqual(utils.MD(fn, "utf-8").lines, md.lines)
@@ -0,0 +1,68 @@
+import os
+import unittest
+
+import numpy as np
+
+from config import TEST_MEDIA_PATH
+
+from autocut import utils, vad
+
+
+class TestSileroVAD(unittest.TestCase):
+    def test_detect(self):
+        audio = utils.load_audio(os.path.join(TEST_MEDIA_PATH, "test001.mp4"))
+        model = vad.get_vad()
+        self.assertIs(model, vad.get_vad())
+
+        speeches = vad.detect_speech(model, audio, 600)
+        self.assertGreater(len(speeches), 0)
+        for a, b in zip(speeches, speeches[1:]):
+            self.assertLess(a["start"], a["end"])
+            self.assertLessEqual(a["end"], b["start"])
+        self.assertLessEqual(speeches[-1]["end"], len(audio))
+
+        # a speech split by a block boundary is joined back
+        blocks = vad.detect_speech(model, audio, 7)
+        self.assertLessEqual(abs(len(blocks) - len(speeches)), 2)
+
+    def test_missing_model(self):
+        with self.assertRaises(FileNotFoundError):
+            vad.SileroVAD("not_exist.onnx")
+
+
+class TestEnergyVAD(unittest.TestCase):
+    def test_detect(self):
+        sr = 16000
+        rng = np.random.default_rng(0)
+        audio = rng.normal(0, 1e-3, 10 * sr).astype(np.float32)
+        t = np.arange(sr) / sr
+        tone = 0.3 * np.sin(2 * np.pi * 200 * t).astype(np.float32)
+        audio[2 * sr : 3 * sr] += tone
+        audio[6 * sr : 7 * sr] += tone
+        # loud hiss has a high zero-crossing rate
+        audio[8 * sr : 9 * sr] = rng.normal(0, 0.3, sr)
+
+        model = vad.get_vad("energy")
+        self.assertIs(model, vad.get_vad("energy"))
+        for block_seconds in [600, 1]:
+            speeches = model(audio, block_seconds * sr)
+            self.assertEqual(len(speeches), 2)
+            for s, start in zip(speeches, [2, 6]):
+                self.assertAlmostEqual(s["start"] / sr, start, delta=0.05)
+                # plus the hangover
+                self.assertAlmostEqual(s["end"] / sr, start + 1.3, delta=0.05)
+
+        self.assertEqual(model(np.zeros(0, dtype=np.float32), sr), [])
+
+    def test_overlap_silero(self):
+        audio = utils.load_audio(os.path.join(TEST_MEDIA_PATH, "test001.mp4"))
+        masks = []
+        for backend in ["silero", "energy"]:
+            m = np.zeros(len(audio), dtype=bool)
+            for s in vad.get_vad(backend)(audio, len(audio)):
+                m[s["start"] : s["end"]] = True
+            masks.append(m)
+        iou = np.count_nonzero(masks[0] & masks[1]) / np.count_nonzero(
+            masks[0] | masks[1]
+        )
+        self.assertGreater(iou, 0.7)
@@ -0,0 +1,149 @@
+import collections
+import dataclasses
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from autocut.registry import ModelRegistry
+from autocut.whisper_model import FasterWhisperModel, WhisperModel, _shift_segment
+
+# The Segment of faster-whisper before 1.0
+Segment = collections.namedtuple("Segment", ["start", "end", "text"])
+
+
+class FakeModel:
+    def __init__(self, options):
+        self.options = options
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class TestModelRegistry(unittest.TestCase):
+    def test_get(self):
+        registry = ModelRegistry()
+        loads = []
+
+        def load(options):
+            loads.append(options)
+            return FakeModel(options)
+
+        a = registry.get("a", {"x": 1}, lambda: load({"x": 1}))
+        self.assertIs(a, registry.get("a", {"x": 1}, lambda: load({"x": 1})))
+        b = registry.get("b", {"x": 1}, lambda: load({"x": 1}))
+        self.assertIsNot(a, b)
+        self.assertEqual(len(loads), 2)
+
+        # a new configuration reloads the model
+        a2 = registry.get("a", {"x": 2}, lambda: load({"x": 2}))
+        self.assertIsNot(a, a2)
+        self.assertTrue(a.closed)
+        self.assertEqual(len(loads), 3)
+
+        registry.clear()
+        self.assertTrue(a2.closed and b.closed)
+
+
+class TestPack(unittest.TestCase):
+    def test_gen_srt(self):
+        # Speeches 0.5 to 4 sec long, 0.1 to 6 sec apart
+        rng = np.random.RandomState(0)
+        bounds = np.cumsum(rng.randint(1600, 6 * 16000, 200))
+        speeches = [{"start": int(s), "end": int(e)} for s, e in bounds.reshape(-1, 2)]
+
+        model = WhisperModel()
+        windows = model._pack(speeches)
+        self.assertLess(len(windows), len(speeches))
+        for w in windows:
+            self.assertLessEqual(w["end"] - w["start"], 30 * 16000)
+            inside = [s for s in speeches if w["start"] <= s["start"] < w["end"]]
+            for a, b in zip(inside, inside[1:]):
+                self.assertLessEqual(b["start"] - a["end"], 2 * 16000)
+
+        # whisper returns the timestamps relative to the window start
+        results = [
+            {
+                "origin_timestamp": w,
+                "segments": [
+                    {
+                        "start": (s["start"] - w["start"]) / 16000,
+                        "end": (s["end"] - w["start"]) / 16000,
+                        "text": "x",
+                    }
+                    for s in speeches
+                    if w["start"] <= s["start"] < w["end"]
+                ],
+            }
+            for w in windows
+        ]
+        subs = [s for s in model.gen_srt(results) if s.content == "x"]
+        self.assertEqual(len(subs), len(speeches))
+        for sub, s in zip(subs, speeches):
+            self.assertAlmostEqual(sub.start.total_seconds(), s["start"] / 16000, 5)
+            self.assertAlmostEqual(sub.end.total_seconds(), s["end"] / 16000, 5)
+
+
+class TestFasterBatch(unittest.TestCase):
+    def test_transcribe(self):
+        model = FasterWhisperModel()
+        model.batch_size = 2
+        model.batched_model = mock.Mock()
+
+        def transcribe(audio, clip_timestamps, **kwargs):
+            # A segment in the middle of each clip, in the concatenated audio
+            self.assertEqual(len(audio), clip_timestamps[-1]["end"] * 16000)
+            segments = [
+                Segment(c["start"] + 0.5, c["end"] - 0.5, str(i))
+                for i, c in enumerate(clip_timestamps)
+            ]
+            return iter(segments), None
+
+        model.batched_model.transcribe.side_effect = transcribe
+        # A 70 sec speech is split into 30 sec windows
+        speeches = [
+            {"start": 16000, "end": 71 * 16000},
+            {"start": 80 * 16000, "end": 84 * 16000},
+            {"start": 85 * 16000, "end": 90 * 16000},
+        ]
+        audio = np.zeros(100 * 16000, dtype=np.float32)
+        res = model.transcribe(audio, speeches, "zh", "")
+
+        windows = [(1, 31), (31, 61), (61, 71), (80, 90)]
+        self.assertEqual(model.batched_model.transcribe.call_count, 2)
+        self.assertEqual(
+            [
+                (r["origin_timestamp"]["start"], r["origin_timestamp"]["end"])
+                for r in res
+            ],
+            [(s * 16000, e * 16000) for s, e in windows],
+        )
+        for r, (start, end) in zip(res, windows):
+            self.assertEqual(len(r["segments"]), 1)
+            seg = r["segments"][0]
+            self.assertAlmostEqual(seg.start, 0.5)
+            self.assertAlmostEqual(seg.end, end - start - 0.5)
+
+        subs = model.gen_srt(res)
+        self.assertEqual(
+            [
+                (s.start.total_seconds(), s.end.total_seconds())
+                for s in subs
+                if s.content != "< No Speech >"
+            ],
+            [(start + 0.5, end - 0.5) for start, end in windows],
+        )
+
+    def test_shift_segment(self):
+        @dataclasses.dataclass
+        class DataSegment:
+            start: float
+            end: float
+            text: str
+
+        for segment in [Segment(1.0, 2.0, "x"), DataSegment(1.0, 2.0, "x")]:
+            shifted = _shift_segment(segment, -0.5)
+            self.assertEqual((shifted.start, shifted.end), (0.5, 1.5))
+            self.assertEqual(shifted.text, "x")
+            self.assertEqual(segment.start, 1.0)